@@ -34,8 +34,38 @@ options:
     required: true
     default: null
     aliases: []
+  offset:
+    description:
+      - Byte offset in the file to start reading at.
+    required: false
+    default: 0
+    version_added: "2.1"
+  length:
+    description:
+      - Maximum number of bytes to read, starting at I(offset). By default the
+        file is read up to its end.
+    required: false
+    default: null
+    version_added: "2.1"
+  tail_bytes:
+    description:
+      - Only read the last I(tail_bytes) bytes of the file. Mutually exclusive
+        with I(offset) and I(length).
+    required: false
+    default: null
+    version_added: "2.1"
+  compress:
+    description:
+      - Compress the data before it is base64-encoded. The returned C(content)
+        then has to be base64-decoded and decompressed by the caller.
+    required: false
+    choices: [ "none", "gzip", "zlib" ]
+    default: "none"
+    version_added: "2.1"
 notes:
    - "See also: M(fetch)"
+   - The file is read, compressed and encoded in blocks, so only the encoded
+     result has to fit in memory on the remote node.
 requirements: []
 author: 
     - "Ansible Core Team"
@@ -48,27 +78,127 @@ ansible host -m slurp -a 'src=/tmp/xx'
       "content": "aGVsbG8gQW5zaWJsZSB3b3JsZAo=", 
       "encoding": "base64"
    }
+
+# fetch the first 4096 bytes of a core dump
+- slurp: src=/var/crash/core.1234 length=4096
+  register: core_header
+
+# fetch the last megabyte of a log file, gzip compressed
+- slurp: src=/var/log/messages tail_bytes=1048576 compress=gzip
+  register: messages
 '''
 
 import base64
+import tempfile
+import zlib
+
+# read size, a multiple of 3 so each block encodes to base64 without padding
+BLOCK_SIZE = 3 * 64 * 1024
+
+def read_blocks(f, length):
+    """
+    Yield the data of f in blocks, up to length bytes (or up to its end
+    when length is None)
+    """
+    while length is None or length > 0:
+        if length is None:
+            block = f.read(BLOCK_SIZE)
+        else:
+            block = f.read(min(BLOCK_SIZE, length))
+            length -= len(block)
+        if not block:
+            break
+        yield block
+
+def compressed_blocks(blocks, compress):
+    if compress == 'gzip':
+        # a wbits offset of 16 makes zlib write a gzip header and trailer
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zlib.compressobj()
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def base64_encode_blocks(blocks):
+    """
+    base64 encode a stream of blocks, keeping at most one block of raw
+    data in memory. Leftover bytes are carried over to the next block so
+    that only the last piece of the output contains padding.
+
+    The encoded pieces are spooled to a temporary file and read back in
+    one go, so the encoded result is only ever in memory once: joining
+    them, or taking the value of a StringIO, would copy it while the
+    pieces are still alive.
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+        pending = ''
+        for block in blocks:
+            pending += block
+            cut = len(pending) - len(pending) % 3
+            if cut:
+                spool.write(base64.b64encode(pending[:cut]))
+                pending = pending[cut:]
+        if pending:
+            spool.write(base64.b64encode(pending))
+        spool.seek(0)
+        return spool.read()
+    finally:
+        spool.close()
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
             src = dict(required=True, aliases=['path'], type='path'),
+            offset = dict(default=None, type='int'),
+            length = dict(default=None, type='int'),
+            tail_bytes = dict(default=None, type='int'),
+            compress = dict(default='none', choices=['none', 'gzip', 'zlib']),
         ),
+        mutually_exclusive=[['tail_bytes', 'offset'], ['tail_bytes', 'length']],
         supports_check_mode=True
     )
     source = module.params['src']
+    offset = module.params['offset']
+    length = module.params['length']
+    tail_bytes = module.params['tail_bytes']
+    compress = module.params['compress']
+    if offset is None:
+        offset = 0
 
     if not os.path.exists(source):
         module.fail_json(msg="file not found: %s" % source)
     if not os.access(source, os.R_OK):
         module.fail_json(msg="file is not readable: %s" % source)
+    for name in ('offset', 'length', 'tail_bytes'):
+        if module.params[name] is not None and module.params[name] < 0:
+            module.fail_json(msg="%s must not be negative" % name)
+
+    f = open(source, 'rb')
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if tail_bytes is not None:
+            offset = max(0, size - tail_bytes)
+        if offset:
+            f.seek(offset)
 
-    data = base64.b64encode(open(source, 'rb').read())
+        blocks = read_blocks(f, length)
+        if compress != 'none':
+            blocks = compressed_blocks(blocks, compress)
+        data = base64_encode_blocks(blocks)
+        end = f.tell()
+    finally:
+        f.close()
 
-    module.exit_json(content=data, source=source, encoding='base64')
+    result = dict(content=data, source=source, encoding='base64')
+    if offset or length is not None or tail_bytes is not None:
+        result.update(offset=offset, length=max(0, end - offset), size=size)
+    if compress != 'none':
+        result['compression'] = compress
+    module.exit_json(**result)
 
 # import module snippets
 from ansible.module_utils.basic import *
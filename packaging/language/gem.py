@@ -30,6 +30,9 @@ options:
   name:
     description:
       - The name of the gem to be managed.
+      - As of 2.1, this can be a list of gems, looked up with a single local
+        (and for C(latest), a single remote) query and installed or
+        uninstalled with a single gem command.
     required: true
   state:
     description:
@@ -66,6 +69,7 @@ options:
   version:
     description:
       - Version of the gem to be installed/removed.
+      - Only allowed together with a single I(name).
     required: false
   pre_release:
     description:
@@ -96,12 +100,18 @@ EXAMPLES = '''
 # Installs latest available version of rake.
 - gem: name=rake state=latest
 
+# Installs the latest versions of rake and bundler.
+- gem: name=rake,bundler state=latest
+
 # Installs rake version 1.0 from a local gem on disk.
 - gem: name=rake gem_source=/path/to/gems/rake-1.0.gem state=present
 '''
 
 import re
 
+# version of rubygems, by gem command, asked once per run
+_rubygems_version = {}
+
 def get_rubygems_path(module):
     if module.params['executable']:
         return module.params['executable'].split(' ')
@@ -109,17 +119,24 @@ def get_rubygems_path(module):
         return [ module.get_bin_path('gem', True) ]
 
 def get_rubygems_version(module):
+    key = tuple(get_rubygems_path(module))
+    if key in _rubygems_version:
+        return _rubygems_version[key]
+
     cmd = get_rubygems_path(module) + [ '--version' ]
     (rc, out, err) = module.run_command(cmd, check_rc=True)
 
     match = re.match(r'^(\d+)\.(\d+)\.(\d+)', out)
     if not match:
-        return None
-
-    return tuple(int(x) for x in match.groups())
+        _rubygems_version[key] = None
+    else:
+        _rubygems_version[key] = tuple(int(x) for x in match.groups())
+    return _rubygems_version[key]
 
 def get_installed_versions(module, remote=False):
+    ''' versions of each of the named gems, installed or in the repository '''
 
+    names = module.params['name']
     cmd = get_rubygems_path(module)
     cmd.append('query')
     if remote:
@@ -127,33 +144,46 @@ def get_installed_versions(module, remote=False):
         if module.params['repository']:
             cmd.extend([ '--source', module.params['repository'] ])
     cmd.append('-n')
-    cmd.append('^%s$' % module.params['name'])
+    # all the gems in one query
+    cmd.append('^(%s)$' % '|'.join([ re.sub(r'([.+*?()\[\]{}|^$\\])', r'\\\1', name) for name in names ]))
     (rc, out, err) = module.run_command(cmd, check_rc=True)
-    installed_versions = []
+    installed_versions = dict((name, []) for name in names)
     for line in out.splitlines():
-        match = re.match(r"\S+\s+\((.+)\)", line)
-        if match:
-            versions = match.group(1)
+        match = re.match(r"(\S+)\s+\((.+)\)", line)
+        if match and match.group(1) in installed_versions:
+            versions = match.group(2)
             for version in versions.split(', '):
-                installed_versions.append(version.split()[0])
+                version = version.replace('default: ', '')
+                installed_versions[match.group(1)].append(version.split()[0])
     return installed_versions
 
-def exists(module):
+def get_pending(module):
+    '''
+    The (name, version) of the named gems which need installing, or for
+    state=absent uninstalling, version being None for any version.
+    '''
 
-    if module.params['state'] == 'latest':
-        remoteversions = get_installed_versions(module, remote=True)
-        if remoteversions:
-            module.params['version'] = remoteversions[0]
+    state = module.params['state']
+    if state == 'latest':
+        remote_versions = get_installed_versions(module, remote=True)
     installed_versions = get_installed_versions(module)
-    if module.params['version']:
-        if module.params['version'] in installed_versions:
-            return True
-    else:
-        if installed_versions:
-            return True
-    return False
+    pending = []
+    for name in module.params['name']:
+        version = module.params['version']
+        if state == 'latest' and remote_versions[name]:
+            version = remote_versions[name][0]
+            if len(module.params['name']) == 1:
+                # reported back as the version, as it always has been
+                module.params['version'] = version
+        if version:
+            exists = version in installed_versions[name]
+        else:
+            exists = len(installed_versions[name]) > 0
+        if exists == (state == 'absent'):
+            pending.append((name, version))
+    return pending
 
-def uninstall(module):
+def uninstall(module, gems):
 
     if module.check_mode:
         return
@@ -164,10 +194,10 @@ def uninstall(module):
     else:
         cmd.append('--all')
         cmd.append('--executable')
-    cmd.append(module.params['name'])
+    cmd.extend([ name for (name, version) in gems ])
     module.run_command(cmd, check_rc=True)
 
-def install(module):
+def install(module, gems):
 
     if module.check_mode:
         return
@@ -180,8 +210,9 @@ def install(module):
 
     cmd = get_rubygems_path(module)
     cmd.append('install')
-    if module.params['version']:
-        cmd.extend([ '--version', module.params['version'] ])
+    if len(gems) == 1 and gems[0][1]:
+        # several gems get their latest versions without --version
+        cmd.extend([ '--version', gems[0][1] ])
     if module.params['repository']:
         cmd.extend([ '--source', module.params['repository'] ])
     if not module.params['include_dependencies']:
@@ -201,7 +232,10 @@ def install(module):
             cmd.append('--no-ri')
         else:
             cmd.append('--no-document')
-    cmd.append(module.params['gem_source'])
+    if module.params['gem_source']:
+        cmd.append(module.params['gem_source'])
+    else:
+        cmd.extend([ name for (name, version) in gems ])
     if module.params['build_flags']:
         cmd.extend([ '--', module.params['build_flags'] ])
     module.run_command(cmd, check_rc=True)
@@ -213,7 +247,7 @@ def main():
             executable           = dict(required=False, type='str'),
             gem_source           = dict(required=False, type='str'),
             include_dependencies = dict(required=False, default=True, type='bool'),
-            name                 = dict(required=True, type='str'),
+            name                 = dict(required=True, type='list'),
             repository           = dict(required=False, aliases=['source'], type='str'),
             state                = dict(required=False, default='present', choices=['present','absent','latest'], type='str'),
             user_install         = dict(required=False, default=True, type='bool'),
@@ -231,22 +265,27 @@ def main():
     if module.params['gem_source'] and module.params['state'] == 'latest':
         module.fail_json(msg="Cannot maintain state=latest when installing from local source")
 
-    if not module.params['gem_source']:
-        module.params['gem_source'] = module.params['name']
+    if len(module.params['name']) > 1:
+        if module.params['version']:
+            module.fail_json(msg="Cannot specify version with a list of gems")
+        if module.params['gem_source']:
+            module.fail_json(msg="Cannot install a list of gems from a local source")
 
     changed = False
 
-    if module.params['state'] in [ 'present', 'latest']:
-        if not exists(module):
-            install(module)
-            changed = True
-    elif module.params['state'] == 'absent':
-        if exists(module):
-            uninstall(module)
-            changed = True
+    pending = get_pending(module)
+    if pending:
+        if module.params['state'] in [ 'present', 'latest']:
+            install(module, pending)
+        else:
+            uninstall(module, pending)
+        changed = True
 
     result = {}
-    result['name'] = module.params['name']
+    if len(module.params['name']) == 1:
+        result['name'] = module.params['name'][0]
+    else:
+        result['name'] = module.params['name']
     result['state'] = module.params['state']
     if module.params['version']:
         result['version'] = module.params['version']
@@ -23,6 +23,15 @@ import tempfile
 import re
 import os
 import sys
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    from hashlib import sha1 as _sha1
+except ImportError:
+    # python 2.4, like module_utils.basic does
+    from sha import sha as _sha1
 
 DOCUMENTATION = '''
 ---
@@ -36,11 +45,15 @@ options:
   name:
     description:
       - The name of a Python library to install or the url of the remote package.
+      - As of 2.1, this can be a list of names, installed or removed with a
+        single pip command. The commas of a version specifier, as in
+        C(Django>=1.8,<1.9), do not separate names.
     required: false
     default: null
   version:
     description:
       - The version number to install of the Python library specified in the I(name) parameter
+      - Only allowed together with a single I(name).
     required: false
     default: null
   requirements:
@@ -117,6 +130,20 @@ options:
     version_added: "1.3"
     required: false
     default: null
+  requirements_fingerprint:
+    description:
+      - If C(yes), record in the I(virtualenv) a fingerprint of the
+        I(requirements) file (and the files it includes with C(-r) or C(-c)),
+        the I(extra_args) and the installed distributions after installing
+        them. Later runs with the same fingerprint return without running
+        pip at all.
+      - Only used with I(virtualenv), I(requirements) and C(state=present).
+        Requirements which are not pinned are not upgraded while nothing
+        else changes.
+    version_added: "2.1"
+    required: false
+    default: "no"
+    choices: [ "yes", "no" ]
   umask:
     description:
       - The system umask to apply before installing the pip package. This is
@@ -129,6 +156,11 @@ options:
     default: null
 
 notes:
+   - When I(state) is C(present) or C(absent), I(name) only lists plain
+     package names (optionally with an exact C(==) version) and no
+     I(extra_args) are given, the module reads the metadata of the
+     installed distributions to decide whether anything needs to be done,
+     and does not run pip at all when nothing does.
    - Please note that virtualenv (U(http://www.virtualenv.org/)) must be installed on the remote host if the virtualenv parameter is specified and the virtualenv needs to be initialized.
 requirements: [ "virtualenv", "pip" ]
 author: "Matt Wright (@mattupstate)"
@@ -138,6 +170,9 @@ EXAMPLES = '''
 # Install (Bottle) python package.
 - pip: name=bottle
 
+# Install (Bottle) and (Jinja2) python packages, with a single pip command.
+- pip: name=bottle,jinja2
+
 # Install (Bottle) python package on version 0.11.
 - pip: name=bottle version=0.11
 
@@ -165,6 +200,10 @@ EXAMPLES = '''
 # Install specified python requirements in indicated (virtualenv).
 - pip: requirements=/my_app/requirements.txt virtualenv=/my_app/venv
 
+# Install specified python requirements in indicated (virtualenv), only
+# running pip when the requirements or the virtualenv have changed.
+- pip: requirements=/my_app/requirements.txt virtualenv=/my_app/venv requirements_fingerprint=yes
+
 # Install specified python requirements and custom Index URL.
 - pip: requirements=/my_app/requirements.txt extra_args='-i https://example.com/pypi/simple'
 
@@ -190,6 +229,19 @@ def _get_cmd_options(module, cmd):
     return cmd_options
 
 
+def _split_names(names):
+    '''
+    Undo the splitting of a name string on the commas of its version
+    specifier, e.g. "Django>=1.8,<1.9", which is a single requirement.
+    '''
+    requirements = []
+    for name in names:
+        if requirements and re.match(r'^\s*[<>=!~]', name):
+            requirements[-1] += ',' + name.strip()
+        else:
+            requirements.append(name.strip())
+    return requirements
+
 def _get_full_name(name, version=None):
     if version is None:
         resp = name
@@ -197,6 +249,182 @@ def _get_full_name(name, version=None):
         resp = name + '==' + version
     return resp
 
+def _canonical_name(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def _read_metadata(path):
+    '''Name and Version headers of a METADATA or PKG-INFO file.'''
+    name = None
+    version = None
+    try:
+        f = open(path)
+    except IOError:
+        return (None, None)
+    try:
+        for line in f:
+            if not line.strip():
+                # the headers end at the first blank line
+                break
+            if line.startswith('Name:'):
+                name = line[len('Name:'):].strip()
+            elif line.startswith('Version:'):
+                version = line[len('Version:'):].strip()
+            if name and version:
+                break
+    finally:
+        f.close()
+    return (name, version)
+
+def _get_python_path(module, pip):
+    '''
+    The sys.path of the interpreter pip runs with, found from its #! line,
+    or None if it cannot be told without running pip itself.
+    '''
+    try:
+        f = open(pip)
+        try:
+            first = f.readline()
+        finally:
+            f.close()
+    except IOError:
+        return None
+    interpreter = first[2:].split()
+    if not first.startswith('#!') or not interpreter or \
+       not re.match(r'(python|pypy)', os.path.basename(interpreter[-1])):
+        return None
+    cmd = interpreter + ['-c', 'import sys; print("\\n".join(sys.path))']
+    rc, out, err = module.run_command(cmd)
+    if rc != 0:
+        return None
+    return [ path for path in out.splitlines() if path ]
+
+def _get_installed(python_path):
+    '''
+    Index of the distributions installed along python_path, canonical
+    name to version, read from their dist-info and egg-info metadata. As
+    on import, the first one found wins. None if some of them can not be
+    read without pip.
+    '''
+    installed = {}
+    for path in python_path:
+        metadata = []
+        if path.endswith('.egg'):
+            if not os.path.isdir(path):
+                # zipped eggs
+                return None
+            metadata.append(os.path.join(path, 'EGG-INFO', 'PKG-INFO'))
+        elif os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                full = os.path.join(path, entry)
+                if entry.endswith('.dist-info'):
+                    metadata.append(os.path.join(full, 'METADATA'))
+                elif entry.endswith('.egg-info'):
+                    if os.path.isdir(full):
+                        metadata.append(os.path.join(full, 'PKG-INFO'))
+                    else:
+                        metadata.append(full)
+        for filename in metadata:
+            (name, version) = _read_metadata(filename)
+            if name and version:
+                installed.setdefault(_canonical_name(name), version)
+    return installed
+
+def _is_installed(name, version, installed):
+    '''
+    Whether name, or name at version, is in the installed index. None
+    if name is more than a plain requirement the index can answer for.
+    '''
+    if '==' in name and version is None:
+        (name, version) = name.split('==', 1)
+    if not re.match(r'^[A-Za-z0-9][A-Za-z0-9._-]*$', name.strip()):
+        return None
+    if version is not None and not re.match(r'^[A-Za-z0-9.+!_-]+$', version.strip()):
+        return None
+    installed_version = installed.get(_canonical_name(name.strip()))
+    if installed_version is None:
+        return False
+    return version is None or version.strip() == installed_version
+
+def _get_requirements_files(path, seen=None):
+    '''path and the requirements and constraints files it includes.'''
+    if seen is None:
+        seen = []
+    if path in seen:
+        return seen
+    seen.append(path)
+    f = open(path)
+    try:
+        for line in f:
+            m = re.match(r'^\s*(-r|--requirement|-c|--constraint)\s*=?\s*(\S+)', line)
+            if m and not re.match(r'^[a-z+]+://', m.group(2)):
+                _get_requirements_files(os.path.join(os.path.dirname(path), m.group(2)), seen)
+    finally:
+        f.close()
+    return seen
+
+def _get_requirements_fingerprint(module, pip, requirements, extra_args):
+    '''
+    Hash of the requirements files, the extra_args and the listing of the
+    installed distributions, or None if it cannot be computed.
+    '''
+    python_path = _get_python_path(module, pip)
+    if python_path is None:
+        return None
+    digest = _sha1()
+    digest.update('extra_args %s\n' % (extra_args or ''))
+    try:
+        for filename in _get_requirements_files(requirements):
+            f = open(filename, 'rb')
+            try:
+                digest.update('file %s\n' % filename)
+                digest.update(f.read())
+            finally:
+                f.close()
+    except IOError:
+        return None
+    for path in python_path:
+        if not os.path.isdir(path):
+            continue
+        digest.update('path %s\n' % path)
+        for entry in sorted(os.listdir(path)):
+            if entry.endswith('.dist-info') or entry.endswith('.egg-info') or \
+                    entry.endswith('.egg-link') or entry.endswith('.pth'):
+                mtime = os.stat(os.path.join(path, entry)).st_mtime
+                digest.update('%s %s\n' % (entry, mtime))
+    return digest.hexdigest()
+
+def _get_fingerprint_file(env):
+    return os.path.join(env, '.ansible_pip_fingerprints')
+
+def _read_fingerprints(env):
+    '''The recorded fingerprints of env, by requirements file.'''
+    try:
+        f = open(_get_fingerprint_file(env))
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+def _write_fingerprint(module, env, requirements, fingerprint):
+    fingerprints = _read_fingerprints(env)
+    if fingerprint is None:
+        fingerprints.pop(requirements, None)
+    else:
+        fingerprints[requirements] = fingerprint
+    fd, tmp = tempfile.mkstemp(dir=env, prefix='.ansible_pip')
+    try:
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(fingerprints, f)
+        finally:
+            f.close()
+        os.rename(tmp, _get_fingerprint_file(env))
+    except (IOError, OSError), e:
+        os.unlink(tmp)
+        module.fail_json(msg="Failed to record the requirements fingerprint: %s" % e)
+
 def _is_present(name, version, installed_pkgs):
     for pkg in installed_pkgs:
         if '==' not in pkg:
@@ -264,7 +492,7 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             state=dict(default='present', choices=state_map.keys()),
-            name=dict(default=None, required=False),
+            name=dict(default=None, required=False, type='list'),
             version=dict(default=None, required=False, type='str'),
             requirements=dict(default=None, required=False),
             virtualenv=dict(default=None, required=False),
@@ -277,6 +505,7 @@ def main():
             chdir=dict(default=None, required=False, type='path'),
             executable=dict(default=None, required=False),
             umask=dict(required=False,default=None),
+            requirements_fingerprint=dict(default='no', type='bool'),
         ),
         required_one_of=[['name', 'requirements']],
         mutually_exclusive=[['name', 'requirements'], ['executable', 'virtualenv']],
@@ -285,6 +514,8 @@ def main():
 
     state = module.params['state']
     name = module.params['name']
+    if name:
+        name = _split_names(name)
     version = module.params['version']
     requirements = module.params['requirements']
     extra_args = module.params['extra_args']
@@ -307,6 +538,14 @@ def main():
         if state == 'latest' and version is not None:
             module.fail_json(msg='version is incompatible with state=latest')
 
+        if name and len(name) > 1 and version is not None:
+            module.fail_json(msg='version is incompatible with a list of names')
+
+        # a single name is reported back as it was given
+        name_result = name
+        if name and len(name) == 1:
+            name_result = name[0]
+
         if chdir is None:
             # this is done to avoid permissions issues with privilege escalation and virtualenvs
             chdir =  tempfile.gettempdir()
@@ -360,7 +599,7 @@ def main():
 
         # Automatically apply -e option to extra_args when source is a VCS url. VCS
         # includes those beginning with svn+, git+, hg+ or bzr+
-        has_vcs = bool(name and re.match(r'(svn|git|hg|bzr)\+', name))
+        has_vcs = bool(name and [ pkg for pkg in name if re.match(r'(svn|git|hg|bzr)\+', pkg) ])
         if has_vcs and module.params['editable']:
             args_list = []  # used if extra_args is not used at all
             if extra_args:
@@ -373,10 +612,42 @@ def main():
         if extra_args:
             cmd += ' %s' % extra_args
         if name:
-            cmd += ' %s' % _get_full_name(name, version)
+            for pkg in name:
+                cmd += ' %s' % _get_full_name(pkg, version)
         elif requirements:
             cmd += ' -r %s' % requirements
 
+        # Whether each of the names is installed, read from the metadata of
+        # the installed distributions rather than from pip, when that can
+        # tell. Anything more than plain names is left to pip.
+        is_installed = None
+        if name and not has_vcs and not extra_args and state in ('present', 'absent'):
+            python_path = _get_python_path(module, pip)
+            if python_path is not None:
+                installed = _get_installed(python_path)
+                if installed is not None:
+                    is_installed = [ _is_installed(pkg, version, installed) for pkg in name ]
+                    if None in is_installed:
+                        is_installed = None
+
+        if is_installed is not None:
+            changed = (state == 'present' and False in is_installed) or \
+                      (state == 'absent' and True in is_installed)
+            if module.check_mode or not changed:
+                module.exit_json(changed=changed, cmd=cmd, name=name_result, version=version,
+                                 state=state, requirements=requirements, virtualenv=env,
+                                 stdout=out, stderr=err)
+
+        # Whether the requirements, the extra_args or the distributions in
+        # the virtualenv have changed since they were last installed
+        fingerprint = None
+        if requirements and env and state == 'present' and module.params['requirements_fingerprint']:
+            requirements_path = os.path.abspath(os.path.join(chdir, requirements))
+            fingerprint = _get_requirements_fingerprint(module, pip, requirements_path, extra_args)
+            if fingerprint is not None and _read_fingerprints(env).get(requirements_path) == fingerprint:
+                module.exit_json(changed=False, cmd=cmd, name=name_result, version=version,
+                                 state=state, requirements=requirements, virtualenv=env,
+                                 stdout=out, stderr=err)
 
         if module.check_mode:
             if extra_args or requirements or state == 'latest' or not name:
@@ -394,9 +665,9 @@ def main():
             out += out_pip
             err += err_pip
 
-            is_present = _is_present(name, version, out.split())
+            is_present = [ _is_present(pkg, version, out.split()) for pkg in name ]
 
-            changed = (state == 'present' and not is_present) or (state == 'absent' and is_present)
+            changed = (state == 'present' and False in is_present) or (state == 'absent' and True in is_present)
             module.exit_json(changed=changed, cmd=freeze_cmd, stdout=out, stderr=err)
 
         if requirements or has_vcs:
@@ -426,7 +697,12 @@ def main():
                     out_freeze_after = module.run_command(freeze_cmd, cwd=chdir)[1]
                     changed = out_freeze_before != out_freeze_after
 
-        module.exit_json(changed=changed, cmd=cmd, name=name, version=version,
+        if fingerprint is not None:
+            # what is installed now is what the next run compares against
+            fingerprint = _get_requirements_fingerprint(module, pip, requirements_path, extra_args)
+            _write_fingerprint(module, env, requirements_path, fingerprint)
+
+        module.exit_json(changed=changed, cmd=cmd, name=name_result, version=version,
                          state=state, requirements=requirements, virtualenv=env,
                          stdout=out, stderr=err)
     finally:
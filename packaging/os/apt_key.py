@@ -70,6 +70,34 @@ options:
         default: present
         description:
             - used to specify if key is being added or revoked
+    ids:
+        required: false
+        default: none
+        version_added: "2.1"
+        description:
+            - List of key identifiers, instead of a single I(id). The keyring
+              is listed once for all of them, and the missing ones are
+              imported with a single command, from the I(keyserver), I(urls),
+              I(file) or I(data).
+    urls:
+        required: false
+        default: none
+        version_added: "2.1"
+        description:
+            - List of urls to retrieve keys from, instead of a single I(url).
+              Their keys are added with a single C(apt-key add).
+            - When I(ids) lists the id of the key of each of the urls, in the
+              same order, only the urls of the missing keys are downloaded.
+    url_cache_dir:
+        required: false
+        default: none
+        version_added: "2.1"
+        description:
+            - Directory in which to keep the keys downloaded from urls along
+              with their C(ETag) and C(Last-Modified) headers, so that later
+              runs only download keys which changed on the server. Entries
+              are ignored unless the directory and their files belong to the
+              user running the module and are not writable by anybody else.
     validate_certs:
         description:
             - If C(no), SSL certificates for the target url will not be validated. This should only be used
@@ -99,6 +127,14 @@ EXAMPLES = '''
 # Add a key from a file on the Ansible server
 - apt_key: data="{{ lookup('file', 'apt.gpg') }}" state=present
 
+# Add several Apt signing keys from their urls, keeping them in a local cache
+- apt_key:
+    ids: [ 473041FA, 46925553 ]
+    urls:
+      - https://ftp-master.debian.org/keys/archive-key-6.0.asc
+      - https://ftp-master.debian.org/keys/archive-key-7.0.asc
+    url_cache_dir: /var/cache/ansible/apt_key
+
 # Add an Apt signing key to a specific keyring file
 - apt_key: id=473041FA url=https://ftp-master.debian.org/keys/archive-key-6.0.asc keyring=/etc/apt/trusted.gpg.d/debian.gpg state=present
 '''
@@ -112,11 +148,21 @@ from distutils.spawn import find_executable
 from os import environ
 from sys import exc_info
 import traceback
+import os
+import tempfile
+try:
+    from hashlib import sha1 as _sha1
+except ImportError:
+    # python 2.4, like module_utils.basic does
+    from sha import sha as _sha1
 
 match_key = re_compile("^gpg:.*key ([0-9a-fA-F]+):.*$")
 
 REQUIRED_EXECUTABLES=['gpg', 'grep', 'apt-key']
 
+# keys downloaded during this run, by url
+_downloaded_keys = {}
+
 
 def check_missing_binaries(module):
     missing = [e for e in REQUIRED_EXECUTABLES if not find_executable(e)]
@@ -139,7 +185,8 @@ def all_keys(module, keyring, short_format):
             results.append(real_code)
     if short_format:
         results = shorten_key_ids(results)
-    return results
+    # an index rather than a list, as every key managed is looked up in it
+    return set(results)
 
 def shorten_key_ids(key_id_list):
     """
@@ -151,26 +198,123 @@ def shorten_key_ids(key_id_list):
         short.append(key[-8:])
     return short
 
-def download_key(module, url):
+def url_cache_file(cache_dir, url):
+    """ The path of the url cache entry of url in cache_dir """
+    return os.path.join(cache_dir, _sha1(url).hexdigest())
+
+def read_url_cache(cache_file):
+    """
+    Returns the metadata and the data of a url cache entry, or None. As the
+    data ends up trusted, an entry that anybody but us could have written,
+    through its directory or its files, is ignored.
+    """
+    try:
+        for path in (os.path.dirname(cache_file), cache_file + '.json', cache_file):
+            st = os.stat(path)
+            if st.st_uid != os.geteuid() or st.st_mode & 022:
+                return None
+        f = open(cache_file + '.json')
+        try:
+            meta = json.load(f)
+        finally:
+            f.close()
+        f = open(cache_file, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(meta, dict):
+        return None
+    return (meta, data)
+
+def write_url_cache(cache_file, meta, data):
+    """ Atomically writes a url cache entry, returns whether it could """
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0700)
+        for (path, content) in ((cache_file, data), (cache_file + '.json', json.dumps(meta))):
+            fd, tmp_path = tempfile.mkstemp('', '.tmp', cache_dir)
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, path)
+    except (IOError, OSError):
+        return False
+    return True
+
+def download_key(module, url, cache_dir=None):
+    """
+    Returns the key at url. A url is only downloaded once per run, and with
+    a cache_dir the key is kept there with its ETag and Last-Modified
+    headers, so that later runs revalidate it rather than download it.
+    """
     # FIXME: move get_url code to common, allow for in-memory D/L, support proxies
     # and reuse here
     if url is None:
         module.fail_json(msg="needed a URL but was not specified")
+    if url in _downloaded_keys:
+        return _downloaded_keys[url]
+
+    cached = None
+    cache_file = None
+    headers = {}
+    if cache_dir is not None:
+        cache_file = url_cache_file(cache_dir, url)
+        cached = read_url_cache(cache_file)
+        if cached is not None and cached[0].get('url') == url:
+            if cached[0].get('etag'):
+                headers['If-None-Match'] = cached[0]['etag']
+            if cached[0].get('last_modified'):
+                headers['If-Modified-Since'] = cached[0]['last_modified']
+        else:
+            cached = None
 
     try:
-        rsp, info = fetch_url(module, url)
-        if info['status'] != 200:
+        rsp, info = fetch_url(module, url, headers=headers)
+        if info['status'] == 304 and cached is not None:
+            data = cached[1]
+        elif info['status'] != 200:
             module.fail_json(msg="Failed to download key at %s: %s" % (url, info['msg']))
-
-        return rsp.read()
+        else:
+            data = rsp.read()
+            if cache_file is not None:
+                write_url_cache(cache_file, dict(url=url, etag=info.get('etag'),
+                    last_modified=info.get('last-modified')), data)
     except Exception:
         module.fail_json(msg="error getting key id from url: %s" % url, traceback=format_exc())
 
-def import_key(module, keyring, keyserver, key_id):
+    _downloaded_keys[url] = data
+    return data
+
+def download_keys(module, urls, cache_dir=None):
+    """
+    Returns the keys at urls as the fewest streams apt-key add can read:
+    one of the armored keys, each on its own lines, and one of the binary
+    keys, as gpg does not read armor after binary packets or the reverse
+    """
+    if not urls:
+        module.fail_json(msg="needed a URL but was not specified")
+    armored = []
+    binary = []
+    for url in urls:
+        key = download_key(module, url, cache_dir)
+        if key.lstrip().startswith('-----'):
+            if not key.endswith('\n'):
+                key += '\n'
+            armored.append(key)
+        else:
+            binary.append(key)
+    return [''.join(keys) for keys in (armored, binary) if keys]
+
+def import_key(module, keyring, keyserver, key_ids):
     if keyring:
-        cmd = "apt-key --keyring %s adv --keyserver %s --recv %s" % (keyring, keyserver, key_id)
+        cmd = "apt-key --keyring %s adv --keyserver %s --recv %s" % (keyring, keyserver, ' '.join(key_ids))
     else:
-        cmd = "apt-key adv --keyserver %s --recv %s" % (keyserver, key_id)
+        cmd = "apt-key adv --keyserver %s --recv %s" % (keyserver, ' '.join(key_ids))
     (rc, out, err) = module.run_command(cmd, check_rc=True)
     return True
 
@@ -202,7 +346,10 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             id=dict(required=False, default=None),
+            ids=dict(required=False, type='list'),
             url=dict(required=False),
+            urls=dict(required=False, type='list'),
+            url_cache_dir=dict(required=False, type='path'),
             data=dict(required=False),
             file=dict(required=False),
             key=dict(required=False),
@@ -211,11 +358,15 @@ def main():
             keyserver=dict(required=False),
             state=dict(required=False, choices=['present', 'absent'], default='present')
         ),
+        mutually_exclusive=[['id', 'ids'], ['url', 'urls']],
         supports_check_mode=True
     )
 
     key_id          = module.params['id']
+    key_ids         = module.params['ids']
     url             = module.params['url']
+    urls            = module.params['urls']
+    url_cache_dir   = module.params['url_cache_dir']
     data            = module.params['data']
     filename        = module.params['file']
     keyring         = module.params['keyring']
@@ -226,7 +377,18 @@ def main():
     # we use the "short" id: key_id[-8:], short_format=True
     # it's a workaround for https://bugs.launchpad.net/ubuntu/+source/apt/+bug/1481871
 
-    if key_id:
+    # a single id or url is handled as a list of one
+    if key_ids is None:
+        key_ids = []
+        if key_id:
+            key_ids.append(key_id)
+    if urls is None:
+        urls = []
+        if url:
+            urls.append(url)
+
+    normalized_ids = []
+    for key_id in key_ids:
         try:
             _ = int(key_id, 16)
             if key_id.startswith('0x'):
@@ -234,6 +396,8 @@ def main():
             key_id = key_id.upper()[-8:]
         except ValueError:
             module.fail_json(msg="Invalid key_id", id=key_id)
+        normalized_ids.append(key_id)
+    key_ids = normalized_ids
 
     # FIXME: I think we have a common facility for this, if not, want
     check_missing_binaries(module)
@@ -243,40 +407,46 @@ def main():
     return_values = {}
 
     if state == 'present':
-        if key_id and key_id in keys:
+        missing_ids = [k for k in key_ids if k not in keys]
+        if key_ids and not missing_ids:
             module.exit_json(changed=False)
         else:
+            streams = [data]
             if not filename and not data and not keyserver:
-                data = download_key(module, url)
-            if key_id and key_id in keys:
-                module.exit_json(changed=False)
+                if len(urls) == len(key_ids):
+                    # the urls of the keys already there are not needed
+                    urls = [u for (k, u) in zip(key_ids, urls) if k in missing_ids]
+                streams = download_keys(module, urls, url_cache_dir)
+            if module.check_mode:
+                module.exit_json(changed=True)
+            if filename:
+                add_key(module, filename, keyring)
+            elif keyserver:
+                import_key(module, keyring, keyserver, missing_ids)
             else:
-                if module.check_mode:
-                    module.exit_json(changed=True)
-                if filename:
-                    add_key(module, filename, keyring)
-                elif keyserver:
-                    import_key(module, keyring, keyserver, key_id)
-                else:
-                    add_key(module, "-", keyring, data)
-                changed=False
-                keys2 = all_keys(module, keyring, short_format)
-                if len(keys) != len(keys2):
-                    changed=True
-                if key_id and not key_id in keys2:
-                    module.fail_json(msg="key does not seem to have been added", id=key_id)
-                module.exit_json(changed=changed)
+                for stream in streams:
+                    add_key(module, "-", keyring, stream)
+            changed=False
+            keys2 = all_keys(module, keyring, short_format)
+            if len(keys) != len(keys2):
+                changed=True
+            not_added = [k for k in key_ids if k not in keys2]
+            if not_added:
+                module.fail_json(msg="key does not seem to have been added", id=', '.join(not_added))
+            module.exit_json(changed=changed)
     elif state == 'absent':
-        if not key_id:
+        if not key_ids:
             module.fail_json(msg="key is required")
-        if key_id in keys:
+        present_ids = [k for k in key_ids if k in keys]
+        if present_ids:
             if module.check_mode:
                 module.exit_json(changed=True)
-            if remove_key(module, key_id, keyring):
-                changed=True
-            else:
-                # FIXME: module.fail_json  or exit-json immediately at point of failure
-                module.fail_json(msg="error removing key_id", **return_values)
+            for key_id in present_ids:
+                if remove_key(module, key_id, keyring):
+                    changed=True
+                else:
+                    # FIXME: module.fail_json  or exit-json immediately at point of failure
+                    module.fail_json(msg="error removing key_id", **return_values)
 
     module.exit_json(changed=changed, **return_values)
 
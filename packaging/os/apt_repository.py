@@ -33,10 +33,11 @@ notes:
     - This module treats Debian and Ubuntu distributions separately. So PPA could be installed only on Ubuntu machines.
 options:
     repo:
-        required: true
+        required: false
         default: none
         description:
-            - A source string for the repository.
+            - A source string for the repository. Either I(repo) or I(repos)
+              is required.
     state:
         required: false
         choices: [ "absent", "present" ]
@@ -49,9 +50,21 @@ options:
         description:
             - The octal mode for newly created files in sources.list.d
         version_added: "1.6"
+    repos:
+        required: false
+        default: null
+        version_added: "2.1"
+        description:
+            - List of repositories to manage in one go, instead of a single
+              I(repo). Each entry is either a source string, or a dict with a
+              C(repo) and any of I(state) and I(filename). Options that are
+              not set in an entry default to the ones given to the module.
+            - The sources are read and saved once for all of them.
     update_cache:
         description:
             - Run the equivalent of C(apt-get update) when a change occurs.  Cache updates are run after making changes.
+            - As of 2.1, only the indexes of the added sources are
+              downloaded, rather than those of every source.
         required: false
         default: "yes"
         choices: [ "yes", "no" ]
@@ -88,6 +101,13 @@ apt_repository: repo='deb-src http://archive.canonical.com/ubuntu hardy partner'
 # Remove specified repository from sources list.
 apt_repository: repo='deb http://archive.canonical.com/ubuntu hardy partner' state=absent
 
+# Add several repositories, and remove one, with a single cache update.
+apt_repository:
+  repos:
+    - 'deb http://archive.canonical.com/ubuntu hardy partner'
+    - { repo: 'deb http://dl.google.com/linux/chrome/deb/ stable main', filename: 'google-chrome' }
+    - { repo: 'deb http://example.com/debian squeeze main', state: absent }
+
 # On Ubuntu target: add nginx stable repository from PPA and install its signing key.
 # On Debian target: adding PPA is not available, so it will fail immediately.
 apt_repository: repo='ppa:nginx/stable'
@@ -144,6 +164,10 @@ class SourcesList(object):
         self.files = {}  # group sources by file
         # Repositories that we're adding -- used to implement mode param
         self.new_repos = set()
+        # Files whose sources have changed, the only ones to save
+        self.dirty = set()
+        # Sources enabled or added, whose indexes are to be fetched
+        self.added_sources = []
         self.default_file = self._apt_cfg_file('Dir::Etc::sourcelist')
 
         # read sources.list if it exists
@@ -253,28 +277,35 @@ class SourcesList(object):
             group.append((n, valid, enabled, source, comment))
         self.files[file] = group
 
+    @staticmethod
+    def _render(sources):
+        lines = []
+        for n, valid, enabled, source, comment in sources:
+            chunks = []
+            if not enabled:
+                chunks.append('# ')
+            chunks.append(source)
+            if comment:
+                chunks.append(' # ')
+                chunks.append(comment)
+            chunks.append('\n')
+            lines.append(''.join(chunks))
+        return ''.join(lines)
+
     def save(self):
-        for filename, sources in self.files.items():
+        # files nothing was changed in are left alone
+        for filename in sorted(self.dirty):
+            sources = self.files.get(filename)
             if sources:
                 d, fn = os.path.split(filename)
                 fd, tmp_path = tempfile.mkstemp(prefix=".%s-" % fn, dir=d)
 
                 f = os.fdopen(fd, 'w')
-                for n, valid, enabled, source, comment in sources:
-                    chunks = []
-                    if not enabled:
-                        chunks.append('# ')
-                    chunks.append(source)
-                    if comment:
-                        chunks.append(' # ')
-                        chunks.append(comment)
-                    chunks.append('\n')
-                    line = ''.join(chunks)
-
-                    try:
-                        f.write(line)
-                    except IOError, err:
-                        self.module.fail_json(msg="Failed to write to file %s: %s" % (tmp_path, unicode(err)))
+                try:
+                    f.write(self._render(sources))
+                    f.close()
+                except IOError, err:
+                    self.module.fail_json(msg="Failed to write to file %s: %s" % (tmp_path, unicode(err)))
                 self.module.atomic_move(tmp_path, filename)
 
                 # allow the user to override the default mode
@@ -282,26 +313,16 @@ class SourcesList(object):
                     this_mode = self.module.params['mode']
                     self.module.set_mode_if_different(filename, this_mode, False)
             else:
-                del self.files[filename]
+                self.files.pop(filename, None)
                 if os.path.exists(filename):
                     os.remove(filename)
+        self.dirty.clear()
 
     def dump(self):
         dumpstruct = {}
         for filename, sources in self.files.items():
             if sources:
-                lines = []
-                for n, valid, enabled, source, comment in sources:
-                    chunks = []
-                    if not enabled:
-                        chunks.append('# ')
-                    chunks.append(source)
-                    if comment:
-                        chunks.append(' # ')
-                        chunks.append(comment)
-                    chunks.append('\n')
-                    lines.append(''.join(chunks))
-                dumpstruct[filename] = ''.join(lines)
+                dumpstruct[filename] = self._render(sources)
         return dumpstruct
 
     def _choice(self, new, old):
@@ -315,7 +336,10 @@ class SourcesList(object):
         If source, enabled, or comment is None, original value from line ``n`` will be preserved.
         '''
         valid, enabled_old, source_old, comment_old = self.files[file][n][1:]
-        self.files[file][n] = (n, valid, self._choice(enabled, enabled_old), self._choice(source, source_old), self._choice(comment, comment_old))
+        line = (n, valid, self._choice(enabled, enabled_old), self._choice(source, source_old), self._choice(comment, comment_old))
+        if line != self.files[file][n]:
+            self.files[file][n] = line
+            self.dirty.add(file)
 
     def _add_valid_source(self, source_new, comment_new, file):
         # We'll try to reuse disabled source if we have it.
@@ -323,6 +347,8 @@ class SourcesList(object):
         found = False
         for filename, n, enabled, source, comment in self:
             if source == source_new:
+                if not enabled and source_new not in self.added_sources:
+                    self.added_sources.append(source_new)
                 self.modify(filename, n, enabled=True)
                 found = True
 
@@ -338,6 +364,9 @@ class SourcesList(object):
             files = self.files[file]
             files.append((len(files), True, True, source_new, comment_new))
             self.new_repos.add(file)
+            self.dirty.add(file)
+            if source_new not in self.added_sources:
+                self.added_sources.append(source_new)
 
     def add_source(self, line, comment='', file=None):
         source = self._parse(line, raise_if_invalid_or_disabled=True)[2]
@@ -350,11 +379,37 @@ class SourcesList(object):
         for filename, n, enabled, src, comment in self:
             if source == src and enabled:
                 self.files[filename].pop(n)
+                self.dirty.add(filename)
 
     def remove_source(self, line):
         source = self._parse(line, raise_if_invalid_or_disabled=True)[2]
         self._remove_valid_source(source)
 
+    def update_cache(self):
+        '''
+        Download the indexes of the sources added since the sources were
+        read, through a sources list of just them, rather than those of
+        every source.
+        '''
+        if not self.added_sources:
+            # nothing new to download
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix='.ansible-apt-', suffix='.list')
+        try:
+            f = os.fdopen(fd, 'w')
+            try:
+                f.write(''.join(['%s\n' % source for source in self.added_sources]))
+            finally:
+                f.close()
+            cache = apt.Cache()
+            try:
+                cache.update(sources_list=tmp_path)
+            except TypeError:
+                # python-apt too old to update from a given sources list
+                cache.update()
+        finally:
+            os.remove(tmp_path)
+
 
 class UbuntuSourcesList(SourcesList):
 
@@ -446,10 +501,31 @@ def get_add_ppa_signing_key_callback(module):
         return _run_command
 
 
+def get_repo_params(module, entry):
+    '''
+    Merge an entry of the repos list with the module parameters, which act
+    as the defaults for every repository
+    '''
+    if not isinstance(entry, dict):
+        entry = dict(repo=entry)
+    if not entry.get('repo'):
+        module.fail_json(msg="each of the repos must be a source string or a dict with a repo, got %s" % entry)
+    params = dict(module.params)
+    del params['repos']
+    for (key, value) in entry.items():
+        if key not in ('repo', 'state', 'filename'):
+            module.fail_json(msg="unsupported option %s for repo %s" % (key, entry['repo']))
+        if key == 'state' and value not in ('present', 'absent'):
+            module.fail_json(msg="value of state must be one of: present, absent, got: %s" % value)
+        params[key] = value
+    return params
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
-            repo=dict(required=True),
+            repo=dict(required=False),
+            repos=dict(required=False, type='list'),
             state=dict(choices=['present', 'absent'], default='present'),
             mode=dict(required=False, default=0644),
             update_cache = dict(aliases=['update-cache'], type='bool', default='yes'),
@@ -458,6 +534,8 @@ def main():
             install_python_apt=dict(required=False, default="yes", type='bool'),
             validate_certs = dict(default='yes', type='bool'),
         ),
+        required_one_of=[['repo', 'repos']],
+        mutually_exclusive=[['repo', 'repos']],
         supports_check_mode=True,
     )
 
@@ -481,13 +559,22 @@ def main():
     else:
         module.fail_json(msg='Module apt_repository supports only Debian and Ubuntu.')
 
+    if params['repos'] is None:
+        entries = [dict(params)]
+    else:
+        entries = [get_repo_params(module, entry) for entry in params['repos']]
+
     sources_before = sourceslist.dump()
 
     try:
-        if state == 'present':
-            sourceslist.add_source(repo)
-        elif state == 'absent':
-            sourceslist.remove_source(repo)
+        for entry in entries:
+            if entry['state'] == 'present':
+                filename = None
+                if entry['filename'] is not None:
+                    filename = '%s.list' % entry['filename']
+                sourceslist.add_source(entry['repo'], file=filename)
+            elif entry['state'] == 'absent':
+                sourceslist.remove_source(entry['repo'])
     except InvalidSource, err:
         module.fail_json(msg='Invalid repository string: %s' % unicode(err))
 
@@ -508,12 +595,13 @@ def main():
         try:
             sourceslist.save()
             if update_cache:
-                cache = apt.Cache()
-                cache.update()
+                sourceslist.update_cache()
         except OSError, err:
             module.fail_json(msg=unicode(err))
 
-    module.exit_json(changed=changed, repo=repo, state=state, diff=diff)
+    if params['repos'] is None:
+        module.exit_json(changed=changed, repo=repo, state=state, diff=diff)
+    module.exit_json(changed=changed, repos=[entry['repo'] for entry in entries], diff=diff)
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -29,11 +29,29 @@ description:
 version_added: "1.3"
 options:
     key:
-      required: true
+      required: false
       default: null
       aliases: []
       description:
           - Key that will be modified. Can be a url, a file, or a keyid if the key already exists in the database.
+            Either I(key) or I(keys) is required.
+    keys:
+      required: false
+      default: null
+      version_added: "2.1"
+      description:
+          - List of keys to manage in one go, instead of a single I(key), each of them a url, a file or a keyid.
+            The rpm database is queried once for all of them, and the missing keys are imported, or the
+            present ones removed, with a single rpm command.
+    url_cache_dir:
+      required: false
+      default: null
+      version_added: "2.1"
+      description:
+          - Directory in which to keep the keys downloaded from urls along with their C(ETag) and
+            C(Last-Modified) headers, so that later runs only download keys which changed on the server.
+            Entries are ignored unless the directory and their files belong to the user running the
+            module and are not writable by anybody else.
     state:
       required: false
       default: "present"
@@ -57,74 +75,174 @@ EXAMPLES = '''
 # Example action to import a key from a file
 - rpm_key: state=present key=/path/to/key.gpg
 
+# Example action to import several keys, with a single rpm --import
+- rpm_key:
+    keys:
+      - http://apt.sw.be/RPM-GPG-KEY.dag.txt
+      - /path/to/key.gpg
+    url_cache_dir: /var/cache/ansible/rpm_key
+
 # Example action to ensure a key is not present in the db
 - rpm_key: state=absent key=DEADB33F
 '''
 import re
+import os
 import os.path
 import urllib2
 import tempfile
+try:
+    from hashlib import sha1 as _sha1
+except ImportError:
+    # python 2.4, like module_utils.basic does
+    from sha import sha as _sha1
 
 def is_pubkey(string):
     """Verifies if string is a pubkey"""
     pgp_regex = ".*?(-----BEGIN PGP PUBLIC KEY BLOCK-----.*?-----END PGP PUBLIC KEY BLOCK-----).*"
     return re.match(pgp_regex, string, re.DOTALL)
 
+def url_cache_file(cache_dir, url):
+    """ The path of the url cache entry of url in cache_dir """
+    return os.path.join(cache_dir, _sha1(url).hexdigest())
+
+def read_url_cache(cache_file):
+    """
+    Returns the metadata and the data of a url cache entry, or None. As the
+    data ends up trusted, an entry that anybody but us could have written,
+    through its directory or its files, is ignored.
+    """
+    try:
+        for path in (os.path.dirname(cache_file), cache_file + '.json', cache_file):
+            st = os.stat(path)
+            if st.st_uid != os.geteuid() or st.st_mode & 022:
+                return None
+        f = open(cache_file + '.json')
+        try:
+            meta = json.load(f)
+        finally:
+            f.close()
+        f = open(cache_file, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(meta, dict):
+        return None
+    return (meta, data)
+
+def write_url_cache(cache_file, meta, data):
+    """ Atomically writes a url cache entry, returns whether it could """
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0700)
+        for (path, content) in ((cache_file, data), (cache_file + '.json', json.dumps(meta))):
+            fd, tmp_path = tempfile.mkstemp('', '.tmp', cache_dir)
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, path)
+    except (IOError, OSError):
+        return False
+    return True
+
 class RpmKey:
 
     def __init__(self, module):
-        # If the key is a url, we need to check if it's present to be idempotent,
-        # to do that, we need to check the keyid, which we can get from the armor.
-        keyfile = None
-        should_cleanup_keyfile = False
         self.module = module
         self.rpm = self.module.get_bin_path('rpm', True)
         state = module.params['state']
-        key = module.params['key']
-
-        if '://' in key:
-            keyfile = self.fetch_key(key)
-            keyid = self.getkeyid(keyfile)
-            should_cleanup_keyfile = True
-        elif self.is_keyid(key):
-            keyid = key
-        elif os.path.isfile(key):
-            keyfile = key
-            keyid = self.getkeyid(keyfile)
-        else:
-            self.module.fail_json(msg="Not a valid key %s" % key)
-        keyid = self.normalize_keyid(keyid)
+        keys = module.params['keys']
+        if keys is None:
+            keys = [module.params['key']]
 
-        if state == 'present':
-            if self.is_key_imported(keyid):
-                module.exit_json(changed=False)
+        # the ids of the keys in the rpm db, asked once for all the keys
+        imported = self.get_imported_keyids()
+
+        keyfiles = []
+        keyids = []
+        cleanup_keyfiles = []
+        for key in keys:
+            # If the key is a url, we need to check if it's present to be idempotent,
+            # to do that, we need to check the keyid, which we can get from the armor.
+            keyfile = None
+            if '://' in key:
+                (keyfile, should_cleanup_keyfile) = self.fetch_key(key)
+                if should_cleanup_keyfile:
+                    cleanup_keyfiles.append(keyfile)
+                keyid = self.getkeyid(keyfile)
+            elif self.is_keyid(key):
+                keyid = key
+            elif os.path.isfile(key):
+                keyfile = key
+                keyid = self.getkeyid(keyfile)
             else:
+                self.module.fail_json(msg="Not a valid key %s" % key)
+            keyid = self.normalize_keyid(keyid)
+
+            if keyid in keyids:
+                continue
+            if state == 'present' and keyid not in imported:
                 if not keyfile:
                     self.module.fail_json(msg="When importing a key, a valid file must be given")
-                self.import_key(keyfile, dryrun=module.check_mode)
-                if should_cleanup_keyfile:
-                    self.module.cleanup(keyfile)
-                module.exit_json(changed=True)
-        else:
-            if self.is_key_imported(keyid):
-                self.drop_key(keyid, dryrun=module.check_mode)
-                module.exit_json(changed=True)
+                keyfiles.append(keyfile)
+                keyids.append(keyid)
+            elif state == 'absent' and keyid in imported:
+                keyids.append(keyid)
+
+        if keyids:
+            if state == 'present':
+                self.import_keys(keyfiles, dryrun=module.check_mode)
             else:
-                module.exit_json(changed=False)
+                self.drop_keys(keyids, dryrun=module.check_mode)
+        for keyfile in cleanup_keyfiles:
+            self.module.cleanup(keyfile)
+        module.exit_json(changed=len(keyids) > 0)
 
 
     def fetch_key(self, url):
-        """Downloads a key from url, returns a valid path to a gpg key"""
+        """
+        Downloads a key from url, returns a valid path to a gpg key and
+        whether it is a temporary file. With url_cache_dir, the key is kept
+        there with its ETag and Last-Modified headers, later runs revalidate
+        it rather than download it, and the path is that of the cached key.
+        """
+        cache_dir = self.module.params['url_cache_dir']
+        cached = None
+        cache_file = None
+        headers = {}
+        if cache_dir is not None:
+            cache_file = url_cache_file(cache_dir, url)
+            cached = read_url_cache(cache_file)
+            # the cached key is handed to rpm as is, so check it like a download
+            if cached is not None and cached[0].get('url') == url and is_pubkey(cached[1]):
+                if cached[0].get('etag'):
+                    headers['If-None-Match'] = cached[0]['etag']
+                if cached[0].get('last_modified'):
+                    headers['If-Modified-Since'] = cached[0]['last_modified']
+            else:
+                cached = None
         try:
-            rsp, info = fetch_url(self.module, url)
+            rsp, info = fetch_url(self.module, url, headers=headers)
+            if info['status'] == 304 and cached is not None:
+                return (cache_file, False)
+            if info['status'] != 200:
+                self.module.fail_json(msg="Failed to download key at %s: %s" % (url, info.get('msg')))
             key = rsp.read()
             if not is_pubkey(key):
                 self.module.fail_json(msg="Not a public key: %s" % url)
+            if cache_file is not None:
+                meta = dict(url=url, etag=info.get('etag'), last_modified=info.get('last-modified'))
+                if write_url_cache(cache_file, meta, key):
+                    return (cache_file, False)
             tmpfd, tmpname = tempfile.mkstemp()
             tmpfile = os.fdopen(tmpfd, "w+b")
             tmpfile.write(key)
             tmpfile.close()
-            return tmpname
+            return (tmpname, True)
         except urllib2.URLError, e:
             self.module.fail_json(msg=str(e))
 
@@ -166,7 +284,9 @@ class RpmKey:
             self.module.fail_json(msg=stderr)
         return stdout, stderr
 
-    def is_key_imported(self, keyid):
+    def get_imported_keyids(self):
+        """The set of the ids of the keys in the rpm db"""
+        keyids = set()
         stdout, stderr = self.execute_command([self.rpm, '-qa', 'gpg-pubkey'])
         for line in stdout.splitlines():
             line = line.strip()
@@ -176,26 +296,29 @@ class RpmKey:
             if not match:
                 self.module.fail_json(msg="rpm returned unexpected output [%s]" % line)
             else:
-                if keyid == match.group(1):
-                    return True
-        return False
+                keyids.add(match.group(1))
+        return keyids
 
-    def import_key(self, keyfile, dryrun=False):
+    def import_keys(self, keyfiles, dryrun=False):
         if not dryrun:
-            self.execute_command([self.rpm, '--import', keyfile])
+            self.execute_command([self.rpm, '--import'] + keyfiles)
 
-    def drop_key(self, key, dryrun=False):
+    def drop_keys(self, keys, dryrun=False):
         if not dryrun:
-            self.execute_command([self.rpm, '--erase', '--allmatches', "gpg-pubkey-%s" % key])
+            self.execute_command([self.rpm, '--erase', '--allmatches'] + ["gpg-pubkey-%s" % key for key in keys])
 
 
 def main():
     module = AnsibleModule(
             argument_spec = dict(
                 state=dict(default='present', choices=['present', 'absent'], type='str'),
-                key=dict(required=True, type='str'),
+                key=dict(required=False, type='str'),
+                keys=dict(required=False, type='list'),
+                url_cache_dir=dict(required=False, type='path'),
                 validate_certs=dict(default='yes', type='bool'),
                 ),
+            required_one_of=[['key', 'keys']],
+            mutually_exclusive=[['key', 'keys']],
             supports_check_mode=True
             )
 
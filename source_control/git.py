@@ -173,6 +173,63 @@ options:
               to be installed. The commit MUST be signed and the public key MUST
               be trusted in the GPG trustdb.
 
+    submodule_jobs:
+        required: false
+        default: 4
+        version_added: "2.1"
+        description:
+            - Number of submodules to fetch at the same time when checking
+              them for updates. C(1) fetches them one after another.
+
+    shallow_update:
+        required: false
+        default: "no"
+        choices: ["yes", "no"]
+        version_added: "2.1"
+        description:
+            - if C(yes), and I(depth) is set, updates of an existing checkout
+              fetch only the branch or tag given as C(version), at I(depth),
+              in a single fetch, instead of all the branches and tags of the
+              remote. Other versions, such as a SHA-1, fetch all the branches
+              at I(depth).
+
+    prune_shallow:
+        required: false
+        default: "no"
+        choices: ["yes", "no"]
+        version_added: "2.1"
+        description:
+            - if C(yes), shallow updates (see I(shallow_update)) that fetched
+              new history then expire all the reflogs and prune every
+              unreachable object, so the checkout stays as small as a fresh
+              shallow clone. This also drops any local commits that are no
+              longer referenced, so leave it off in checkouts that are worked
+              in.
+
+    fetch_tags:
+        required: false
+        default: "no"
+        choices: ["yes", "no"]
+        version_added: "2.1"
+        description:
+            - if C(yes), shallow updates (see I(shallow_update)) also fetch
+              all the tags of the remote.
+
+    mirror_cache:
+        required: false
+        default: null
+        version_added: "2.1"
+        description:
+            - Directory in which to keep a bare mirror of each repository
+              cloned or updated through this module, shared by all the tasks
+              and checkouts of the host. The mirror is updated with a single
+              fetch under a lock, then used as a C(--reference) repository
+              by new clones and added to the alternates of existing ones, so
+              that they only download what the mirror does not have.
+            - Checkouts borrow objects from the mirror, so the mirrors must
+              not be removed while checkouts made with them exist. Mirrors
+              are set to never prune unreachable objects for that reason.
+
 requirements:
     - git (the command line tool)
 notes:
@@ -198,12 +255,85 @@ EXAMPLES = '''
 # already been cloned locally.
 - git: repo=git://foosball.example.org/path/to/repo.git dest=/srv/checkout clone=no update=no
 
+# Example checkout sharing a local mirror of the repository with the other
+# checkouts of the host
+- git: repo=git://foosball.example.org/path/to/repo.git
+       dest=/srv/checkout
+       mirror_cache=/var/cache/git-mirrors
+
+# Example shallow checkout of a release branch which stays shallow on updates,
+# with the history left behind the shallow boundary pruned
+- git: repo=git://foosball.example.org/path/to/repo.git
+       dest=/srv/checkout
+       version=release-0.22
+       depth=1
+       shallow_update=yes
+       prune_shallow=yes
+
 # Example checkout a github repo and use refspec to fetch all pull requests
 - git: repo=https://github.com/ansible/ansible-examples.git dest=/src/ansible-examples refspec=+refs/pull/*:refs/heads/*
 '''
 
+import fcntl
 import re
+import shutil
+import subprocess
 import tempfile
+import time
+try:
+    from hashlib import sha1 as _sha1
+except ImportError:
+    # python 2.4, like module_utils.basic does
+    from sha import sha as _sha1
+
+# RemoteRefs of the remotes asked about during this run, by remote
+_remote_refs = {}
+
+class RemoteRefs(object):
+    '''
+    The heads, tags and HEAD of a remote, from a single ls-remote. Every
+    question about remote refs during a run is answered from it, instead
+    of a round trip to the remote for each of them.
+    '''
+
+    def __init__(self, git_path, module, remote, cwd=None):
+        self.head = None
+        self.heads = {}
+        self.tags = {}
+
+        if cwd is not None and not os.path.isdir(cwd):
+            cwd = None
+        cmd = [git_path, 'ls-remote', remote, 'HEAD', 'refs/heads/*', 'refs/tags/*']
+        (rc, out, err) = module.run_command(cmd, check_rc=True, cwd=cwd)
+        peeled = {}
+        for line in out.splitlines():
+            try:
+                (sha, ref) = line.split('\t', 1)
+            except ValueError:
+                continue
+            if ref == 'HEAD':
+                self.head = sha
+            elif ref.startswith('refs/heads/'):
+                self.heads[ref[len('refs/heads/'):]] = sha
+            elif ref.startswith('refs/tags/'):
+                name = ref[len('refs/tags/'):]
+                if name.endswith('^{}'):
+                    peeled[name[:-3]] = sha
+                else:
+                    self.tags[name] = sha
+        # annotated tags resolve to the commit they tag
+        self.tags.update(peeled)
+
+def get_remote_refs(git_path, module, dest, remote):
+    ''' returns the RemoteRefs of remote, from ls-remote the first time '''
+    key = remote
+    if remote == module.params['remote']:
+        # by the time it is asked about, the remote has been cloned from
+        # or pointed at repo, and both share the same refs
+        key = module.params['repo']
+    if key not in _remote_refs:
+        _remote_refs[key] = RemoteRefs(git_path, module, remote, dest)
+    return _remote_refs[key]
 
 def get_submodule_update_params(module, git_path, cwd):
 
@@ -332,6 +462,9 @@ def clone(git_path, module, repo, dest, remote, depth, version, bare,
         cmd.extend([ '--depth', str(depth) ])
     if reference:
         cmd.extend([ '--reference', str(reference) ])
+    if module.params['mirror_cache']:
+        mirror = update_mirror(git_path, module, repo, module.params['mirror_cache'])
+        cmd.extend([ '--reference', mirror ])
     cmd.extend([ repo, dest ])
     module.run_command(cmd, check_rc=True, cwd=dest_dirname)
     if bare:
@@ -344,14 +477,85 @@ def clone(git_path, module, repo, dest, remote, depth, version, bare,
     if verify_commit:
         verify_commit_sign(git_path, module, dest, version)
 
+def update_mirror(git_path, module, repo, cache_dir):
+    '''
+    Create or update the bare mirror of repo kept in cache_dir and return
+    its path. An exclusive lock keeps concurrent tasks from cloning or
+    fetching into the same mirror, later ones wait and then only fetch
+    what changed in between.
+    '''
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(repo.rstrip('/')))
+    mirror = os.path.join(cache_dir, '%s-%s' % (_sha1(repo).hexdigest()[:12], name))
+    if not mirror.endswith('.git'):
+        mirror += '.git'
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        lock = open(mirror + '.lock', 'w')
+    except (IOError, OSError), e:
+        module.fail_json(msg="Failed to create the mirror cache %s: %s" % (cache_dir, str(e)))
+
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(os.path.join(mirror, 'HEAD')):
+            cmd = [git_path, '--git-dir', mirror, 'fetch', '--prune', 'origin']
+            (rc, out, err) = module.run_command(cmd)
+        else:
+            # clone next to it and rename, so that an interrupted clone
+            # does not leave a broken mirror behind
+            tmp_mirror = mirror + '.tmp'
+            if os.path.exists(tmp_mirror):
+                shutil.rmtree(tmp_mirror)
+            cmd = [git_path, 'clone', '--mirror', repo, tmp_mirror]
+            (rc, out, err) = module.run_command(cmd)
+            if rc == 0:
+                # checkouts borrow objects from the mirror, never prune them
+                cmd = [git_path, '--git-dir', tmp_mirror, 'config', 'gc.pruneExpire', 'never']
+                (rc, out, err) = module.run_command(cmd)
+            if rc == 0:
+                os.rename(tmp_mirror, mirror)
+        if rc != 0:
+            module.fail_json(msg="Failed to update the mirror of %s in %s: %s %s" % (repo, mirror, out, err))
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+    return mirror
+
+def add_alternate(module, dest, bare, mirror):
+    ''' borrow objects from the mirror in an existing repository '''
+    if bare:
+        objects = os.path.join(dest, 'objects')
+    else:
+        objects = os.path.join(dest, '.git', 'objects')
+    if not os.path.isdir(objects):
+        # .git is a file in submodules and worktrees, leave those alone
+        return
+    alternates = os.path.join(objects, 'info', 'alternates')
+    mirror_objects = os.path.join(mirror, 'objects')
+    lines = []
+    if os.path.exists(alternates):
+        lines = [ l.strip() for l in open(alternates) ]
+    if mirror_objects in lines:
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(alternates)):
+            os.makedirs(os.path.dirname(alternates))
+        f = open(alternates, 'a')
+        try:
+            f.write(mirror_objects + '\n')
+        finally:
+            f.close()
+    except (IOError, OSError), e:
+        module.fail_json(msg="Failed to add the mirror %s to %s: %s" % (mirror, alternates, str(e)))
+
 def has_local_mods(module, git_path, dest, bare):
     if bare:
         return False
 
-    cmd = "%s status -s" % (git_path)
+    # untracked files do not count, so do not even look for them
+    cmd = "%s status -s --untracked-files=no" % (git_path)
     rc, stdout, stderr = module.run_command(cmd, cwd=dest)
     lines = stdout.splitlines()
-    lines = filter(lambda c: not re.search('^\\?\\?.*$', c), lines)
 
     return len(lines) > 0
 
@@ -367,50 +571,33 @@ def reset(git_path, module, dest):
 def get_remote_head(git_path, module, dest, version, remote, bare):
     cloning = False
     cwd = None
-    tag = False
     if remote == module.params['repo']:
         cloning = True
     else:
         cwd = dest
+    refs = get_remote_refs(git_path, module, cwd, remote)
     if version == 'HEAD':
         if cloning:
             # cloning the repo, just get the remote's HEAD version
-            cmd = '%s ls-remote %s -h HEAD' % (git_path, remote)
+            rev = refs.head
         else:
             head_branch = get_head_branch(git_path, module, dest, remote, bare)
-            cmd = '%s ls-remote %s -h refs/heads/%s' % (git_path, remote, head_branch)
-    elif is_remote_branch(git_path, module, dest, remote, version):
-        cmd = '%s ls-remote %s -h refs/heads/%s' % (git_path, remote, version)
-    elif is_remote_tag(git_path, module, dest, remote, version):
-        tag = True
-        cmd = '%s ls-remote %s -t refs/tags/%s*' % (git_path, remote, version)
+            rev = refs.heads.get(head_branch)
+    elif version in refs.heads:
+        rev = refs.heads[version]
+    elif version in refs.tags:
+        # the dereferenced tag if this is an annotated tag
+        rev = refs.tags[version]
     else:
         # appears to be a sha1.  return as-is since it appears
         # cannot check for a specific sha1 on remote
         return version
-    (rc, out, err) = module.run_command(cmd, check_rc=True, cwd=cwd)
-    if len(out) < 1:
+    if rev is None:
         module.fail_json(msg="Could not determine remote revision for %s" % version)
-
-    if tag:
-    # Find the dereferenced tag if this is an annotated tag.
-        for tag in out.split('\n'):
-            if tag.endswith(version + '^{}'):
-                out = tag
-                break
-            elif tag.endswith(version):
-                out = tag
-
-    rev = out.split()[0]
     return rev
 
 def is_remote_tag(git_path, module, dest, remote, version):
-    cmd = '%s ls-remote %s -t refs/tags/%s' % (git_path, remote, version)
-    (rc, out, err) = module.run_command(cmd, check_rc=True, cwd=dest)
-    if version in out:
-        return True
-    else:
-        return False
+    return version in get_remote_refs(git_path, module, dest, remote).tags
 
 def get_branches(git_path, module, dest):
     branches = []
@@ -433,12 +620,7 @@ def get_tags(git_path, module, dest):
     return tags
 
 def is_remote_branch(git_path, module, dest, remote, version):
-    cmd = '%s ls-remote %s -h refs/heads/%s' % (git_path, remote, version)
-    (rc, out, err) = module.run_command(cmd, check_rc=True, cwd=dest)
-    if version in out:
-        return True
-    else:
-        return False
+    return version in get_remote_refs(git_path, module, dest, remote).heads
 
 def is_local_branch(git_path, module, dest, branch):
     branches = get_branches(git_path, module, dest)
@@ -503,11 +685,23 @@ def set_remote_url(git_path, module, repo, dest, remote):
 def fetch(git_path, module, repo, dest, version, remote, bare, refspec):
     ''' updates repo from remote sources '''
     set_remote_url(git_path, module, repo, dest, remote)
+    if module.params['mirror_cache']:
+        # objects already in the mirror are not downloaded again
+        mirror = update_mirror(git_path, module, repo, module.params['mirror_cache'])
+        add_alternate(module, dest, bare, mirror)
     commands = []
 
     fetch_str = 'download remote objects and refs'
 
-    if bare:
+    depth = module.params['depth']
+    if module.params['shallow_update'] and depth:
+        refspecs = shallow_refspecs(git_path, module, dest, remote, version, bare)
+        if module.params['fetch_tags']:
+            refspecs.append('+refs/tags/*:refs/tags/*')
+        if refspec:
+            refspecs.append(refspec)
+        commands.append((fetch_str, [git_path, 'fetch', '--depth=%s' % depth, remote] + refspecs))
+    elif bare:
         refspecs = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
         if refspec:
             refspecs.append(refspec)
@@ -527,6 +721,73 @@ def fetch(git_path, module, repo, dest, version, remote, bare, refspec):
         if rc != 0:
             module.fail_json(msg="Failed to %s: %s %s" % (label, out, err))
 
+def shallow_refspecs(git_path, module, dest, remote, version, bare):
+    '''
+    The refspecs fetching only version from remote, or all the branches
+    when version is neither a branch nor a tag of remote
+    '''
+    if version == 'HEAD':
+        version = get_head_branch(git_path, module, dest, remote, bare)
+    if bare:
+        heads = 'refs/heads'
+    else:
+        heads = 'refs/remotes/%s' % remote
+    if is_remote_branch(git_path, module, dest, remote, version):
+        return ['+refs/heads/%s:%s/%s' % (version, heads, version)]
+    if is_remote_tag(git_path, module, dest, remote, version):
+        return ['+refs/tags/%s:refs/tags/%s' % (version, version)]
+    return ['+refs/heads/*:%s/*' % heads]
+
+def prune_shallow(git_path, module, dest):
+    '''
+    Drop the history a shallow update left behind the new shallow
+    boundary, which the reflogs would otherwise keep alive
+    '''
+    commands = [[git_path, 'reflog', 'expire', '--expire=now', '--all'],
+                [git_path, 'gc', '--quiet', '--prune=now']]
+    for cmd in commands:
+        (rc, out, err) = module.run_command(cmd, cwd=dest)
+        if rc != 0:
+            module.fail_json(msg="Failed to prune shallow history: %s %s" % (out, err))
+
+def run_parallel(module, commands, jobs):
+    '''
+    Run the (cwd, cmd) commands, at most jobs of them at a time, and
+    return their (cwd, rc, out, err) in the same order. The commands run
+    with the same environment run_command() would give them.
+    '''
+    env = dict(os.environ)
+    env.update(module.run_command_environ_update or {})
+    pending = list(enumerate(commands))
+    running = []
+    results = [None] * len(commands)
+    devnull = open(os.devnull)
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                (index, (cwd, cmd)) = pending.pop(0)
+                # files rather than pipes, which would fill up and block
+                out = tempfile.TemporaryFile()
+                err = tempfile.TemporaryFile()
+                proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=devnull,
+                                        stdout=out, stderr=err, close_fds=True)
+                running.append((index, cwd, proc, out, err))
+            for job in list(running):
+                (index, cwd, proc, out, err) = job
+                if proc.poll() is None:
+                    continue
+                running.remove(job)
+                out.seek(0)
+                err.seek(0)
+                results[index] = (cwd, proc.returncode, out.read(), err.read())
+                out.close()
+                err.close()
+            if running:
+                time.sleep(0.05)
+    finally:
+        devnull.close()
+    return results
+
 def submodules_fetch(git_path, module, remote, track_submodules, dest):
     changed = False
 
@@ -556,10 +817,15 @@ def submodules_fetch(git_path, module, remote, track_submodules, dest):
     if not changed:
         # Fetch updates
         begin = get_submodule_versions(git_path, module, dest)
-        cmd = [git_path, 'submodule', 'foreach', git_path, 'fetch']
+        # list the checked out submodules, and fetch them concurrently
+        # rather than one after the other with submodule foreach
+        cmd = [git_path, 'submodule', 'foreach', '--quiet', 'pwd']
         (rc, out, err) = module.run_command(cmd, check_rc=True, cwd=dest)
-        if rc != 0:
-            module.fail_json(msg="Failed to fetch submodules: %s" % out + err)
+        commands = [ (path, [git_path, 'fetch']) for path in out.splitlines() if path ]
+        jobs = max(1, module.params['submodule_jobs'] or 1)
+        for (path, rc, out, err) in run_parallel(module, commands, jobs):
+            if rc != 0:
+                module.fail_json(msg="Failed to fetch submodule %s: %s" % (path, out + err))
 
         if track_submodules:
             # Compare against submodule HEAD
@@ -601,11 +867,13 @@ def submodule_update(git_path, module, dest, track_submodules):
         module.fail_json(msg="Failed to init/update submodules: %s" % out + err)
     return (rc, out, err)
 
-def set_remote_branch(git_path, module, dest, remote, version, depth):
+def set_remote_branch(git_path, module, dest, remote, version, depth, fetch=True):
     cmd = "%s remote set-branches %s %s" % (git_path, remote, version)
     (rc, out, err) = module.run_command(cmd, cwd=dest)
     if rc != 0:
         module.fail_json(msg="Failed to set remote branch: %s" % version)
+    if not fetch:
+        return
     cmd = "%s fetch --depth=%s %s %s" % (git_path, depth, remote, version)
     (rc, out, err) = module.run_command(cmd, cwd=dest)
     if rc != 0:
@@ -619,8 +887,10 @@ def switch_version(git_path, module, dest, remote, version, verify_commit):
                 depth = module.params['depth']
                 if depth:
                     # git clone --depth implies --single-branch, which makes
-                    # the checkout fail if the version changes
-                    set_remote_branch(git_path, module, dest, remote, version, depth)
+                    # the checkout fail if the version changes. Shallow
+                    # updates have already fetched the branch.
+                    set_remote_branch(git_path, module, dest, remote, version, depth,
+                                      fetch=not module.params['shallow_update'])
                 cmd = "%s checkout --track -b %s %s/%s" % (git_path, version, remote, version)
             else:
                 (rc, out, err) = module.run_command("%s checkout --force %s" % (git_path, version), cwd=dest)
@@ -678,6 +948,11 @@ def main():
             bare=dict(default='no', type='bool'),
             recursive=dict(default='yes', type='bool'),
             track_submodules=dict(default='no', type='bool'),
+            submodule_jobs=dict(default=4, type='int'),
+            shallow_update=dict(default='no', type='bool'),
+            prune_shallow=dict(default='no', type='bool'),
+            fetch_tags=dict(default='no', type='bool'),
+            mirror_cache=dict(default=None, type='path'),
         ),
         supports_check_mode=True
     )
@@ -736,6 +1011,7 @@ def main():
     before = None
     local_mods = False
     repo_updated = None
+    fetched = False
     if (dest and not os.path.exists(gitconfig)) or (not dest and not allow_clone):
         # if there is no git configuration, do a clone operation unless:
         # * the user requested no clone (they just want info)
@@ -771,7 +1047,7 @@ def main():
             if local_mods:
                 module.exit_json(changed=True, before=before, after=remote_head,
                     msg="Local modifications exist")
-            elif is_remote_tag(git_path, module, dest, repo, version):
+            elif is_remote_tag(git_path, module, dest, remote, version):
                 # if the remote is a tag and we have the tag locally, exit early
                 if version in get_tags(git_path, module, dest):
                     repo_updated = False
@@ -784,12 +1060,17 @@ def main():
                 module.exit_json(changed=True, before=before, after=remote_head)
             fetch(git_path, module, repo, dest, version, remote, bare, refspec)
             repo_updated = True
+            fetched = True
 
     # switch to version specified regardless of whether
     # we got new revisions from the repository
     if not bare:
         switch_version(git_path, module, dest, remote, version, verify_commit)
 
+    if fetched and depth and module.params['shallow_update'] and module.params['prune_shallow']:
+        # only now that the local branch has moved is the old history unused
+        prune_shallow(git_path, module, dest)
+
     # Deal with submodules
     submodules_updated = False
     if recursive and not bare:
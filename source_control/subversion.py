@@ -96,7 +96,15 @@ EXAMPLES = '''
 '''
 
 import re
+import signal
+import subprocess
 import tempfile
+from xml.sax.saxutils import unescape
+
+# the parts of svn info --xml needed, xml.etree is not in python 2.4
+INFO_ENTRY_RE = re.compile(r'<entry\b([^>]*)>(.*?)</entry>', re.DOTALL)
+INFO_REVISION_RE = re.compile(r'\brevision="(\d+)"')
+INFO_URL_RE = re.compile(r'<url>(.*?)</url>', re.DOTALL)
 
 
 class Subversion(object):
@@ -110,8 +118,8 @@ class Subversion(object):
         self.password = password
         self.svn_path = svn_path
 
-    def _exec(self, args, check_rc=True):
-        '''Execute a subversion command, and return output. If check_rc is False, returns the return code instead of the output.'''
+    def _command(self, args):
+        '''The svn command line running args, with the common and authentication options.'''
         bits = [
             self.svn_path,
             '--non-interactive',
@@ -123,6 +131,11 @@ class Subversion(object):
         if self.password:
             bits.extend(["--password", self.password])
         bits.extend(args)
+        return bits
+
+    def _exec(self, args, check_rc=True):
+        '''Execute a subversion command, and return output. If check_rc is False, returns the return code instead of the output.'''
+        bits = self._command(args)
         rc, out, err = self.module.run_command(bits, check_rc)
         if check_rc:
             return out.splitlines()
@@ -160,32 +173,69 @@ class Subversion(object):
         '''Revert svn working directory.'''
         self._exec(["revert", "-R", self.dest])
 
+    def _info(self, *targets):
+        '''Revision and URL of each of the targets, from a single svn info.'''
+        text = '\n'.join(self._exec(["info", "--xml"] + list(targets)))
+        info = []
+        for (attributes, body) in INFO_ENTRY_RE.findall(text):
+            revision = INFO_REVISION_RE.search(attributes)
+            url = INFO_URL_RE.search(body)
+            if revision is None or url is None:
+                break
+            info.append((int(revision.group(1)), unescape(url.group(1).strip(), {'&quot;': '"'})))
+        if len(info) != len(targets):
+            self.module.fail_json(msg="Failed to parse svn info output: %s" % text)
+        return info
+
     def get_revision(self):
         '''Revision and URL of subversion working directory.'''
-        text = '\n'.join(self._exec(["info", self.dest]))
-        rev = re.search(r'^Revision:.*$', text, re.MULTILINE).group(0)
-        url = re.search(r'^URL:.*$', text, re.MULTILINE).group(0)
-        return rev, url
+        rev, url = self._info(self.dest)[0]
+        return 'Revision: %s' % rev, 'URL: %s' % url
 
     def has_local_mods(self):
         '''True if revisioned files have been added or modified. Unrevisioned files are ignored.'''
-        lines = self._exec(["status", "--quiet", "--ignore-externals",  self.dest])
         # The --quiet option will return only modified files.
         # Match only revisioned files, i.e. ignore status '?'.
         regex = re.compile(r'^[^?X]')
-        # Has local mods if more than 0 modifed revisioned files.
-        return len(filter(regex.match, lines)) > 0
+        # Has local mods as soon as one modified revisioned file shows up,
+        # so read the status as svn walks the working copy and stop it there
+        # rather than waiting for the whole list.
+        env = dict(os.environ)
+        env.update(self.module.run_command_environ_update or {})
+        cmd = self._command(["status", "--quiet", "--ignore-externals", self.dest])
+        devnull = open(os.devnull)
+        err = tempfile.TemporaryFile()
+        try:
+            proc = subprocess.Popen(cmd, stdin=devnull, stdout=subprocess.PIPE,
+                                    stderr=err, env=env, close_fds=True)
+        except:
+            devnull.close()
+            err.close()
+            raise
+        try:
+            for line in iter(proc.stdout.readline, ''):
+                if regex.match(line):
+                    # Popen.terminate() is not in python 2.4
+                    os.kill(proc.pid, signal.SIGTERM)
+                    return True
+            rc = proc.wait()
+            if rc != 0:
+                err.seek(0)
+                self.module.fail_json(rc=rc, msg=err.read().rstrip())
+            return False
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            devnull.close()
+            err.close()
 
     def needs_update(self):
-        curr, url = self.get_revision()
-        out2 = '\n'.join(self._exec(["info", "-r", "HEAD", self.dest]))
-        head = re.search(r'^Revision:.*$', out2, re.MULTILINE).group(0)
-        rev1 = int(curr.split(':')[1].strip())
-        rev2 = int(head.split(':')[1].strip())
+        # the working copy and the repository HEAD in one svn info
+        (rev1, url), (rev2, head_url) = self._info(self.dest, '%s@HEAD' % self.dest)
         change = False
         if rev1 < rev2:
             change = True
-        return change, curr, head
+        return change, 'Revision: %s' % rev1, 'Revision: %s' % rev2
 
 
 # ===========================================
@@ -31,14 +31,39 @@ version_added: "0.5"
 options:
   user:
     description:
-      - The username on the remote host whose authorized_keys file will be modified
-    required: true
+      - The username on the remote host whose authorized_keys file will be modified.
+        B(One of user and users is required.)
+    required: false
     default: null
   key:
     description:
       - The SSH public key(s), as a string or (since 1.9) url (https://github.com/username.keys)
-    required: true
+      - Required with I(user).
+    required: false
     default: null
+  users:
+    description:
+      - A mapping of user names to the keys of each user, to manage the
+        authorized_keys files of many users in one go. Each value is either
+        the keys of the user, as they would be given to I(key), or a dict
+        with a C(key) and any of I(path), I(manage_dir), I(state),
+        I(key_options) and I(exclusive). Options that are not set for a
+        user default to the ones given to the module.
+      - Keys fetched from the same url are only fetched once per run.
+    required: false
+    default: null
+    version_added: "2.1"
+  url_cache_dir:
+    description:
+      - Directory in which to keep the keys fetched from urls along with
+        their C(ETag) and C(Last-Modified) headers. When set, the next runs
+        only download keys that changed on the server, and otherwise reuse
+        the cached copy. Entries are ignored unless the directory and their
+        files belong to the user running the module and are not writable by
+        anybody else.
+    required: false
+    default: null
+    version_added: "2.1"
   path:
     description:
       - Alternate path to the authorized_keys file
@@ -122,6 +147,16 @@ EXAMPLES = '''
 # Using validate_certs:
 - authorized_key: user=charlie key=https://github.com/user.keys validate_certs=no
 
+# Set up the keys of several users at once, keeping github keys in a cache
+- authorized_key:
+    url_cache_dir: /var/cache/ansible/authorized_keys
+    users:
+      charlie: https://github.com/charlie.keys
+      deploy: "{{ lookup('file', 'public_keys/deploy') }}"
+      alice:
+        key: https://github.com/alice.keys
+        exclusive: yes
+
 # Set up authorized_keys exclusively with one key
 - authorized_key: user=root key="{{ item }}" state=present exclusive=yes
   with_file:
@@ -146,7 +181,23 @@ import pwd
 import os.path
 import tempfile
 import re
-import shlex
+try:
+    from hashlib import sha1 as _sha1
+except ImportError:
+    # python 2.4, like module_utils.basic does
+    from sha import sha as _sha1
+
+# splits on the commas of an option string that are not inside quotes
+OPTIONS_RE = re.compile(r'''((?:[^,"']|"[^"]*"|'[^']*')+)''')
+
+# what separates the fields of an authorized_keys line
+KEY_FIELDS_RE = re.compile(r'[ \t\r\n]+')
+
+# passwd entries, see lookup_user()
+_passwd = {}
+
+# keys fetched from urls during this run, see fetch_keys()
+_fetched_keys = {}
 
 class keydict(dict):
 
@@ -169,6 +220,20 @@ class keydict(dict):
     def itervalues(self):
         return (self[key] for key in self)
 
+def lookup_user(user):
+    """
+    Cached pwd.getpwnam(), which is looked up twice for every user whose
+    file is changed. load_users() fills it from a single getpwall() when
+    many users are managed.
+    """
+    if user not in _passwd:
+        _passwd[user] = pwd.getpwnam(user)
+    return _passwd[user]
+
+def load_users():
+    for entry in pwd.getpwall():
+        _passwd.setdefault(entry.pw_name, entry)
+
 def keyfile(module, user, write=False, path=None, manage_dir=True):
     """
     Calculate name of authorized keys file, optionally creating the
@@ -186,7 +251,7 @@ def keyfile(module, user, write=False, path=None, manage_dir=True):
         return keysfile
 
     try:
-        user_entry = pwd.getpwnam(user)
+        user_entry = lookup_user(user)
     except KeyError, e:
         if module.check_mode and path is None:
             module.fail_json(msg="Either user must exist or you must provide full path to key file in check mode")
@@ -242,8 +307,7 @@ def parseoptions(module, options):
         try:
             # the following regex will split on commas while
             # ignoring those commas that fall within quotes
-            regex = re.compile(r'''((?:[^,"']|"[^"]*"|'[^']*')+)''')
-            parts = regex.split(options)[1:-1]
+            parts = OPTIONS_RE.split(options)[1:-1]
             for part in parts:
                 if "=" in part:
                     (key, value) = part.split("=", 1)
@@ -278,12 +342,9 @@ def parsekey(module, raw_key):
     # remove comment yaml escapes
     raw_key = raw_key.replace('\#', '#')
 
-    # split key safely
-    lex = shlex.shlex(raw_key)
-    lex.quotes = []
-    lex.commenters = '' #keep comment hashes
-    lex.whitespace_split = True
-    key_parts = list(lex)
+    # split key safely, on whitespace only, keeping quotes and comment
+    # hashes (what shlex did with no quotes and no commenters)
+    key_parts = [ part for part in KEY_FIELDS_RE.split(raw_key) if part ]
 
     for i in range(0, len(key_parts)):
         if key_parts[i] in VALID_SSH2_KEY_TYPES:
@@ -356,6 +417,96 @@ def writekeys(module, filename, keys):
     f.close()
     module.atomic_move(tmp_path, filename)
 
+def url_cache_file(cache_dir, url):
+    """ The path of the url cache entry of url in cache_dir """
+    return os.path.join(cache_dir, _sha1(url).hexdigest())
+
+def read_url_cache(cache_file):
+    """
+    Returns the metadata and the data of a url cache entry, or None. As the
+    data ends up trusted, an entry that anybody but us could have written,
+    through its directory or its files, is ignored.
+    """
+    try:
+        for path in (os.path.dirname(cache_file), cache_file + '.json', cache_file):
+            st = os.stat(path)
+            if st.st_uid != os.geteuid() or st.st_mode & 022:
+                return None
+        f = open(cache_file + '.json')
+        try:
+            meta = json.load(f)
+        finally:
+            f.close()
+        f = open(cache_file, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(meta, dict):
+        return None
+    return (meta, data)
+
+def write_url_cache(cache_file, meta, data):
+    """ Atomically writes a url cache entry, returns whether it could """
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0700)
+        for (path, content) in ((cache_file, data), (cache_file + '.json', json.dumps(meta))):
+            fd, tmp_path = tempfile.mkstemp('', '.tmp', cache_dir)
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, path)
+    except (IOError, OSError):
+        return False
+    return True
+
+def fetch_keys(module, url, cache_dir=None):
+    """
+    Returns the keys served at url. A url is only fetched once per run,
+    and with a cache_dir the response is kept there with its ETag and
+    Last-Modified headers, so that later runs revalidate it and only
+    download keys which changed.
+    """
+    if url in _fetched_keys:
+        return _fetched_keys[url]
+
+    error_msg = "Error getting key from: %s"
+    cached = None
+    cache_file = None
+    headers = {}
+    if cache_dir is not None:
+        cache_file = url_cache_file(cache_dir, url)
+        cached = read_url_cache(cache_file)
+        if cached is not None and cached[0].get('url') == url:
+            if cached[0].get('etag'):
+                headers['If-None-Match'] = cached[0]['etag']
+            if cached[0].get('last_modified'):
+                headers['If-Modified-Since'] = cached[0]['last_modified']
+        else:
+            cached = None
+
+    try:
+        resp, info = fetch_url(module, url, headers=headers)
+        if info['status'] == 304 and cached is not None:
+            keys = cached[1]
+        elif info['status'] != 200:
+            module.fail_json(msg=error_msg % url)
+        else:
+            keys = resp.read()
+            if cache_file is not None:
+                write_url_cache(cache_file, dict(url=url, etag=info.get('etag'),
+                    last_modified=info.get('last-modified')), keys)
+    except Exception:
+        module.fail_json(msg=error_msg % url)
+
+    _fetched_keys[url] = keys
+    return keys
+
 def enforce_state(module, params):
     """
     Add or remove key.
@@ -368,19 +519,11 @@ def enforce_state(module, params):
     state       = params.get("state", "present")
     key_options = params.get("key_options", None)
     exclusive   = params.get("exclusive", False)
-    validate_certs = params.get("validate_certs", True)
-    error_msg   = "Error getting key from: %s"
+    url_cache_dir = params.get("url_cache_dir", None)
 
     # if the key is a url, request it and use it as key source
     if key.startswith("http"):
-        try:
-            resp, info = fetch_url(module, key)
-            if info['status'] != 200:
-                module.fail_json(msg=error_msg % key)
-            else:
-                key = resp.read()
-        except Exception:
-            module.fail_json(msg=error_msg % key)
+        key = fetch_keys(module, key, url_cache_dir)
 
     # extract individual keys into an array, skipping blank lines and comments
     key = [s for s in key.splitlines() if s and not s.startswith('#')]
@@ -448,23 +591,42 @@ def enforce_state(module, params):
             del existing_keys[key]
             do_write = True
 
-    if do_write:
-        if module.check_mode:
-            module.exit_json(changed=True)
+    if do_write and not module.check_mode:
         writekeys(module, keyfile(module, user, do_write, path, manage_dir), existing_keys)
-        params['changed'] = True
-    else:
-        if module.check_mode:
-            module.exit_json(changed=False)
+    params['changed'] = do_write
+
+    return params
 
+def get_user_params(module, user, entry):
+    """
+    Merge the entry of a user in the users mapping with the module
+    parameters, which act as the defaults for every user
+    """
+    if isinstance(entry, basestring):
+        entry = dict(key=entry)
+    if not isinstance(entry, dict) or not entry.get('key'):
+        module.fail_json(msg="the keys of user %s must be a key string or a dict with a key" % user)
+
+    params = dict(module.params)
+    del params['users']
+    params['user'] = user
+    for (name, value) in entry.items():
+        if name not in ('key', 'path', 'manage_dir', 'state', 'key_options', 'exclusive'):
+            module.fail_json(msg="unsupported option %s for user %s" % (name, user))
+        if name in ('manage_dir', 'exclusive'):
+            value = module.boolean(value)
+        elif name == 'state' and value not in ('absent', 'present'):
+            module.fail_json(msg="value of state must be one of: absent, present, got: %s" % value)
+        params[name] = value
     return params
 
 def main():
 
     module = AnsibleModule(
         argument_spec = dict(
-           user        = dict(required=True, type='str'),
-           key         = dict(required=True, type='str'),
+           user        = dict(required=False, type='str'),
+           key         = dict(required=False, type='str'),
+           users       = dict(required=False, type='dict'),
            path        = dict(required=False, type='str'),
            manage_dir  = dict(required=False, type='bool', default=True),
            state       = dict(default='present', choices=['absent','present']),
@@ -472,10 +634,25 @@ def main():
            unique      = dict(default=False, type='bool'),
            exclusive   = dict(default=False, type='bool'),
            validate_certs = dict(default=True, type='bool'),
+           url_cache_dir = dict(required=False, type='path'),
         ),
+        required_one_of=[['user', 'users']],
+        mutually_exclusive=[['user', 'users'], ['key', 'users']],
         supports_check_mode=True
     )
 
+    if module.params['users'] is not None:
+        load_users()
+        results = {}
+        for user in sorted(module.params['users']):
+            params = enforce_state(module, get_user_params(module, user, module.params['users'][user]))
+            results[user] = dict(changed=params['changed'], keyfile=params['keyfile'])
+        changed = bool([ r for r in results.values() if r['changed'] ])
+        module.exit_json(changed=changed, users=results)
+
+    if module.params['key'] is None:
+        module.fail_json(msg="key is required with user")
+
     results = enforce_state(module, module.params)
     module.exit_json(**results)
 
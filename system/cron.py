@@ -156,6 +156,21 @@ options:
     version_added: "2.1"
     required: false
     default: null
+  jobs:
+    description:
+      - List of jobs and environment variables to manage in one go, instead
+        of a single I(name). Each entry is a dict with a C(name) and any of
+        I(job), I(state), I(minute), I(hour), I(day), I(month), I(weekday),
+        I(reboot), I(special_time), I(disabled), I(env), I(insertafter) and
+        I(insertbefore). Options that are not set in an entry default to the
+        ones given to the module.
+      - The crontab is read and indexed once, all the entries are applied to
+        it and it is written once at the end, only if its text changed.
+        New environment variables without I(insertafter) or I(insertbefore)
+        are added on top of the crontab in the order of the list.
+    version_added: "2.1"
+    required: false
+    default: null
 requirements:
   - cron
 author:
@@ -195,6 +210,15 @@ EXAMPLES = '''
 
 # Removes "APP_HOME" environment variable from crontab
 - cron: name=APP_HOME env=yes state=absent
+
+# Manages several jobs and a variable of the crontab of a user at once
+- cron:
+    user: app
+    jobs:
+      - { name: PATH, env: yes, value: "/opt/app/bin:/usr/bin:/bin" }
+      - { name: "rotate logs", special_time: daily, job: /opt/app/bin/rotate }
+      - { name: "sync", minute: "*/10", job: /opt/app/bin/sync }
+      - { name: "an old job", state: absent }
 '''
 
 import os
@@ -205,6 +229,9 @@ import pipes
 
 CRONCMD = "/usr/bin/crontab"
 
+# the name of a job entry in jobs, to its aliases
+JOB_ALIASES = dict(job='value', day='dom', weekday='dow')
+
 class CronTabError(Exception):
     pass
 
@@ -221,6 +248,10 @@ class CronTab(object):
         self.root      = (os.getuid() == 0)
         self.lines     = None
         self.ansible   = "#Ansible: "
+        self.job_index = None
+        self.env_index = None
+        # where apply_env() adds new variables on top
+        self.env_top   = 0
 
         if cron_file:
             if os.path.isabs(cron_file):
@@ -449,6 +480,89 @@ class CronTab(object):
 
         self.lines = newlines
 
+    def build_index(self):
+        """
+        Index the positions in self.lines of the comment lines of the jobs
+        and of the variable declarations, by name. Used to apply many jobs
+        without scanning the crontab for each of them, lines are set to
+        None rather than removed so that positions stay valid.
+        """
+        self.job_index = {}
+        self.env_index = {}
+        for index, l in enumerate(self.lines):
+            if l is None:
+                continue
+            if l.startswith(self.ansible):
+                self.job_index.setdefault(l[len(self.ansible):], []).append(index)
+            elif re.match( r'^\S+=', l):
+                self.env_index.setdefault(l.split('=')[0], []).append(index)
+
+    def apply_job(self, name, job, state):
+        """
+        Make the job named name present or absent, using the index built
+        by build_index(). Returns whether the crontab changed.
+        """
+        positions = self.job_index.get(name, [])
+        changed = False
+        if state == 'present':
+            if not positions:
+                self.job_index[name] = [len(self.lines)]
+                self.add_job(name, job)
+                return True
+            for index in positions:
+                if index + 1 < len(self.lines) and self.lines[index + 1] != job:
+                    self.lines[index + 1] = job
+                    changed = True
+        else:
+            for index in positions:
+                self.lines[index] = None
+                if index + 1 < len(self.lines):
+                    self.lines[index + 1] = None
+                changed = True
+            self.job_index.pop(name, None)
+        return changed
+
+    def apply_env(self, name, decl, state, insertafter=None, insertbefore=None):
+        """
+        Make the variable declaration of name present or absent, using the
+        index built by build_index(). Returns whether the crontab changed.
+        """
+        positions = self.env_index.get(name, [])
+        changed = False
+        if state == 'present':
+            if not positions:
+                other_name = insertafter or insertbefore
+                if other_name:
+                    if other_name not in self.env_index:
+                        self.module.fail_json(msg="Variable named '%s' not found." % other_name)
+                    index = self.env_index[other_name][0]
+                    if insertafter:
+                        index += 1
+                    self.lines.insert(index, decl)
+                else:
+                    self.lines.insert(self.env_top, decl)
+                    self.env_top += 1
+                # positions after the new line moved
+                self.build_index()
+                return True
+            for index in positions:
+                if self.lines[index] != decl:
+                    self.lines[index] = decl
+                    changed = True
+        else:
+            for index in positions:
+                self.lines[index] = None
+                changed = True
+            self.env_index.pop(name, None)
+        return changed
+
+    def compact(self):
+        """ Drop the lines removed by apply_job() and apply_env() """
+        self.lines = [ l for l in self.lines if l is not None ]
+        self.job_index = None
+        self.env_index = None
+        self.env_top = 0
+
     def render(self):
         """
         Render this crontab as it would be in the crontab.
@@ -494,6 +608,77 @@ class CronTab(object):
 
 #==================================================
 
+def validate_job(module, params):
+    """
+    Check the options of a job or variable, returns its special_time
+    """
+    do_install = params['state'] == 'present'
+    special_time = params['special_time']
+
+    if (special_time or params['reboot']) and \
+       (True in [(params[x] != '*') for x in ['minute', 'hour', 'day', 'month', 'weekday']]):
+        module.fail_json(msg="You must specify time and date fields or special time.")
+
+    if params['job'] is None and do_install:
+        module.fail_json(msg="You must specify 'job' to install a new cron job or variable")
+
+    if (params['insertafter'] or params['insertbefore']) and not params['env'] and do_install:
+        module.fail_json(msg="Insertafter and insertbefore parameters are valid only with env=yes")
+
+    if params['env'] and ' ' in (params['name'] or ''):
+        module.fail_json(msg="Invalid name for environment variable")
+
+    if params['reboot']:
+        special_time = "reboot"
+    return special_time
+
+def get_job_params(module, entry):
+    """
+    Merge an entry of the jobs list with the module parameters, which act
+    as the defaults for every job
+    """
+    if not isinstance(entry, dict) or not entry.get('name'):
+        module.fail_json(msg="each of the jobs must be a dict with a name, got %s" % entry)
+
+    params = dict(module.params)
+    del params['jobs']
+    for (key, value) in entry.items():
+        for (option, alias) in JOB_ALIASES.items():
+            if key == alias:
+                key = option
+        if key not in params or key in ('user', 'cron_file', 'backup'):
+            module.fail_json(msg="unsupported option %s for job %s" % (key, entry['name']))
+        spec = module.argument_spec[key]
+        if value is not None:
+            if spec.get('type') == 'bool':
+                value = module.boolean(value)
+            else:
+                value = str(value)
+            if 'choices' in spec and value not in spec['choices']:
+                module.fail_json(msg="value of %s must be one of: %s, got: %s" % (key, ', '.join(spec['choices']), value))
+        params[key] = value
+    return params
+
+def apply_jobs(module, crontab, jobs):
+    """
+    Apply all the jobs and variables to the crontab, indexed once.
+    Returns whether the rendered crontab changed.
+    """
+    before = crontab.render()
+    crontab.build_index()
+    for params in jobs:
+        if params['env']:
+            decl = '%s="%s"' % (params['name'], params['job'])
+            crontab.apply_env(params['name'], decl, params['state'],
+                              params['insertafter'], params['insertbefore'])
+        else:
+            job = crontab.get_cron_job(params['minute'], params['hour'], params['day'],
+                                       params['month'], params['weekday'], params['job'],
+                                       params['special_time'], params['disabled'])
+            crontab.apply_job(params['name'], job, params['state'])
+    crontab.compact()
+    return crontab.render() != before
+
 def main():
     # The following example playbooks:
     #
@@ -537,11 +722,14 @@ def main():
             env=dict(required=False, type='bool'),
             insertafter=dict(required=False),
             insertbefore=dict(required=False),
+            jobs=dict(required=False, type='list'),
         ),
         supports_check_mode = True,
         mutually_exclusive=[
                 ['reboot', 'special_time'],
                 ['insertafter', 'insertbefore'],
+                ['name', 'jobs'],
+                ['job', 'jobs'],
             ]
     )
 
@@ -562,6 +750,7 @@ def main():
     env          = module.params['env']
     insertafter  = module.params['insertafter']
     insertbefore = module.params['insertbefore']
+    jobs         = module.params['jobs']
     do_install   = state == 'present'
 
     changed      = False
@@ -586,22 +775,16 @@ def main():
 
     # --- user input validation ---
 
-    if (special_time or reboot) and \
-       (True in [(x != '*') for x in [minute, hour, day, month, weekday]]):
-        module.fail_json(msg="You must specify time and date fields or special time.")
-
-    if cron_file and do_install:
+    if cron_file and (do_install or jobs is not None):
         if not user:
             module.fail_json(msg="To use cron_file=... parameter you must specify user=... as well")
 
-    if job is None and do_install:
-        module.fail_json(msg="You must specify 'job' to install a new cron job or variable")
-
-    if (insertafter or insertbefore) and not env and do_install:
-        module.fail_json(msg="Insertafter and insertbefore parameters are valid only with env=yes")
-
-    if reboot:
-        special_time = "reboot"
+    if jobs is not None:
+        jobs = [ get_job_params(module, entry) for entry in jobs ]
+        for params in jobs:
+            params['special_time'] = validate_job(module, params)
+    else:
+        special_time = validate_job(module, module.params)
 
     # if requested make a backup before making a change
     if backup and not module.check_mode:
@@ -609,7 +792,7 @@ def main():
         crontab.write(backup_file)
 
 
-    if crontab.cron_file and not name and not do_install:
+    if crontab.cron_file and not name and not do_install and jobs is None:
         if module._diff:
             diff['after'] = ''
             diff['after_header'] = '/dev/null'
@@ -621,9 +804,9 @@ def main():
             changed = crontab.remove_job_file()
         module.exit_json(changed=changed,cron_file=cron_file,state=state,diff=diff)
 
-    if env:
-        if ' ' in name:
-            module.fail_json(msg="Invalid name for environment variable")
+    if jobs is not None:
+        changed = apply_jobs(module, crontab, jobs)
+    elif env:
         decl = '%s="%s"' % (name, job)
         old_decl = crontab.find_env(name)
 
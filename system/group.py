@@ -29,9 +29,23 @@ description:
     - Manage presence of groups on a host.
 options:
     name:
-        required: true
+        required: false
+        description:
+            - Name of the group to manage. B(One of name and groups is required.)
+    groups:
+        required: false
+        version_added: "2.1"
         description:
-            - Name of the group to manage.
+            - List of groups to manage in one go, instead of a single I(name).
+              Each entry is either a group name or a dict with a C(name) and
+              any of I(gid), I(state) and I(system). Options that are not set
+              in an entry default to the ones given to the module.
+            - The local group files are read once to work out what has to
+              change. On Linux, the groups to add are then written to
+              C(/etc/group) and C(/etc/gshadow) in one go, under the same
+              locks C(groupadd) takes, instead of running C(groupadd) for each
+              of them. Changes of gid, removals and the other platforms still
+              use the usual tools, one group at a time.
     gid:
         required: false
         description:
@@ -54,10 +68,218 @@ options:
 EXAMPLES = '''
 # Example group command from Ansible Playbooks
 - group: name=somegroup state=present
+
+# Create a set of system groups and make sure an old one is gone
+- group:
+    system: yes
+    groups:
+      - audit
+      - { name: backup, gid: 990 }
+      - { name: legacy, state: absent }
 '''
 
+import errno
 import grp
+import os
 import platform
+import re
+import tempfile
+
+HAS_LCKPWDF = False
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    # raises AttributeError on platforms without the shadow locking calls
+    _libc.lckpwdf
+    _libc.ulckpwdf
+    HAS_LCKPWDF = True
+except (ImportError, OSError, AttributeError):
+    pass
+
+
+class GroupFiles(object):
+    """
+    The local group database, read from the group and gshadow files in
+    one pass. Used by the groups list mode to look groups up and work out
+    the changes to make, instead of asking NSS about every group.
+
+    Entries are kept in the same form as grp.getgrnam() returns them.
+    """
+
+    GROUPFILE = '/etc/group'
+    GSHADOWFILE = '/etc/gshadow'
+    LOGINDEFS = '/etc/login.defs'
+
+    def __init__(self):
+        self.load()
+
+    def load(self):
+        self.group_lines = self._read_lines(self.GROUPFILE) or []
+        self.gshadow_lines = self._read_lines(self.GSHADOWFILE)
+        self.groups = {}
+        self.gids = set()
+        for line in self.group_lines:
+            fields = line.split(':')
+            if len(fields) != 4 or fields[0].startswith('+') or fields[0].startswith('-'):
+                # NIS compat entries and garbage
+                continue
+            try:
+                gid = int(fields[2])
+            except ValueError:
+                continue
+            members = [ m for m in fields[3].split(',') if m ]
+            self.groups.setdefault(fields[0], [fields[0], fields[1], gid, members])
+            self.gids.add(gid)
+
+    def _read_lines(self, path):
+        try:
+            f = open(path)
+        except IOError:
+            return None
+        try:
+            return f.read().splitlines()
+        finally:
+            f.close()
+
+    def get(self, name):
+        """ Returns the entry of the group name, or None """
+        info = self.groups.get(name)
+        if info is None:
+            return None
+        return list(info)
+
+    def gid_in_use(self, gid):
+        if gid in self.gids:
+            return True
+        try:
+            grp.getgrgid(gid)
+            return True
+        except KeyError:
+            return False
+
+    def login_defs(self):
+        defs = {}
+        for line in self._read_lines(self.LOGINDEFS) or []:
+            fields = line.split()
+            if len(fields) >= 2 and not fields[0].startswith('#'):
+                defs[fields[0]] = fields[1]
+        return defs
+
+    def allocate_gid(self, system):
+        """
+        Pick a free gid the way groupadd does, the next one above the
+        highest used in the GID_MIN-GID_MAX range of login.defs, or the
+        highest free one in the SYS_GID_MIN-SYS_GID_MAX range for system
+        groups. Returns None if the range is full.
+        """
+        defs = self.login_defs()
+        try:
+            gid_min = int(defs.get('GID_MIN', 1000))
+            gid_max = int(defs.get('GID_MAX', 60000))
+            sys_min = int(defs.get('SYS_GID_MIN', 101))
+            sys_max = int(defs.get('SYS_GID_MAX', gid_min - 1))
+        except ValueError:
+            return None
+        if system:
+            candidates = xrange(sys_max, sys_min - 1, -1)
+        else:
+            used = [ gid for gid in self.gids if gid_min <= gid <= gid_max ]
+            if used and max(used) < gid_max:
+                candidates = xrange(max(used) + 1, gid_max + 1)
+            else:
+                candidates = xrange(gid_min, gid_max + 1)
+        for gid in candidates:
+            if not self.gid_in_use(gid):
+                return gid
+        return None
+
+    def add(self, name, gid):
+        if self.gshadow_lines is not None:
+            self.group_lines.append('%s:x:%d:' % (name, gid))
+            self.gshadow_lines.append('%s:!::' % name)
+        else:
+            self.group_lines.append('%s:!:%d:' % (name, gid))
+        self.groups[name] = [name, 'x', gid, []]
+        self.gids.add(gid)
+
+    def write(self, module):
+        """ Replace the files with the current entries, atomically """
+        files = [(self.GROUPFILE, self.group_lines)]
+        if self.gshadow_lines is not None:
+            files.append((self.GSHADOWFILE, self.gshadow_lines))
+        for (path, lines) in files:
+            fd, tmp = tempfile.mkstemp(prefix='.ansible_', dir=os.path.dirname(path))
+            try:
+                os.write(fd, '\n'.join(lines) + '\n')
+            finally:
+                os.close(fd)
+            module.atomic_move(tmp, path)
+
+
+class ShadowLock(object):
+    """
+    Takes the locks shadow-utils takes before changing the group files,
+    lckpwdf() and a <file>.lock for each file, created through a link so
+    it is atomic, holding our pid so stale locks can be broken.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.held = []
+        self.pwdf = False
+
+    def acquire(self):
+        if _libc.lckpwdf() != 0:
+            return False
+        self.pwdf = True
+        for path in self.paths:
+            if not self._lock_file(path + '.lock'):
+                self.release()
+                return False
+            self.held.append(path + '.lock')
+        return True
+
+    def _lock_file(self, lock):
+        tmp = '%s.%d' % (lock, os.getpid())
+        f = open(tmp, 'w')
+        try:
+            f.write('%d' % os.getpid())
+        finally:
+            f.close()
+        try:
+            for attempt in (1, 2):
+                try:
+                    os.link(tmp, lock)
+                    return True
+                except OSError:
+                    pass
+                # break the lock if the process holding it is gone
+                try:
+                    f = open(lock)
+                    try:
+                        pid = int(f.read().strip())
+                    finally:
+                        f.close()
+                    os.kill(pid, 0)
+                    return False
+                except (IOError, ValueError):
+                    return False
+                except OSError, e:
+                    if e.errno != errno.ESRCH:
+                        return False
+                    os.unlink(lock)
+            return False
+        finally:
+            os.unlink(tmp)
+
+    def release(self):
+        for lock in self.held:
+            os.unlink(lock)
+        self.held = []
+        if self.pwdf:
+            _libc.ulckpwdf()
+            self.pwdf = False
 
 class Group(object):
     """
@@ -69,6 +291,9 @@ class Group(object):
       - group_add()
       - group_mod()
 
+    Subclasses may also override group_add_many() to add many groups at
+    once, the generic version runs group_add() for each of them.
+
     All subclasses MUST define platform and distribution (which may be None).
     """
 
@@ -79,12 +304,20 @@ class Group(object):
     def __new__(cls, *args, **kwargs):
         return load_platform_subclass(Group, args, kwargs)
 
-    def __init__(self, module):
+    def __init__(self, module, params=None, files=None):
+        # params defaults to the module parameters, an entry of the groups
+        # list passes its own, along with the GroupFiles shared by all
+        if params is None:
+            params = module.params
+        if self.GROUPFILE is None:
+            # groups do not live in the files on this platform
+            files = None
         self.module     = module
-        self.state      = module.params['state']
-        self.name       = module.params['name']
-        self.gid        = module.params['gid']
-        self.system     = module.params['system']
+        self.files      = files
+        self.state      = params['state']
+        self.name       = params['name']
+        self.gid        = params['gid']
+        self.system     = params['system']
 
     def execute_command(self, cmd):
         return self.module.run_command(cmd)
@@ -104,6 +337,13 @@ class Group(object):
         cmd.append(self.name)
         return self.execute_command(cmd)
 
+    def group_add_many(self, groups):
+        """ Add the groups, returns the (rc, out, err) of each one """
+        results = []
+        for group in groups:
+            results.append(group.group_add(gid=group.gid, system=group.system))
+        return results
+
     def group_mod(self, **kwargs):
         cmd = [self.module.get_bin_path('groupmod', True)]
         info = self.group_info()
@@ -120,6 +360,8 @@ class Group(object):
         return self.execute_command(cmd)
 
     def group_exists(self):
+        if self.files is not None and self.files.get(self.name) is not None:
+            return True
         try:
             if grp.getgrnam(self.name):
                 return True
@@ -127,6 +369,10 @@ class Group(object):
             return False
 
     def group_info(self):
+        if self.files is not None:
+            info = self.files.get(self.name)
+            if info is not None:
+                return info
         if not self.group_exists():
             return False
         try:
@@ -137,6 +383,81 @@ class Group(object):
 
 # ===========================================
 
+class LinuxGroup(Group):
+    """
+    This is a Linux Group manipulation class. It uses the generic
+    commands, except that many groups are added by writing them to the
+    group files directly.
+
+    This overrides the following methods from the generic class:-
+      - group_add_many()
+    """
+
+    platform = 'Linux'
+    distribution = None
+
+    # what groupadd accepts by default, other names are left to it
+    NAME_RE = re.compile(r'^[a-z_][a-z0-9_-]*[$]?$')
+
+    def group_add_many(self, groups):
+        files = self.files
+        if (not HAS_LCKPWDF or files is None or len(groups) < 2
+                or not os.access(os.path.dirname(files.GROUPFILE), os.W_OK)):
+            return Group.group_add_many(self, groups)
+
+        direct = [ g for g in groups if len(g.name) <= 32 and self.NAME_RE.match(g.name) ]
+        results = dict([ (g.name, None) for g in groups ])
+
+        lock = ShadowLock([ path for path in (files.GROUPFILE, files.GSHADOWFILE) if os.path.exists(path) ])
+        if not lock.acquire():
+            return Group.group_add_many(self, groups)
+        try:
+            # the files may have changed since they were read
+            files.load()
+            for group in direct:
+                if files.get(group.name) is not None:
+                    results[group.name] = (1, '', "group '%s' already exists\n" % group.name)
+                    continue
+                if group.gid is not None:
+                    try:
+                        gid = int(group.gid)
+                    except ValueError:
+                        gid = -1
+                    if gid < 0:
+                        # what groupadd says of it
+                        results[group.name] = (3, '', "invalid gid '%s'\n" % group.gid)
+                        continue
+                    if files.gid_in_use(gid):
+                        results[group.name] = (4, '', "GID '%d' already exists\n" % gid)
+                        continue
+                else:
+                    gid = files.allocate_gid(group.system)
+                    if gid is None:
+                        results[group.name] = (4, '', "Can't get unique GID (no more available GIDs)\n")
+                        continue
+                files.add(group.name, gid)
+                results[group.name] = (0, '', '')
+            try:
+                files.write(self.module)
+            except (IOError, OSError), e:
+                self.module.fail_json(msg="failed to write the group files: %s" % e)
+        finally:
+            lock.release()
+
+        # the name service caches do not notice files written behind their back
+        for cmd in (['nscd', '-i', 'group'], ['sss_cache', '-G']):
+            path = self.module.get_bin_path(cmd[0])
+            if path:
+                self.execute_command([path] + cmd[1:])
+
+        # whatever could not be written directly is left to groupadd
+        for group in groups:
+            if results[group.name] is None:
+                results[group.name] = group.group_add(gid=group.gid, system=group.system)
+        return [ results[g.name] for g in groups ]
+
+# ===========================================
+
 class SunOS(Group):
     """
     This is a SunOS Group manipulation class. Solaris doesn't have
@@ -263,6 +584,7 @@ class DarwinGroup(Group):
 
     platform = 'Darwin'
     distribution = None
+    GROUPFILE = None
 
     def group_add(self, **kwargs):
         cmd = [self.module.get_bin_path('dseditgroup', True)]
@@ -376,17 +698,104 @@ class NetBsdGroup(Group):
 
 # ===========================================
 
+def get_group_params(module, entry):
+    """
+    Merge an entry of the groups list with the module parameters, which
+    act as the defaults for every group
+    """
+    if isinstance(entry, basestring):
+        entry = dict(name=entry)
+    if not isinstance(entry, dict) or not entry.get('name'):
+        module.fail_json(msg="each of the groups must be a group name or a dict with a name, got %s" % entry)
+
+    params = dict(module.params)
+    del params['groups']
+    for (key, value) in entry.items():
+        if key not in params:
+            module.fail_json(msg="unsupported option %s for group %s" % (key, entry['name']))
+        if value is not None:
+            if key == 'system':
+                value = module.boolean(value)
+            else:
+                value = str(value)
+        if key == 'state' and value not in ('present', 'absent'):
+            module.fail_json(msg="value of state must be one of: present, absent, got: %s" % value)
+        params[key] = value
+    return params
+
+def manage_groups(module, entries):
+    """
+    Manage a list of groups, looking them up in the group files read
+    once, and adding all the missing ones in one go at the end
+    """
+    files = GroupFiles()
+    groups = []
+    for entry in entries:
+        group = Group(module, get_group_params(module, entry), files)
+        if group.name in [ g.name for g in groups ]:
+            module.fail_json(msg="group %s is listed more than once" % group.name)
+        groups.append(group)
+
+    results = []
+    to_add = []
+    ran_commands = False
+    for group in groups:
+        rc = None
+        result = dict(name=group.name, state=group.state, changed=False)
+        if group.state == 'absent':
+            if group.group_exists():
+                result['changed'] = True
+                if not module.check_mode:
+                    (rc, out, err) = group.group_del()
+        else:
+            if not group.group_exists():
+                result['changed'] = True
+                to_add.append(group)
+            else:
+                (rc, out, err) = group.group_mod(gid=group.gid)
+        if rc is not None:
+            if rc != 0:
+                module.fail_json(name=group.name, msg=err)
+            result['changed'] = True
+            ran_commands = True
+        results.append(result)
+
+    if to_add and not module.check_mode:
+        if ran_commands:
+            files.load()
+        for (group, (rc, out, err)) in zip(to_add, to_add[0].group_add_many(to_add)):
+            if rc is not None and rc != 0:
+                module.fail_json(name=group.name, msg=err)
+        ran_commands = True
+
+    if ran_commands:
+        files.load()
+    for (group, result) in zip(groups, results):
+        info = group.group_info()
+        if info:
+            result['system'] = group.system
+            result['gid'] = info[2]
+
+    changed = bool([ r for r in results if r['changed'] ])
+    module.exit_json(changed=changed, groups=results)
+
 def main():
     module = AnsibleModule(
         argument_spec = dict(
             state=dict(default='present', choices=['present', 'absent'], type='str'),
-            name=dict(required=True, type='str'),
+            name=dict(default=None, type='str'),
+            groups=dict(default=None, type='list'),
             gid=dict(default=None, type='str'),
             system=dict(default=False, type='bool'),
         ),
+        required_one_of=[['name', 'groups']],
+        mutually_exclusive=[['name', 'groups']],
         supports_check_mode=True
     )
 
+    if module.params['groups'] is not None:
+        manage_groups(module, module.params['groups'])
+
     group = Group(module)
 
     module.debug('Group instantiated - platform %s' % group.platform)
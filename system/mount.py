@@ -31,15 +31,16 @@ options:
   name:
     description:
       - "path to the mount point, eg: C(/mnt/files)"
-    required: true
+      - B(One of name and mounts is required.)
+    required: false
   src:
     description:
-      - device to be mounted on I(name).
-    required: true
+      - device to be mounted on I(name). Required with C(state=present) and C(state=mounted).
+    required: false
   fstype:
     description:
-      - file-system type
-    required: true
+      - file-system type. Required with C(state=present) and C(state=mounted).
+    required: false
   opts:
     description:
       - mount options (see fstab(5))
@@ -61,7 +62,8 @@ options:
       - C(absent) and C(present) only deal with I(fstab) but will not affect current mounting.
       - If specifying C(mounted) and the mount point is not present, the mount point will be created. Similarly.
       - Specifying C(absent) will remove the mount point directory.
-    required: true
+      - Required, unless every entry of I(mounts) sets its own.
+    required: false
     choices: [ "present", "absent", "mounted", "unmounted" ]
   fstab:
     description:
@@ -70,6 +72,21 @@ options:
         you need to configure mountpoints in a chroot environment.
     required: false
     default: /etc/fstab
+  mounts:
+    description:
+      - List of mount points to manage in one go, instead of a single
+        I(name). Each entry is a dict with a C(name) and any of I(src),
+        I(fstype), I(opts), I(dump), I(passno) and I(state). Options that
+        are not set in an entry default to the ones given to the module.
+      - I(fstab) is read and written once for all of them.
+    required: false
+    default: null
+    version_added: "2.1"
+notes:
+  - On Linux, the live mounts are read from C(/proc/self/mountinfo), and a
+    mount point whose fstab entry changed is only remounted when its live
+    options differ from the new ones. Changes to I(src) or I(fstype) are
+    only applied the next time the mount point is mounted, as before.
 
 author:
     - Ansible Core Team
@@ -84,8 +101,20 @@ EXAMPLES = '''
 
 # Mount up device by UUID
 - mount: name=/home src='UUID=b3e48f45-f933-4c8e-a700-22a159ec9077' fstype=xfs opts=noatime state=present
+
+# Mount several data disks at once
+- mount:
+    fstype: xfs
+    opts: noatime,nodiratime
+    state: mounted
+    mounts:
+      - { name: /srv/data01, src: 'LABEL=data01' }
+      - { name: /srv/data02, src: 'LABEL=data02' }
+      - { name: /srv/old, state: absent }
 '''
 
+import os
+import re
 
 def write_fstab(lines, dest):
 
@@ -100,123 +129,152 @@ def _escape_fstab(v):
     """ escape space (040), ampersand (046) and backslash (134) which are invalid in fstab fields """
     return v.replace('\\', '\\134').replace(' ', '\\040').replace('&', '\\046')
 
-def set_mount(module, **kwargs):
-    """ set/change a mount point location in fstab """
-
-    # kwargs: name, src, fstype, opts, dump, passno, state, fstab=/etc/fstab
-    args = dict(
-        opts   = 'defaults',
-        dump   = '0',
-        passno = '0',
-        fstab  = '/etc/fstab'
-    )
-    args.update(kwargs)
-
-    # save the mount name before space replacement
-    origname =  args['name']
-    # replace any space in mount name with '\040' to make it fstab compatible (man fstab)
-    args['name'] = args['name'].replace(' ', r'\040')
-
-    new_line = '%(src)s %(name)s %(fstype)s %(opts)s %(dump)s %(passno)s\n'
-
-    to_write = []
-    exists = False
-    changed = False
-    escaped_args = dict([(k, _escape_fstab(v)) for k, v in args.iteritems()])
-    for line in open(args['fstab'], 'r').readlines():
-        if not line.strip():
-            to_write.append(line)
-            continue
-        if line.strip().startswith('#'):
-            to_write.append(line)
-            continue
+def _unescape_mountinfo(v):
+    """ the kernel escapes space, tab, newline and backslash as octal """
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), v)
+
+
+class Fstab(object):
+    """
+    An fstab file read once, with its entries indexed by mount point, so
+    that any number of mount points can be set or unset before writing it
+    back once. Lines that are not changed are written back as they were.
+    """
+
+    FIELDS = ('src', 'name', 'fstype', 'opts', 'dump', 'passno')
+    NEW_LINE = '%(src)s %(name)s %(fstype)s %(opts)s %(dump)s %(passno)s\n'
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        f = open(path, 'r')
+        self.lines = f.readlines()
+        f.close()
+        self.index = {}
+        for (i, line) in enumerate(self.lines):
+            ld = self._parse(line)
+            if ld is not None:
+                self.index.setdefault(ld['name'], []).append(i)
+
+    def _parse(self, line):
+        if not line.strip() or line.strip().startswith('#'):
+            return None
         if len(line.split()) != 6:
             # not sure what this is or why it is here
             # but it is not our fault so leave it be
-            to_write.append(line)
-            continue
-
-        ld = {}
-        ld['src'], ld['name'], ld['fstype'], ld['opts'], ld['dump'], ld['passno']  = line.split()
-
-        if ld['name'] != escaped_args['name']:
-            to_write.append(line)
-            continue
-
-        # it exists - now see if what we have is different
-        exists = True
-        for t in ('src', 'fstype','opts', 'dump', 'passno'):
-            if ld[t] != escaped_args[t]:
+            return None
+        return dict(zip(self.FIELDS, line.split()))
+
+    def set(self, args):
+        """ set/change a mount point location, returns whether it changed """
+        escaped = dict([ (k, _escape_fstab(args[k])) for k in self.FIELDS ])
+        changed = False
+        positions = self.index.get(escaped['name'])
+        if not positions:
+            if self.lines and not self.lines[-1].endswith('\n'):
+                self.lines[-1] += '\n'
+            self.index[escaped['name']] = [len(self.lines)]
+            self.lines.append(self.NEW_LINE % escaped)
+            changed = True
+        for i in positions or []:
+            ld = self._parse(self.lines[i])
+            if [ ld[t] for t in self.FIELDS ] != [ escaped[t] for t in self.FIELDS ]:
+                self.lines[i] = self.NEW_LINE % escaped
                 changed = True
-                ld[t] = escaped_args[t]
-
-        if changed:
-            to_write.append(new_line % ld)
-        else:
-            to_write.append(line)
-
-    if not exists:
-        to_write.append(new_line % args)
-        changed = True
-
-    if changed and not module.check_mode:
-        write_fstab(to_write, args['fstab'])
-
-    # mount function needs origname
-    return (origname, changed)
-
-
-def unset_mount(module, **kwargs):
-    """ remove a mount point from fstab """
-
-    # kwargs: name, src, fstype, opts, dump, passno, state, fstab=/etc/fstab
-    args = dict(
-        opts   = 'default',
-        dump   = '0',
-        passno = '0',
-        fstab  = '/etc/fstab'
-    )
-    args.update(kwargs)
-
-    # save the mount name before space replacement
-    origname =  args['name']
-    # replace any space in mount name with '\040' to make it fstab compatible (man fstab)
-    args['name'] = args['name'].replace(' ', r'\040')
-
-    to_write = []
-    changed = False
-    escaped_name = _escape_fstab(args['name'])
-    for line in open(args['fstab'], 'r').readlines():
-        if not line.strip():
-            to_write.append(line)
-            continue
-        if line.strip().startswith('#'):
-            to_write.append(line)
-            continue
-        if len(line.split()) != 6:
-            # not sure what this is or why it is here
-            # but it is not our fault so leave it be
-            to_write.append(line)
-            continue
-
-        ld = {}
-        ld['src'], ld['name'], ld['fstype'], ld['opts'], ld['dump'], ld['passno']  = line.split()
-
-        if ld['name'] != escaped_name:
-            to_write.append(line)
-            continue
-
-        # if we got here we found a match - continue and mark changed
-        changed = True
-
-    if changed and not module.check_mode:
-        write_fstab(to_write, args['fstab'])
-
-    # umount needs origname
-    return (origname, changed)
-
-
-def mount(module, **kwargs):
+        self.changed = self.changed or changed
+        return changed
+
+    def unset(self, name):
+        """ remove a mount point, returns whether it was there """
+        positions = self.index.pop(_escape_fstab(name), [])
+        for i in positions:
+            self.lines[i] = None
+        self.changed = self.changed or bool(positions)
+        return bool(positions)
+
+    def write(self):
+        write_fstab([ l for l in self.lines if l is not None ], self.path)
+
+
+class MountInfo(object):
+    """
+    The live mounts of the host, read once from /proc/self/mountinfo and
+    indexed by mount point. load() returns None where there is no
+    mountinfo, and callers fall back to os.path.ismount().
+    """
+
+    MOUNTINFO = '/proc/self/mountinfo'
+
+    # only known to mount(8), never shown as live options
+    USERSPACE_OPTS = frozenset(['defaults', 'auto', 'noauto', 'user', 'nouser', 'users',
+                                'owner', 'group', '_netdev', 'nofail', 'bind', 'rbind', 'loop'])
+    # flags remount sets or clears; the kernel only shows the first ones
+    FLAGS = { 'ro': 'rw', 'nosuid': 'suid', 'nodev': 'dev', 'noexec': 'exec', 'sync': 'async',
+              'noatime': 'atime', 'nodiratime': 'diratime', 'mand': 'nomand' }
+    DEFAULTS = ('rw', 'suid', 'dev', 'exec', 'async')
+
+    def __init__(self, lines):
+        self.mounts = {}
+        for line in lines:
+            fields = line.split()
+            try:
+                sep = fields.index('-', 6)
+            except ValueError:
+                continue
+            # a later entry for the same mount point is mounted over the earlier ones
+            self.mounts[_unescape_mountinfo(fields[4])] = dict(
+                fstype = fields[sep + 1],
+                src    = _unescape_mountinfo(fields[sep + 2]),
+                opts   = set(fields[5].split(',')) | set(fields[sep + 3].split(',')),
+            )
+
+    @classmethod
+    def load(cls):
+        try:
+            f = open(cls.MOUNTINFO)
+        except IOError:
+            return None
+        try:
+            return cls(f.readlines())
+        finally:
+            f.close()
+
+    def get(self, name):
+        return self.mounts.get(os.path.realpath(name))
+
+    def is_mounted(self, name):
+        return self.get(name) is not None
+
+    def satisfies(self, name, opts):
+        """
+        Whether remounting name with opts would leave its options as they
+        are, in which case the remount can be skipped
+        """
+        live = self.get(name)
+        if live is None:
+            return False
+        wanted = set()
+        for opt in (opts or 'defaults').split(','):
+            if opt == 'defaults':
+                wanted.update(self.DEFAULTS)
+            elif opt and opt not in self.USERSPACE_OPTS and not (opt.startswith('x-') or
+                    opt.startswith('comment=') or opt.startswith('loop=')):
+                wanted.add(opt)
+        for opt in wanted:
+            if opt in live['opts']:
+                continue
+            # options that are on by default only show up when turned off
+            if opt in self.FLAGS.values() and [ f for f in self.FLAGS if self.FLAGS[f] == opt and f not in live['opts'] ]:
+                continue
+            return False
+        # and remount would turn off the flags set now but no longer wanted
+        for flag in self.FLAGS:
+            if flag in live['opts'] and flag not in wanted:
+                return False
+        return True
+
+
+def mount(module, remount=None, **kwargs):
     """ mount up a path or remount if needed """
 
     # kwargs: name, src, fstype, opts, dump, passno, state, fstab=/etc/fstab
@@ -234,7 +292,9 @@ def mount(module, **kwargs):
     
     cmd = [ mount_bin, ]
     
-    if os.path.ismount(name):
+    if remount is None:
+        remount = os.path.ismount(name)
+    if remount:
         cmd += [ '-o', 'remount', ]
 
     if get_platform().lower() == 'freebsd':
@@ -261,57 +321,70 @@ def umount(module, **kwargs):
     else:
         return rc, out+err
 
-def main():
-
-    module = AnsibleModule(
-        argument_spec = dict(
-            state  = dict(required=True, choices=['present', 'absent', 'mounted', 'unmounted']),
-            name   = dict(required=True),
-            opts   = dict(default=None),
-            passno = dict(default=None),
-            dump   = dict(default=None),
-            src    = dict(required=True),
-            fstype = dict(required=True),
-            fstab  = dict(default='/etc/fstab')
-        ),
-        supports_check_mode=True
-    )
-
-
-    changed = False
-    rc = 0
-    args = {
-        'name': module.params['name'],
-        'src': module.params['src'],
-        'fstype': module.params['fstype']
-    }
-    if module.params['passno'] is not None:
-        args['passno'] = module.params['passno']
-    if module.params['opts'] is not None:
-        args['opts'] = module.params['opts']
-    if module.params['dump'] is not None:
-        args['dump'] = module.params['dump']
-    if module.params['fstab'] is not None:
-        args['fstab'] = module.params['fstab']
-
-    # if fstab file does not exist, we first need to create it. This mainly
-    # happens when fstab optin is passed to the module.
-    if not os.path.exists(args['fstab']):
-        if not os.path.exists(os.path.dirname(args['fstab'])):
-            os.makedirs(os.path.dirname(args['fstab']))
-        open(args['fstab'],'a').close()
+def get_mount_args(module, params):
+    """ the fstab fields of a mount point, from the module or an entry of mounts """
+    args = { 'name': params['name'] }
+    for key in ('src', 'fstype', 'passno', 'opts', 'dump', 'fstab'):
+        if params.get(key) is not None:
+            args[key] = params[key]
+    if params['state'] is None:
+        module.fail_json(msg="state is required for %s" % args['name'])
+    if params['state'] in ['mounted', 'present']:
+        missing = [ k for k in ('src', 'fstype') if k not in args ]
+        if missing:
+            module.fail_json(msg="missing required arguments: %s" % ','.join(missing))
+    return args
+
+def get_entry_params(module, entry):
+    """
+    Merge an entry of the mounts list with the module parameters, which
+    act as the defaults for every mount point
+    """
+    if not isinstance(entry, dict) or not entry.get('name'):
+        module.fail_json(msg="each of the mounts must be a dict with a name, got %s" % entry)
+    params = dict(module.params)
+    del params['mounts']
+    for (key, value) in entry.items():
+        if key not in params or key == 'fstab':
+            module.fail_json(msg="unsupported option %s for mount %s" % (key, entry['name']))
+        if value is not None:
+            value = str(value)
+        if key == 'state' and value not in ['present', 'absent', 'mounted', 'unmounted']:
+            module.fail_json(msg="value of state must be one of: present, absent, mounted, unmounted, got: %s" % value)
+        params[key] = value
+    return params
+
+def update_fstab(fstab, state, args):
+    """ make the fstab changes of a mount point, returns whether it changed """
 
     # absent == remove from fstab and unmounted
     # unmounted == do not change fstab state, but unmount
     # present == add to fstab, do not change mount state
     # mounted == add to fstab if not there and make sure it is mounted, if it has changed in fstab then remount it
 
-    state = module.params['state']
-    name  = module.params['name']
     if state == 'absent':
-        name, changed = unset_mount(module, **args)
+        return fstab.unset(args['name'])
+    if state in ['mounted', 'present']:
+        fields = dict(opts='defaults', dump='0', passno='0')
+        fields.update(args)
+        return fstab.set(fields)
+    return False
+
+def update_mount(module, live, state, args, changed):
+    """
+    make the live mount of a mount point match its state, once fstab is
+    written. changed tells whether its fstab entry changed, returns
+    whether anything changed
+    """
+    name = args['name']
+    if live is not None:
+        mounted = live.is_mounted(name)
+    else:
+        mounted = os.path.ismount(name)
+
+    if state == 'absent':
         if changed and not module.check_mode:
-            if os.path.ismount(name):
+            if mounted:
                 res,msg  = umount(module, **args)
                 if res:
                     module.fail_json(msg="Error unmounting %s: %s" % (name, msg))
@@ -321,57 +394,102 @@ def main():
                     os.rmdir(name)
                 except (OSError, IOError), e:
                     module.fail_json(msg="Error rmdir %s: %s" % (name, str(e)))
-
-        module.exit_json(changed=changed, **args)
+        return changed
 
     if state == 'unmounted':
-        if os.path.ismount(name):
+        if mounted:
             if not module.check_mode:
                 res,msg  = umount(module, **args)
                 if res:
                     module.fail_json(msg="Error unmounting %s: %s" % (name, msg))
             changed = True
+        return changed
+
+    if state == 'mounted':
+        if not os.path.exists(name) and not module.check_mode:
+            try:
+                os.makedirs(name)
+            except (OSError, IOError), e:
+                module.fail_json(msg="Error making dir %s: %s" % (name, str(e)))
+
+        res = 0
+        if mounted:
+            # only remount when it would change the live options
+            if changed and not module.check_mode and not (live is not None and live.satisfies(name, args.get('opts'))):
+                res,msg = mount(module, True, **args)
+        elif live is None and 'bind' in args.get('opts', []):
+            changed = True
+            cmd = 'mount -l'
+            rc, out, err = module.run_command(cmd)
+            allmounts = out.split('\n')
+            for mounts in allmounts[:-1]:
+                arguments = mounts.split()
+                if arguments[0] == args['src'] and arguments[2] == args['name'] and arguments[4] == args['fstype']:
+                    changed = False
+            if changed:
+                res,msg = mount(module, **args)
+        else:
+            changed = True
+            if not module.check_mode:
+                res,msg = mount(module, False, **args)
 
-        module.exit_json(changed=changed, **args)
+        if res:
+            module.fail_json(msg="Error mounting %s: %s" % (name, msg))
 
-    if state in ['mounted', 'present']:
-        if state == 'mounted':
-            if not os.path.exists(name) and not module.check_mode:
-                try:
-                    os.makedirs(name)
-                except (OSError, IOError), e:
-                    module.fail_json(msg="Error making dir %s: %s" % (name, str(e)))
-
-        name, changed = set_mount(module, **args)
-        if state == 'mounted':
-            res = 0
-            if os.path.ismount(name):
-                if changed and not module.check_mode:
-                    res,msg = mount(module, **args)
-            elif 'bind' in args.get('opts', []):
-                changed = True
-                cmd = 'mount -l'
-                rc, out, err = module.run_command(cmd)
-                allmounts = out.split('\n')
-                for mounts in allmounts[:-1]:
-                    arguments = mounts.split()
-                    if arguments[0] == args['src'] and arguments[2] == args['name'] and arguments[4] == args['fstype']:
-                        changed = False
-                if changed:
-                    res,msg = mount(module, **args)
-            else:
-                changed = True
-                if not module.check_mode:
-                    res,msg = mount(module, **args)
+    return changed
 
+def main():
 
-            if res:
-                module.fail_json(msg="Error mounting %s: %s" % (name, msg))
-
+    module = AnsibleModule(
+        argument_spec = dict(
+            state  = dict(required=False, choices=['present', 'absent', 'mounted', 'unmounted']),
+            name   = dict(required=False),
+            opts   = dict(default=None),
+            passno = dict(default=None),
+            dump   = dict(default=None),
+            src    = dict(required=False),
+            fstype = dict(required=False),
+            fstab  = dict(default='/etc/fstab'),
+            mounts = dict(required=False, type='list'),
+        ),
+        required_one_of=[['name', 'mounts']],
+        mutually_exclusive=[['name', 'mounts']],
+        supports_check_mode=True
+    )
 
-        module.exit_json(changed=changed, **args)
+    if module.params['mounts'] is not None:
+        entries = [ get_entry_params(module, entry) for entry in module.params['mounts'] ]
+    else:
+        entries = [ module.params ]
+    mounts = [ (params['state'], get_mount_args(module, params)) for params in entries ]
+    fstab_path = module.params['fstab']
 
-    module.fail_json(msg='Unexpected position reached')
+    # if fstab file does not exist, we first need to create it. This mainly
+    # happens when fstab optin is passed to the module.
+    if not os.path.exists(fstab_path):
+        if not os.path.exists(os.path.dirname(fstab_path)):
+            os.makedirs(os.path.dirname(fstab_path))
+        open(fstab_path,'a').close()
+
+    # read fstab and the live mounts once, and write fstab once, before
+    # mounting anything
+    fstab = Fstab(fstab_path)
+    live = MountInfo.load()
+    fstab_changes = [ update_fstab(fstab, state, args) for (state, args) in mounts ]
+    if fstab.changed and not module.check_mode:
+        fstab.write()
+
+    results = []
+    for ((state, args), changed) in zip(mounts, fstab_changes):
+        changed = update_mount(module, live, state, args, changed)
+        results.append(dict(changed=changed, **args))
+
+    if module.params['mounts'] is None:
+        module.exit_json(**results[0])
+    for ((state, args), result) in zip(mounts, results):
+        result['state'] = state
+    changed = bool([ r for r in results if r['changed'] ])
+    module.exit_json(changed=changed, mounts=results)
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -31,9 +31,18 @@ description:
       OpenRC, SysV, Solaris SMF, systemd, upstart.
 options:
     name:
-        required: true
+        required: false
+        description:
+        - Name of the service. B(One of name and names is required.)
+    names:
+        required: false
+        version_added: "2.1"
         description:
-        - Name of the service.
+        - List of services to manage together, instead of a single I(name).
+          The state of all of them is read with a single C(systemctl show)
+          call, and the services needing the same change are changed with a
+          single C(systemctl) call. Only supported for services managed by systemd,
+          and cannot be combined with I(pattern) or I(arguments).
     state:
         required: false
         choices: [ started, stopped, restarted, reloaded ]
@@ -58,6 +67,24 @@ options:
           substring to look for as would be found in the output of the I(ps)
           command as a stand-in for a status result.  If the string is found,
           the service will be assumed to be running.
+        - On Linux the command line of each process is read from /proc
+          instead of running I(ps), stopping at the first match, so the
+          pattern only matches command lines and not the other I(ps) columns.
+    pattern_regex:
+        required: false
+        version_added: "2.1"
+        default: "no"
+        choices: [ "yes", "no" ]
+        description:
+        - Treat I(pattern) as a regular expression searched for in the
+          command line instead of a substring.
+    pidfile:
+        required: false
+        version_added: "2.1"
+        description:
+        - Path of a file containing the pid of the service. If the process
+          exists (and matches I(pattern), if given) the service is assumed to
+          be running, without looking at any other process.
     enabled:
         required: false
         choices: [ "yes", "no" ]
@@ -74,6 +101,10 @@ options:
         description:
         - Additional arguments provided on the command line
         aliases: [ 'args' ]
+notes:
+    - On Linux, the detected init system and service tool locations are cached
+      in C(/run/ansible-service-tools.json) (or C($XDG_RUNTIME_DIR) for other users
+      than root) until the next reboot or until software in the C(PATH) changes.
 '''
 
 EXAMPLES = '''
@@ -95,13 +126,23 @@ EXAMPLES = '''
 # Example action to start service foo, based on running process /usr/bin/foo
 - service: name=foo pattern=/usr/bin/foo state=started
 
+# Example action to start service foo, based on the pid in its pid file
+- service: name=foo pidfile=/var/run/foo.pid pattern='^/usr/bin/foo( |$)' pattern_regex=yes state=started
+
 # Example action to restart network service for interface eth0
 - service: name=network state=restarted args=eth0
 
+# Example action to start and enable several systemd services at once
+- service:
+    names: [ 'nginx', 'php-fpm', 'redis' ]
+    state: started
+    enabled: yes
+
 '''
 
 import platform
 import os
+import errno
 import re
 import tempfile
 import shlex
@@ -140,9 +181,12 @@ class Service(object):
     def __init__(self, module):
         self.module         = module
         self.name           = module.params['name']
+        self.names          = module.params['names']
         self.state          = module.params['state']
         self.sleep          = module.params['sleep']
         self.pattern        = module.params['pattern']
+        self.pattern_re     = None
+        self.pidfile        = module.params['pidfile']
         self.enable         = module.params['enabled']
         self.runlevel       = module.params['runlevel']
         self.changed        = False
@@ -159,6 +203,12 @@ class Service(object):
         self.rcconf_value   = None
         self.svc_change     = False
 
+        if self.pattern and module.params['pattern_regex']:
+            try:
+                self.pattern_re = re.compile(self.pattern)
+            except re.error, e:
+                module.fail_json(msg="invalid pattern regex %s: %s" % (self.pattern, e))
+
     # ===========================================
     # Platform specific methods (must be replaced by subclass).
 
@@ -174,6 +224,9 @@ class Service(object):
     def service_control(self):
         self.module.fail_json(msg="service_control not implemented on target platform")
 
+    def manage_units(self):
+        self.module.fail_json(msg="names is not supported on the target platform")
+
     # ===========================================
     # Generic methods that should be used on all platforms.
 
@@ -255,7 +308,93 @@ class Service(object):
                     data += dat
             return json.loads(data)
 
+    def pattern_matches(self, line):
+        if "pattern=" in line:
+            # so as to not confuse ./hacking/test-module
+            return False
+        if self.pattern_re:
+            return self.pattern_re.search(line) is not None
+        return self.pattern in line
+
+    def get_proc_cmdline(self, pid):
+        """
+        Return the command line of pid as ps would show it, or None if the
+        process does not exist (anymore)
+        """
+        try:
+            f = open('/proc/%s/cmdline' % pid)
+            try:
+                cmdline = f.read().replace('\0', ' ').strip()
+            finally:
+                f.close()
+            if not cmdline:
+                # kernel threads have no command line
+                f = open('/proc/%s/comm' % pid)
+                try:
+                    cmdline = '[%s]' % f.read().strip()
+                finally:
+                    f.close()
+        except IOError:
+            return None
+        return cmdline
+
+    def get_cmdline(self, pid):
+        if os.path.isdir('/proc/%s' % pid) and platform.system() == 'Linux':
+            return self.get_proc_cmdline(pid)
+        psbin = self.module.get_bin_path('ps', True)
+        (rc, psout, pserr) = self.execute_command('%s -p %d -o args' % (psbin, pid))
+        lines = psout.splitlines()
+        if rc != 0 or len(lines) < 2:
+            return None
+        return lines[1].strip()
+
+    def check_pidfile(self):
+        self.running = False
+        try:
+            f = open(self.pidfile)
+            try:
+                pid = int(f.readline().strip())
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            # no (valid) pid file, so not running
+            return
+        if pid <= 0:
+            # kill() would signal our process group, or everything
+            return
+
+        try:
+            # signal 0 only checks whether the process exists
+            os.kill(pid, 0)
+        except OSError, e:
+            if e.errno != errno.EPERM:
+                return
+
+        if self.pattern:
+            # make sure the pid was not reused by another process
+            cmdline = self.get_cmdline(pid)
+            self.running = cmdline is not None and self.pattern_matches(cmdline)
+        else:
+            self.running = True
+
+    def check_proc(self):
+        self.running = False
+        own_pid = str(os.getpid())
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit() or pid == own_pid:
+                continue
+            cmdline = self.get_proc_cmdline(pid)
+            if cmdline is not None and self.pattern_matches(cmdline):
+                self.running = True
+                break
+
     def check_ps(self):
+        if self.pidfile:
+            return self.check_pidfile()
+
+        if platform.system() == 'Linux' and os.path.isdir('/proc/self'):
+            return self.check_proc()
+
         # Set ps flags
         if platform.system() == 'SunOS':
             psflags = '-ef'
@@ -271,8 +410,7 @@ class Service(object):
             self.running = False
             lines = psout.split("\n")
             for line in lines:
-                if self.pattern in line and not "pattern=" in line:
-                    # so as to not confuse ./hacking/test-module
+                if self.pattern_matches(line):
                     self.running = True
                     break
 
@@ -377,6 +515,118 @@ class Service(object):
 # ===========================================
 # Subclass: Linux
 
+def get_boot_id():
+    try:
+        f = open('/proc/sys/kernel/random/boot_id')
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+class InitSystemCache(object):
+    """
+    Remembers the init system detection of LinuxService (tool locations,
+    whether systemd is running and the upstart version) in a runtime
+    directory, so later service tasks on the same host can skip it.
+
+    The cache is only valid for the boot it was written in, for the same
+    PATH, and as long as none of the searched directories was modified,
+    which happens when tools get installed or removed. In check mode the
+    cache is read but never written.
+    """
+
+    file_name = 'ansible-service-tools.json'
+
+    def __init__(self, search_dirs, check_mode=False):
+        self.path = None
+        self.key = None
+        self.data = None
+        self.check_mode = check_mode
+
+        boot_id = get_boot_id()
+        if boot_id is None:
+            return
+
+        if os.getuid() == 0:
+            runtime_dirs = [ '/run', '/var/run' ]
+        else:
+            runtime_dirs = [ os.environ.get('XDG_RUNTIME_DIR') ]
+        for runtime_dir in runtime_dirs:
+            if runtime_dir and os.path.isdir(runtime_dir) and os.access(runtime_dir, os.W_OK):
+                self.path = os.path.join(runtime_dir, self.file_name)
+                break
+
+        mtimes = []
+        for search_dir in search_dirs:
+            try:
+                mtimes.append(os.stat(search_dir).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        self.key = [ boot_id, os.environ.get('PATH', ''), search_dirs, mtimes ]
+
+    def load(self):
+        if self.path is None:
+            return None
+        try:
+            st = os.stat(self.path)
+            # never trust a file somebody else could have written
+            if st.st_uid != os.getuid() or st.st_mode & 022:
+                return None
+            f = open(self.path)
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('key') != self.key:
+            return None
+        self.data = data
+        return data
+
+    def save(self, data):
+        if self.path is None:
+            return
+        data = dict(data, key=self.key)
+        self.data = data
+        if self.check_mode:
+            return
+        try:
+            (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.%s-' % self.file_name)
+            try:
+                os.write(fd, json.dumps(data))
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+
+def is_systemd_booted():
+    # this should show if systemd is the boot init system
+    # these mirror systemd's own sd_boot test http://www.freedesktop.org/software/systemd/man/sd_booted.html
+    for canary in ["/run/systemd/system/", "/dev/.run/systemd/", "/dev/.systemd/"]:
+        if os.path.exists(canary):
+            return True
+
+    # If all else fails, check if init is the systemd command, using comm as cmdline could be symlink
+    try:
+        f = open('/proc/1/comm', 'r')
+    except IOError:
+        # If comm doesn't exist, old kernel, no systemd
+        return False
+
+    try:
+        for line in f:
+            if 'systemd' in line:
+                return True
+    finally:
+        f.close()
+
+    return False
+
 class LinuxService(Service):
     """
     This is the Linux Service manipulation class - it is currently supporting
@@ -387,47 +637,84 @@ class LinuxService(Service):
     platform = 'Linux'
     distribution = None
 
-    def get_service_tools(self):
+    # only the unit properties we need are queried from systemctl show
+    SYSTEMD_PROPERTIES = [ 'Id', 'LoadState', 'ActiveState', 'UnitFileState' ]
+
+    # unit file states for which systemctl is-enabled exits with 0
+    SYSTEMD_ENABLED_STATES = [ 'enabled', 'enabled-runtime', 'static', 'indirect', 'generated', 'transient', 'alias' ]
 
+    def __init__(self, module):
+        super(LinuxService, self).__init__(module)
+        self.systemd_status = None
+        self.tools_cache = None
+
+    def detect_service_tools(self):
+        """
+        Locate the service management binaries and find out whether systemd
+        is the init system, reusing the result of an earlier run in the same
+        boot when possible.
+
+        Returns:
+            Tuple of the binary locations dict and a boolean telling whether
+            systemd is running
+        """
         paths = [ '/sbin', '/usr/sbin', '/bin', '/usr/bin' ]
         binaries = [ 'service', 'chkconfig', 'update-rc.d', 'rc-service', 'rc-update', 'initctl', 'systemctl', 'start', 'stop', 'restart', 'insserv' ]
-        initpaths = [ '/etc/init.d' ]
-        location = dict()
 
+        search_dirs = [ d for d in os.environ.get('PATH', '').split(os.pathsep) if d ] + paths
+        self.tools_cache = InitSystemCache(search_dirs, self.module.check_mode)
+        cached = self.tools_cache.load()
+        if cached:
+            location = dict()
+            for (binary, path) in cached['location'].items():
+                if path is not None:
+                    path = path.encode('utf-8')
+                location[binary.encode('utf-8')] = path
+            return (location, cached['systemd'])
+
+        location = dict()
         for binary in binaries:
             location[binary] = self.module.get_bin_path(binary, opt_dirs=paths)
 
-        for initdir in initpaths:
-            initscript = "%s/%s" % (initdir,self.name)
-            if os.path.isfile(initscript):
-                self.svc_initscript = initscript
+        # tools must be installed
+        systemd = bool(location.get('systemctl', False)) and is_systemd_booted()
 
-        def check_systemd():
+        self.tools_cache.save(dict(location=location, systemd=systemd))
+        return (location, systemd)
 
-            # tools must be installed
-            if location.get('systemctl',False):
+    def get_upstart_version(self):
+        # set the upstart version based on the output of 'initctl version'
+        cached = self.tools_cache.data
+        if cached and cached.get('upstart_version'):
+            return LooseVersion(cached['upstart_version'])
 
-                # this should show if systemd is the boot init system
-                # these mirror systemd's own sd_boot test http://www.freedesktop.org/software/systemd/man/sd_booted.html
-                for canary in ["/run/systemd/system/", "/dev/.run/systemd/", "/dev/.systemd/"]:
-                    if os.path.exists(canary):
-                        return True
+        upstart_version = '0.0.0'
+        try:
+            version_re = re.compile(r'\(upstart (.*)\)')
+            rc,stdout,stderr = self.module.run_command('initctl version')
+            if rc == 0:
+                res = version_re.search(stdout)
+                if res:
+                    upstart_version = res.groups()[0]
+        except:
+            pass  # we'll use the default of 0.0.0
 
-                # If all else fails, check if init is the systemd command, using comm as cmdline could be symlink
-                try:
-                    f = open('/proc/1/comm', 'r')
-                except IOError:
-                    # If comm doesn't exist, old kernel, no systemd
-                    return False
+        if cached:
+            self.tools_cache.save(dict(cached, upstart_version=upstart_version))
+        return LooseVersion(upstart_version)
 
-                for line in f:
-                    if 'systemd' in line:
-                        return True
+    def get_service_tools(self):
 
-            return False
+        initpaths = [ '/etc/init.d' ]
+        (location, systemd) = self.detect_service_tools()
+
+        for initdir in initpaths:
+            initscript = "%s/%s" % (initdir,self.name)
+            if os.path.isfile(initscript):
+                self.svc_initscript = initscript
 
         # Locate a tool to enable/disable a service
-        if check_systemd():
+        if systemd:
             # service is managed by systemd
             self.__systemd_unit = self.name
             self.svc_cmd = location['systemctl']
@@ -436,17 +723,7 @@ class LinuxService(Service):
         elif location.get('initctl', False) and os.path.exists("/etc/init/%s.conf" % self.name):
             # service is managed by upstart
             self.enable_cmd = location['initctl']
-            # set the upstart version based on the output of 'initctl version'
-            self.upstart_version = LooseVersion('0.0.0')
-            try:
-                version_re = re.compile(r'\(upstart (.*)\)')
-                rc,stdout,stderr = self.module.run_command('initctl version')
-                if rc == 0:
-                    res = version_re.search(stdout)
-                    if res:
-                        self.upstart_version = LooseVersion(res.groups()[0])
-            except:
-                pass  # we'll use the default of 0.0.0
+            self.upstart_version = self.get_upstart_version()
 
             if location.get('start', False):
                 # upstart -- rather than being managed by one command, start/stop/restart are actual commands
@@ -484,32 +761,47 @@ class LinuxService(Service):
         if location.get('initctl', False):
             self.svc_initctl = location['initctl']
 
-    def get_systemd_service_enabled(self):
-        def sysv_exists(name):
-            script = '/etc/init.d/' + name
-            return os.access(script, os.X_OK)
-
-        def sysv_is_enabled(name):
-            return bool(glob.glob('/etc/rc?.d/S??' + name))
-
-        service_name = self.__systemd_unit
-        (rc, out, err) = self.execute_command("%s is-enabled %s" % (self.enable_cmd, service_name,))
-        if rc == 0:
+    def is_systemd_unit_enabled(self, name, status_dict):
+        # the same as systemctl is-enabled, without running it again
+        if status_dict.get('UnitFileState') in self.SYSTEMD_ENABLED_STATES:
             return True
-        elif sysv_exists(service_name):
-            return sysv_is_enabled(service_name)
+        elif os.access('/etc/init.d/' + name, os.X_OK):
+            # SysV script wrapped by systemd
+            return bool(glob.glob('/etc/rc?.d/S??' + name))
         else:
             return False
 
-    def get_systemd_status_dict(self):
-
-        # Check status first as show will not fail if service does not exist
-        (rc, out, err) = self.execute_command("%s show '%s'" % (self.enable_cmd, self.__systemd_unit,))
+    def get_systemd_service_enabled(self):
+        return self.is_systemd_unit_enabled(self.__systemd_unit, self.get_systemd_status_dict())
+
+    def get_systemd_units_status(self, units):
+        """
+        Query the properties of all of the units with a single systemctl
+        show call, returning their status dicts in the same order
+        """
+        properties = ' '.join([ '-p %s' % p for p in self.SYSTEMD_PROPERTIES ])
+        quoted_units = ' '.join([ "'%s'" % u for u in units ])
+        (rc, out, err) = self.execute_command("%s show %s -- %s" % (self.enable_cmd, properties, quoted_units))
         if rc != 0:
-            self.module.fail_json(msg='failure %d running systemctl show for %r: %s' % (rc, self.__systemd_unit, err))
-        elif 'LoadState=not-found' in out:
-            self.module.fail_json(msg='systemd could not find the requested service "%r": %s' % (self.__systemd_unit, err))
+            self.module.fail_json(msg='failure %d running systemctl show for %s: %s' % (rc, ', '.join(units), err))
 
+        # systemctl separates the properties of each unit with an empty line
+        statuses = [ self.parse_systemd_show(block) for block in re.split(r'\n\s*\n', out.strip()) ]
+        if len(statuses) != len(units):
+            self.module.fail_json(msg='unexpected systemctl show output for %s' % ', '.join(units), stdout=out)
+        return statuses
+
+    def get_systemd_status_dict(self):
+        # cached, so checking whether the service is enabled and running
+        # only runs systemctl once
+        if self.systemd_status is None:
+            status_dict = self.get_systemd_units_status([self.__systemd_unit])[0]
+            if status_dict.get('LoadState') == 'not-found':
+                self.module.fail_json(msg='systemd could not find the requested service "%r"' % (self.__systemd_unit,))
+            self.systemd_status = status_dict
+        return self.systemd_status
+
+    def parse_systemd_show(self, out):
         key = None
         value_buffer = []
         status_dict = {}
@@ -865,6 +1157,9 @@ class LinuxService(Service):
 
     def service_control(self):
 
+        # the cached systemd status is stale once the service is changed
+        self.systemd_status = None
+
         # Decide what command to run
         svc_cmd = ''
         arguments = self.arguments
@@ -926,6 +1221,89 @@ class LinuxService(Service):
 
         return(rc_state, stdout, stderr)
 
+    def manage_units(self):
+        """
+        Bring all of the units in names to the requested state and
+        enablement, reading their status with one systemctl call and
+        running one systemctl call per action needed
+        """
+        (location, systemd) = self.detect_service_tools()
+        if not systemd:
+            self.module.fail_json(msg="names is only supported for services managed by systemd")
+        self.enable_cmd = location['systemctl']
+        self.svc_cmd = self.enable_cmd
+
+        units = self.names
+        statuses = self.get_systemd_units_status(units)
+        missing = [ u for (u, d) in zip(units, statuses) if d.get('LoadState') == 'not-found' ]
+        if missing:
+            self.module.fail_json(msg='systemd could not find the requested services: %s' % ', '.join(missing))
+
+        services = {}
+        for (unit, status_dict) in zip(units, statuses):
+            services[unit] = dict(changed=False)
+            if status_dict.get('ActiveState') is None:
+                self.module.fail_json(msg='No ActiveState value in systemctl show output for %r' % (unit,))
+
+        def run(action, targets):
+            if not targets:
+                return
+            for unit in targets:
+                services[unit]['changed'] = True
+            if self.module.check_mode:
+                return
+            (rc, out, err) = self.execute_command("%s %s -- %s" % (self.svc_cmd, action, ' '.join([ "'%s'" % u for u in targets ])),
+                                                  daemonize=action not in ['enable', 'disable'])
+            if rc != 0:
+                self.module.fail_json(msg="Error when trying to %s %s: rc=%s %s" % (action, ', '.join(targets), rc, err or out))
+
+        if self.enable is not None:
+            toggle = []
+            for (unit, status_dict) in zip(units, statuses):
+                if self.is_systemd_unit_enabled(unit, status_dict) != self.enable:
+                    toggle.append(unit)
+                services[unit]['enabled'] = self.enable
+            if self.enable:
+                run('enable', toggle)
+            else:
+                run('disable', toggle)
+
+        if self.state is not None:
+            running = []
+            stopped = []
+            for (unit, status_dict) in zip(units, statuses):
+                # run-once services (for which a single successful exit indicates
+                # that they are running as designed) should not be restarted here.
+                if status_dict.get('ActiveState') == 'active':
+                    running.append(unit)
+                else:
+                    stopped.append(unit)
+                if self.state in ['started', 'running', 'restarted', 'reloaded']:
+                    services[unit]['state'] = 'started'
+                else:
+                    services[unit]['state'] = 'stopped'
+
+            if self.state in ['started', 'running']:
+                run('start', stopped)
+            elif self.state == 'stopped':
+                run('stop', running)
+            elif self.state == 'reloaded':
+                run('start', stopped)
+                run('reload', running)
+            elif self.state == 'restarted':
+                run('stop', units)
+                if self.sleep and not self.module.check_mode:
+                    time.sleep(self.sleep)
+                run('start', units)
+
+        changed = bool([ u for u in units if services[u]['changed'] ])
+        result = dict(changed=changed, names=units, services=services)
+        if self.state is not None:
+            result['state'] = services[units[0]]['state']
+        if self.enable is not None:
+            result['enabled'] = self.enable
+        return result
+
 # ===========================================
 # Subclass: FreeBSD
 
@@ -1417,21 +1795,34 @@ class AIX(Service):
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            name = dict(required=True),
+            name = dict(required=False, default=None),
+            names = dict(required=False, default=None, type='list'),
             state = dict(choices=['running', 'started', 'stopped', 'restarted', 'reloaded']),
             sleep = dict(required=False, type='int', default=None),
             pattern = dict(required=False, default=None),
+            pattern_regex = dict(required=False, default=False, type='bool'),
+            pidfile = dict(required=False, default=None, type='path'),
             enabled = dict(type='bool'),
             runlevel = dict(required=False, default='default'),
             arguments = dict(aliases=['args'], default=''),
         ),
+        required_one_of=[['name', 'names']],
+        mutually_exclusive=[['name', 'names']],
         supports_check_mode=True
     )
     if module.params['state'] is None and module.params['enabled'] is None:
         module.fail_json(msg="Neither 'state' nor 'enabled' set")
+    if module.params['names'] is not None:
+        if not module.params['names']:
+            module.fail_json(msg="names must not be empty")
+        if module.params['pattern'] or module.params['pidfile'] or module.params['arguments']:
+            module.fail_json(msg="pattern, pidfile and arguments can not be used with names")
 
     service = Service(module)
 
+    if service.names:
+        module.exit_json(**service.manage_units())
+
     module.debug('Service instantiated - platform %s' % service.platform)
     if service.distribution:
         module.debug('Service instantiated - distribution %s' % service.distribution)
@@ -1460,7 +1851,7 @@ def main():
     result['state'] = service.state
 
     # Collect service status
-    if service.pattern:
+    if service.pattern or service.pidfile:
         service.check_ps()
     else:
         service.get_service_status()
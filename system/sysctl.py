@@ -31,7 +31,8 @@ options:
     name:
         description:
             - The dot-separated path (aka I(key)) specifying the sysctl variable.
-        required: true
+              B(One of name and sysctls is required.)
+        required: false
         default: null
         aliases: [ 'key' ]
     value:
@@ -69,7 +70,21 @@ options:
         required: false
         version_added: 1.5
         default: False
-notes: []
+    sysctls:
+        description:
+            - A dict of sysctl keys to manage in one go, instead of a single
+              I(name). Each value is either the desired value of the key, or
+              a dict with a C(value) and/or a C(state).
+            - C(sysctl_file) is read and written once for all of them. Rather
+              than reloading the whole file, only the keys whose live value
+              differs from the wanted one are set, when the file changed and
+              I(reload) is C(yes), or when I(sysctl_set) is C(yes).
+        required: false
+        default: null
+        version_added: "2.1"
+notes:
+    - On Linux, live values are read from and written to C(/proc/sys)
+      directly, falling back to the sysctl command when that fails.
 requirements: []
 author: "David CHANIAL (@davixx) <david.chanial@gmail.com>"
 '''
@@ -89,6 +104,15 @@ EXAMPLES = '''
 
 # Set ip forwarding on in /proc and in the sysctl file and reload if necessary
 - sysctl: name="net.ipv4.ip_forward" value=1 sysctl_set=yes state=present reload=yes
+
+# Set several keys at once, writing the file once and only setting the keys that differ
+- sysctl:
+    sysctl_file: /etc/sysctl.d/90-tuning.conf
+    sysctls:
+      vm.swappiness: 5
+      net.core.somaxconn: 4096
+      net.ipv4.tcp_syncookies: yes
+      kernel.panic: { state: absent }
 '''
 
 # ==============================================================
@@ -97,6 +121,8 @@ import os
 import tempfile
 import re
 
+PROC_SYS = '/proc/sys/'
+
 class SysctlModule(object):
 
     def __init__(self, module):
@@ -114,8 +140,13 @@ class SysctlModule(object):
         self.changed = False    # will change occur
         self.set_proc = False   # does sysctl need to set value
         self.write_file = False # does the sysctl file need to be reloaded
+        self.changed_keys = []  # keys changed in sysctls mode
 
-        self.process()
+        self.platform = get_platform().lower()
+        if self.args['sysctls'] is not None:
+            self.process_many()
+        else:
+            self.process()
 
     # ==============================================================
     #   LOGIC
@@ -123,8 +154,6 @@ class SysctlModule(object):
 
     def process(self):
 
-        self.platform = get_platform().lower()
-
         # Whitespace is bad
         self.args['name'] = self.args['name'].strip()
         self.args['value'] = self._parse_value(self.args['value'])
@@ -140,7 +169,10 @@ class SysctlModule(object):
             self.file_values[thisname] = None
 
         # update file contents with desired token/value
-        self.fix_lines()
+        if self.args['state'] == "present":
+            self.fix_lines([(thisname, self.args['value'])])
+        else:
+            self.fix_lines([(thisname, None)])
 
         # what do we need to do now?
         if self.file_values[thisname] is None and self.args['state'] == "present":
@@ -169,6 +201,64 @@ class SysctlModule(object):
             if self.set_proc:
                 self.set_token_value(self.args['name'], self.args['value'])
 
+    def process_many(self):
+        """
+        Manage all the keys of sysctls with one read and one write of the
+        sysctl file, setting only the keys whose live value differs
+        instead of reloading the whole file.
+        """
+        wanted = []
+        for name in sorted(self.args['sysctls']):
+            entry = self.args['sysctls'][name]
+            state = self.args['state']
+            if isinstance(entry, dict):
+                for key in entry:
+                    if key not in ('value', 'state'):
+                        self.module.fail_json(msg="unsupported option %s for sysctl %s" % (key, name))
+                state = entry.get('state', state)
+                entry = entry.get('value')
+            if state not in ('present', 'absent'):
+                self.module.fail_json(msg="value of state must be one of: present, absent, got: %s" % state)
+            value = self._parse_value(entry)
+            if not isinstance(value, basestring):
+                value = str(value)
+            if state == "present":
+                wanted.append((name.strip(), value))
+            else:
+                wanted.append((name.strip(), None))
+
+        self.read_sysctl_file()
+        self.fix_lines(wanted)
+
+        to_set = []
+        for (name, value) in wanted:
+            file_value = self.file_values.get(name)
+            file_changed = file_value != value
+            if file_changed:
+                self.write_file = True
+            if value is None:
+                if file_changed:
+                    self.changed_keys.append(name)
+                continue
+            if self.args['sysctl_set'] or (file_changed and self.args['reload']):
+                proc_value = self.get_token_curr_value(name)
+                if proc_value is None:
+                    if not self.args['sysctl_set'] and not self.args['ignoreerrors']:
+                        self.module.fail_json(msg="Failed to reload sysctl: unknown key %s" % name)
+                    file_changed = file_changed or self.args['sysctl_set']
+                elif not self._values_is_equal(proc_value, value):
+                    to_set.append((name, value))
+                    file_changed = file_changed or self.args['sysctl_set']
+            if file_changed:
+                self.changed_keys.append(name)
+
+        self.changed = bool(self.changed_keys)
+        if not self.module.check_mode:
+            if self.write_file:
+                self.write_sysctl()
+            for (name, value) in to_set:
+                self.set_token_value(name, value)
+
     def _values_is_equal(self, a, b):
         """Expects two string values. It will split the string by whitespace
         and compare each value. It will return True if both lists are the same,
@@ -206,8 +296,54 @@ class SysctlModule(object):
     #   SYSCTL COMMAND MANAGEMENT
     # ==============================================================
 
+    # The path of a key in /proc/sys, swapping dots and slashes the way
+    # sysctl(8) does unless the key already uses slashes
+    def _proc_path(self, token):
+        first = re.search(r'[./]', token)
+        if first is not None and first.group(0) == '.':
+            token = '/'.join([ part.replace('/', '.') for part in token.split('.') ])
+        return PROC_SYS + token
+
+    # Read the current value from /proc/sys on Linux, returns False when
+    # the sysctl command has to be used instead
+    def _read_proc(self, token):
+        if self.platform != 'linux':
+            return False
+        path = self._proc_path(token)
+        if not os.path.exists(path):
+            return None
+        try:
+            f = open(path)
+            try:
+                return f.read()
+            finally:
+                f.close()
+        except IOError:
+            return False
+
+    # Write a value to /proc/sys on Linux, returns False when the sysctl
+    # command has to be used instead
+    def _write_proc(self, token, value):
+        if self.platform != 'linux':
+            return False
+        path = self._proc_path(token)
+        if not os.path.exists(path):
+            return False
+        try:
+            f = open(path, 'w')
+            try:
+                f.write(value)
+            finally:
+                f.close()
+        except IOError:
+            return False
+        return True
+
     # Use the sysctl command to find the current value 
     def get_token_curr_value(self, token):
+        value = self._read_proc(token)
+        if value is not False:
+            return value
         if self.platform == 'openbsd':
             # openbsd doesn't support -e, just drop it
             thiscmd = "%s -n %s" % (self.sysctl_cmd, token)
@@ -221,6 +357,8 @@ class SysctlModule(object):
 
     # Use the sysctl command to set the current value
     def set_token_value(self, token, value):
+        if self._write_proc(token, value):
+            return 0
         if len(value.split()) > 0:
             value = '"' + value + '"'
         if self.platform == 'openbsd':
@@ -291,8 +429,10 @@ class SysctlModule(object):
             v = v.strip()
             self.file_values[k] = v.strip()
 
-    # Fix the value in the sysctl file content
-    def fix_lines(self):
+    # Fix the values in the sysctl file content, wanted is a list of
+    # (token, value) with None as the value of the tokens to remove
+    def fix_lines(self, wanted):
+        values = dict(wanted)
         checked = []
         self.fixed_lines = []
         for line in self.file_lines:
@@ -305,17 +445,19 @@ class SysctlModule(object):
             v = v.strip()
             if k not in checked:
                 checked.append(k)
-                if k == self.args['name']:
-                    if self.args['state'] == "present":
-                        new_line = "%s=%s\n" % (k, self.args['value'])
+                if k in values:
+                    if values[k] is not None:
+                        new_line = "%s=%s\n" % (k, values[k])
                         self.fixed_lines.append(new_line)                    
                 else:
                     new_line = "%s=%s\n" % (k, v)
                     self.fixed_lines.append(new_line)                    
 
-        if self.args['name'] not in checked and self.args['state'] == "present":
-            new_line = "%s=%s\n" % (self.args['name'], self.args['value'])
-            self.fixed_lines.append(new_line)                    
+        for (k, v) in wanted:
+            if k not in checked and v is not None:
+                checked.append(k)
+                new_line = "%s=%s\n" % (k, v)
+                self.fixed_lines.append(new_line)                    
 
     # Completely rewrite the sysctl file
     def write_sysctl(self):
@@ -342,19 +484,24 @@ def main():
     # defining module
     module = AnsibleModule(
         argument_spec = dict(
-            name = dict(aliases=['key'], required=True),
+            name = dict(aliases=['key'], required=False),
             value = dict(aliases=['val'], required=False, type='str'),
             state = dict(default='present', choices=['present', 'absent']),
             reload = dict(default=True, type='bool'),
             sysctl_set = dict(default=False, type='bool'),
             ignoreerrors = dict(default=False, type='bool'),
-            sysctl_file = dict(default='/etc/sysctl.conf', type='path')
+            sysctl_file = dict(default='/etc/sysctl.conf', type='path'),
+            sysctls = dict(required=False, type='dict'),
         ),
+        required_one_of=[['name', 'sysctls']],
+        mutually_exclusive=[['name', 'sysctls'], ['value', 'sysctls']],
         supports_check_mode=True
     )
 
     result = SysctlModule(module)
 
+    if module.params['sysctls'] is not None:
+        module.exit_json(changed=result.changed, sysctls=result.changed_keys)
     module.exit_json(changed=result.changed)
 
 # import module snippets
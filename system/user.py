@@ -29,10 +29,22 @@ description:
     - Manage user accounts and user attributes.
 options:
     name:
-        required: true
+        required: false
         aliases: [ "user" ]
         description:
-            - Name of the user to create, remove or modify.
+            - Name of the user to create, remove or modify. B(One of name and
+              users is required.)
+    users:
+        required: false
+        version_added: "2.1"
+        description:
+            - List of users to manage in one go, instead of a single I(name).
+              Each entry is either a user name or a dict with a C(name) and any
+              of the other options of this module, except I(password) and
+              I(ssh_key_passphrase), which would be logged. Options that are
+              not set in an entry default to the ones given to the module.
+            - All users share the same cache of user and group lookups, which
+              matters on hosts resolving users through LDAP or SSSD.
     comment:
         required: false
         description:
@@ -213,6 +225,15 @@ EXAMPLES = '''
 
 # added a consultant whose account you want to expire
 - user: name=james18 shell=/bin/zsh groups=developers expires=1422403387
+
+# Add several service accounts at once, all of them system users without a login shell
+- user:
+    system: yes
+    shell: /sbin/nologin
+    users:
+      - svc-backup
+      - { name: svc-deploy, groups: deploy }
+      - { name: svc-monitor, uid: 990 }
 '''
 
 import os
@@ -220,6 +241,8 @@ import pwd
 import grp
 import platform
 import socket
+import stat
+import errno
 import time
 
 try:
@@ -228,6 +251,210 @@ try:
 except:
     HAVE_SPWD=False
 
+# In-kernel file copies used when populating home directories from a
+# skeleton. Both calls are looked up in libc and only used on Linux, the
+# BSDs and Darwin have a socket-only sendfile() with another signature.
+_copy_file_range = None
+_sendfile = None
+if platform.system() == 'Linux':
+    try:
+        import ctypes
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        try:
+            _copy_file_range = _libc.copy_file_range
+            _copy_file_range.restype = ctypes.c_ssize_t
+            _copy_file_range.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                                         ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+        except AttributeError:
+            # glibc older than 2.27
+            _copy_file_range = None
+        try:
+            _sendfile = _libc.sendfile
+            _sendfile.restype = ctypes.c_ssize_t
+            _sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+        except AttributeError:
+            _sendfile = None
+    except (ImportError, OSError):
+        pass
+
+# errnos meaning "this copy method does not work for these files"
+_COPY_FALLBACK_ERRNOS = set([errno.ENOSYS, errno.EXDEV, errno.EINVAL,
+                             errno.EOPNOTSUPP, errno.EBADF, errno.EPERM])
+
+
+def _copy_fd_data(src_fd, dst_fd, size):
+    """
+    Copy size bytes between two file descriptors, using copy_file_range()
+    (server side copies on NFS 4.2, reflinks on some filesystems), then
+    sendfile(), then plain reads and writes. Both syscalls advance the file
+    offsets, so a method that fails part way is simply continued by the
+    next one. The reads always run last, so a file which grew is copied
+    whole.
+    """
+    remaining = size
+    for call in (_copy_file_range, _sendfile):
+        if call is None:
+            continue
+        while remaining > 0:
+            chunk = min(remaining, 1 << 30)
+            if call is _copy_file_range:
+                copied = call(src_fd, None, dst_fd, None, chunk, 0)
+            else:
+                copied = call(dst_fd, src_fd, None, chunk)
+            if copied < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err in _COPY_FALLBACK_ERRNOS:
+                    break
+                raise OSError(err, os.strerror(err))
+            if copied == 0:
+                # not necessarily the end of the file, some filesystems
+                # just copy nothing: leave it to the next method, and
+                # to the final read() to tell the end of the file
+                break
+            remaining -= copied
+        if remaining <= 0:
+            break
+
+    while True:
+        data = os.read(src_fd, 1024 * 1024)
+        if not data:
+            return
+        while data:
+            written = os.write(dst_fd, data)
+            data = data[written:]
+
+
+def copy_skeleton(src, dst, uid=None, gid=None):
+    """
+    Copy a skeleton tree to dst the way shutil.copytree(symlinks=True)
+    does, in a single lstat() driven walk. Entries are created with their
+    final owner when uid/gid are given, so no chown pass is needed after.
+    Sockets, fifos and device nodes are skipped.
+    """
+    chown = uid is not None and gid is not None
+    st = os.lstat(src)
+    os.makedirs(dst)
+    if chown:
+        os.chown(dst, uid, gid)
+    # the exact mode of the skeleton, whatever the umask
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+    for name in os.listdir(src):
+        srcname = os.path.join(src, name)
+        dstname = os.path.join(dst, name)
+        est = os.lstat(srcname)
+        if stat.S_ISDIR(est.st_mode):
+            copy_skeleton(srcname, dstname, uid, gid)
+        elif stat.S_ISLNK(est.st_mode):
+            os.symlink(os.readlink(srcname), dstname)
+            if chown:
+                os.lchown(dstname, uid, gid)
+        elif stat.S_ISREG(est.st_mode):
+            src_fd = os.open(srcname, os.O_RDONLY)
+            try:
+                dst_fd = os.open(dstname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+                try:
+                    _copy_fd_data(src_fd, dst_fd, est.st_size)
+                    if chown:
+                        os.fchown(dst_fd, uid, gid)
+                    os.fchmod(dst_fd, stat.S_IMODE(est.st_mode))
+                finally:
+                    os.close(dst_fd)
+            finally:
+                os.close(src_fd)
+            os.utime(dstname, (est.st_atime, est.st_mtime))
+    # after the contents, creating them updates the directory mtime
+    os.utime(dst, (st.st_atime, st.st_mtime))
+
+
+class NSSCache(object):
+    """
+    Caches the passwd and group lookups done during a module run. On
+    hosts using LDAP, SSSD or similar NSS backends every lookup can be a
+    network round trip, and the same users and groups are looked up many
+    times, especially when managing a list of users.
+
+    Group membership is indexed with a single pass over getgrall(). Users
+    are looked up by name as needed; load_users() can prefill them from
+    getpwall() when many users are managed, though backends which do not
+    enumerate still get looked up one by one.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.groups_by_name = {}
+        self.groups_by_gid = {}
+        self.members = None
+        self.stale_members = set()
+
+    def load_users(self):
+        for pw in pwd.getpwall():
+            self.users.setdefault(pw.pw_name, pw)
+
+    def getpwnam(self, name):
+        """ Returns the passwd entry of name, or None """
+        if name not in self.users:
+            try:
+                self.users[name] = pwd.getpwnam(name)
+            except KeyError:
+                self.users[name] = None
+        return self.users[name]
+
+    def getgrnam(self, name):
+        """ Returns the group entry of name, or None """
+        if name not in self.groups_by_name:
+            try:
+                self._add_group(grp.getgrnam(name))
+            except KeyError:
+                self.groups_by_name[name] = None
+        return self.groups_by_name[name]
+
+    def getgrgid(self, gid):
+        """ Returns the group entry of gid, or None """
+        if gid not in self.groups_by_gid:
+            try:
+                self._add_group(grp.getgrgid(gid))
+            except KeyError:
+                self.groups_by_gid[gid] = None
+        return self.groups_by_gid[gid]
+
+    def _add_group(self, group):
+        self.groups_by_name[group.gr_name] = group
+        self.groups_by_gid.setdefault(group.gr_gid, group)
+
+    def get_group(self, group):
+        """ Look a group up by gid or, failing that, by name """
+        try:
+            # Try group as a gid first
+            entry = self.getgrgid(int(group))
+            if entry is not None:
+                return entry
+        except ValueError:
+            pass
+        return self.getgrnam(group)
+
+    def user_groups(self, name):
+        """ Returns the (name, gid) of the groups listing name as a member """
+        if self.members is None or name in self.stale_members:
+            self.members = {}
+            self.stale_members = set()
+            for group in grp.getgrall():
+                self._add_group(group)
+                for member in group.gr_mem:
+                    self.members.setdefault(member, []).append((group.gr_name, group.gr_gid))
+        return self.members.get(name, [])
+
+    def invalidate(self, name):
+        """ Forget what is known about the user name after changing it """
+        self.users.pop(name, None)
+        self.stale_members.add(name)
+        # useradd may have created a group, forget the negative lookups
+        for cache in (self.groups_by_name, self.groups_by_gid):
+            for key in [ k for (k, v) in cache.items() if v is None ]:
+                del cache[key]
+
 
 class User(object):
     """
@@ -253,46 +480,53 @@ class User(object):
     def __new__(cls, *args, **kwargs):
         return load_platform_subclass(User, args, kwargs)
 
-    def __init__(self, module):
+    def __init__(self, module, params=None, nss=None):
+        # params defaults to the module parameters, an entry of the users
+        # list passes its own
+        if params is None:
+            params = module.params
+        if nss is None:
+            nss = NSSCache()
         self.module     = module
-        self.state      = module.params['state']
-        self.name       = module.params['name']
-        self.uid        = module.params['uid']
-        self.non_unique  = module.params['non_unique']
-        self.seuser     = module.params['seuser']
-        self.group      = module.params['group']
-        self.groups     = module.params['groups']
-        self.comment    = module.params['comment']
-        self.shell      = module.params['shell']
-        self.password   = module.params['password']
-        self.force      = module.params['force']
-        self.remove     = module.params['remove']
-        self.createhome = module.params['createhome']
-        self.move_home  = module.params['move_home']
-        self.skeleton   = module.params['skeleton']
-        self.system     = module.params['system']
-        self.login_class = module.params['login_class']
-        self.append     = module.params['append']
-        self.sshkeygen  = module.params['generate_ssh_key']
-        self.ssh_bits   = module.params['ssh_key_bits']
-        self.ssh_type   = module.params['ssh_key_type']
-        self.ssh_comment = module.params['ssh_key_comment']
-        self.ssh_passphrase = module.params['ssh_key_passphrase']
-        self.update_password = module.params['update_password']
+        self.nss        = nss
+        self.state      = params['state']
+        self.name       = params['name']
+        self.uid        = params['uid']
+        self.non_unique  = params['non_unique']
+        self.seuser     = params['seuser']
+        self.group      = params['group']
+        self.groups     = params['groups']
+        self.comment    = params['comment']
+        self.shell      = params['shell']
+        self.password   = params['password']
+        self.force      = params['force']
+        self.remove     = params['remove']
+        self.createhome = params['createhome']
+        self.move_home  = params['move_home']
+        self.skeleton   = params['skeleton']
+        self.system     = params['system']
+        self.login_class = params['login_class']
+        self.append     = params['append']
+        self.sshkeygen  = params['generate_ssh_key']
+        self.ssh_bits   = params['ssh_key_bits']
+        self.ssh_type   = params['ssh_key_type']
+        self.ssh_comment = params['ssh_key_comment']
+        self.ssh_passphrase = params['ssh_key_passphrase']
+        self.update_password = params['update_password']
         self.home    = None
         self.expires = None
 
-        if module.params['home'] is not None:
-            self.home = os.path.expanduser(module.params['home'])
+        if params['home'] is not None:
+            self.home = os.path.expanduser(params['home'])
 
-        if module.params['expires']:
+        if params['expires']:
             try:
-                self.expires = time.gmtime(module.params['expires'])
+                self.expires = time.gmtime(params['expires'])
             except Exception,e:
                 module.fail_json("Invalid expires time %s: %s" %(self.expires, str(e)))
 
-        if module.params['ssh_key_file'] is not None:
-            self.ssh_file = module.params['ssh_key_file']
+        if params['ssh_key_file'] is not None:
+            self.ssh_file = params['ssh_key_file']
         else:
             self.ssh_file = os.path.join('.ssh', 'id_%s' % self.ssh_type)
 
@@ -302,7 +536,11 @@ class User(object):
             self.module.debug('In check mode, would have run: "%s"' % cmd)
             return (0, '','')
         else:
-            return self.module.run_command(cmd, use_unsafe_shell=use_unsafe_shell, data=data)
+            result = self.module.run_command(cmd, use_unsafe_shell=use_unsafe_shell, data=data)
+            if obey_checkmode:
+                # the user may have been changed
+                self.nss.invalidate(self.name)
+            return result
 
     def remove_user_userdel(self):
         cmd = [self.module.get_bin_path('userdel', True)]
@@ -493,25 +731,13 @@ class User(object):
         return self.execute_command(cmd)
 
     def group_exists(self,group):
-        try:
-            # Try group as a gid first
-            grp.getgrgid(int(group))
-            return True
-        except (ValueError, KeyError):
-            try:
-                grp.getgrnam(group)
-                return True
-            except KeyError:
-                return False
+        return self.nss.get_group(group) is not None
 
     def group_info(self, group):
-        if not self.group_exists(group):
+        info = self.nss.get_group(group)
+        if info is None:
             return False
-        try:
-            # Try group as a gid first
-            return list(grp.getgrgid(int(group)))
-        except (ValueError, KeyError):
-            return list(grp.getgrnam(group))
+        return list(info)
 
     def get_groups_set(self, remove_existing=True):
         if self.groups is None:
@@ -519,31 +745,29 @@ class User(object):
         info = self.user_info()
         groups = set(filter(None, self.groups.split(',')))
         for g in set(groups):
-            if not self.group_exists(g):
+            ginfo = self.group_info(g)
+            if not ginfo:
                 self.module.fail_json(msg="Group %s does not exist" % (g))
-            if info and remove_existing and self.group_info(g)[2] == info[3]:
+            if info and remove_existing and ginfo[2] == info[3]:
                 groups.remove(g)
         return groups
 
     def user_group_membership(self):
         groups = []
         info = self.get_pwd_info()
-        for group in grp.getgrall():
-            if self.name in group.gr_mem and not info[3] == group.gr_gid:
-                groups.append(group[0])
+        for (group_name, gid) in self.nss.user_groups(self.name):
+            if not info[3] == gid:
+                groups.append(group_name)
         return groups
 
     def user_exists(self):
-        try:
-            if pwd.getpwnam(self.name):
-                return True
-        except KeyError:
-            return False
+        return self.nss.getpwnam(self.name) is not None
 
     def get_pwd_info(self):
-        if not self.user_exists():
+        info = self.nss.getpwnam(self.name)
+        if info is None:
             return False
-        return list(pwd.getpwnam(self.name))
+        return list(info)
 
     def user_info(self):
         if not self.user_exists():
@@ -650,7 +874,12 @@ class User(object):
         # by default we use the modify_user_usermod method
         return self.modify_user_usermod()
 
-    def create_homedir(self, path):
+    def create_homedir(self, path, uid=None, gid=None):
+        """
+        Create the home directory from the skeleton. When uid and gid are
+        given, the new tree is created with that owner and does not need a
+        chown_homedir() pass afterwards.
+        """
         if not os.path.exists(path):
             if self.skeleton is not None:
                 skeleton = self.skeleton
@@ -659,23 +888,34 @@ class User(object):
 
             if os.path.exists(skeleton):
                 try:
-                    shutil.copytree(skeleton, path, symlinks=True)
+                    copy_skeleton(skeleton, path, uid, gid)
+                except OSError, e:
+                    self.module.exit_json(failed=True, msg="%s" % e)
+            else:
+                try:
+                    os.makedirs(path)
+                    if uid is not None and gid is not None:
+                        os.chown(path, uid, gid)
                 except OSError, e:
                     self.module.exit_json(failed=True, msg="%s" % e)
-        else:
-            try:
-                os.makedirs(path)
-            except OSError, e:
-                self.module.exit_json(failed=True, msg="%s" % e)
 
     def chown_homedir(self, uid, gid, path):
+        # lstat() every entry and only chown what is owned by someone
+        # else, symlinks themselves are chowned and never followed
         try:
-            os.chown(path, uid, gid)
+            st = os.lstat(path)
+            if st.st_uid != uid or st.st_gid != gid:
+                os.chown(path, uid, gid)
             for root, dirs, files in os.walk(path):
-                for d in dirs:
-                    os.chown(path, uid, gid)
-                for f in files:
-                    os.chown(os.path.join(root, f), uid, gid)
+                for name in dirs + files:
+                    entry = os.path.join(root, name)
+                    st = os.lstat(entry)
+                    if st.st_uid == uid and st.st_gid == gid:
+                        continue
+                    if stat.S_ISLNK(st.st_mode):
+                        os.lchown(entry, uid, gid)
+                    else:
+                        os.chown(entry, uid, gid)
         except OSError, e:
             self.module.exit_json(failed=True, msg="%s" % e)
 
@@ -2013,57 +2253,7 @@ class HPUX(User):
 
 # ===========================================
 
-def main():
-    ssh_defaults = {
-            'bits': '2048',
-            'type': 'rsa',
-            'passphrase': None,
-            'comment': 'ansible-generated on %s' % socket.gethostname()
-    }
-    module = AnsibleModule(
-        argument_spec = dict(
-            state=dict(default='present', choices=['present', 'absent'], type='str'),
-            name=dict(required=True, aliases=['user'], type='str'),
-            uid=dict(default=None, type='str'),
-            non_unique=dict(default='no', type='bool'),
-            group=dict(default=None, type='str'),
-            groups=dict(default=None, type='str'),
-            comment=dict(default=None, type='str'),
-            home=dict(default=None, type='str'),
-            shell=dict(default=None, type='str'),
-            password=dict(default=None, type='str', no_log=True),
-            login_class=dict(default=None, type='str'),
-            # following options are specific to selinux
-            seuser=dict(default=None, type='str'),
-            # following options are specific to userdel
-            force=dict(default='no', type='bool'),
-            remove=dict(default='no', type='bool'),
-            # following options are specific to useradd
-            createhome=dict(default='yes', type='bool'),
-            skeleton=dict(default=None, type='str'),
-            system=dict(default='no', type='bool'),
-            # following options are specific to usermod
-            move_home=dict(default='no', type='bool'),
-            append=dict(default='no', type='bool'),
-            # following are specific to ssh key generation
-            generate_ssh_key=dict(type='bool'),
-            ssh_key_bits=dict(default=ssh_defaults['bits'], type='str'),
-            ssh_key_type=dict(default=ssh_defaults['type'], type='str'),
-            ssh_key_file=dict(default=None, type='str'),
-            ssh_key_comment=dict(default=ssh_defaults['comment'], type='str'),
-            ssh_key_passphrase=dict(default=None, type='str', no_log=True),
-            update_password=dict(default='always',choices=['always','on_create'],type='str'),
-            expires=dict(default=None, type='float'),
-        ),
-        supports_check_mode=True
-    )
-
-    user = User(module)
-
-    module.debug('User instantiated - platform %s' % user.platform)
-    if user.distribution:
-        module.debug('User instantiated - distribution %s' % user.distribution)
-
+def manage_user(module, user):
     rc = None
     out = ''
     err = ''
@@ -2073,7 +2263,7 @@ def main():
     if user.state == 'absent':
         if user.user_exists():
             if module.check_mode:
-                module.exit_json(changed=True)
+                return dict(changed=True)
             (rc, out, err) = user.remove_user()
             if rc != 0:
                 module.fail_json(name=user.name, msg=err, rc=rc)
@@ -2082,7 +2272,7 @@ def main():
     elif user.state == 'present':
         if not user.user_exists():
             if module.check_mode:
-                module.exit_json(changed=True)
+                return dict(changed=True)
             (rc, out, err) = user.create_user()
             if module.check_mode:
                 result['system'] = user.name
@@ -2128,8 +2318,7 @@ def main():
             user.home = info[5]
         if not os.path.exists(user.home) and user.createhome:
             if not module.check_mode:
-                user.create_homedir(user.home)
-                user.chown_homedir(info[2], info[3], user.home)
+                user.create_homedir(user.home, info[2], info[3])
             result['changed'] = True
 
         # deal with ssh key
@@ -2148,7 +2337,110 @@ def main():
             result['ssh_key_file'] = user.get_ssh_key_path()
             result['ssh_public_key'] = user.get_ssh_public_key()
 
-    module.exit_json(**result)
+    return result
+
+def get_user_params(module, entry):
+    """
+    Merge an entry of the users list with the module parameters, which act
+    as the defaults for every user, applying the types of argument_spec
+    """
+    if isinstance(entry, basestring):
+        entry = dict(name=entry)
+    if not isinstance(entry, dict) or not entry.get('name', entry.get('user')):
+        module.fail_json(msg="each of the users must be a user name or a dict with a name, got %s" % entry)
+
+    params = dict(module.params)
+    del params['users']
+    for (key, value) in entry.items():
+        if key == 'user':
+            key = 'name'
+        if key not in params:
+            module.fail_json(msg="unsupported option %s for user %s" % (key, entry.get("name", entry.get("user"))))
+        if module.argument_spec[key].get('no_log'):
+            module.fail_json(msg="%s can not be set for a single entry of users, as it would be logged" % key)
+        spec = module.argument_spec[key]
+        if value is not None:
+            if spec.get('type') == 'bool':
+                value = module.boolean(value)
+            elif spec.get('type') == 'float':
+                value = float(value)
+            elif key == 'groups' and isinstance(value, list):
+                value = ','.join(value)
+            else:
+                value = str(value)
+            if 'choices' in spec and value not in spec['choices']:
+                module.fail_json(msg="value of %s must be one of: %s, got: %s" % (key, ', '.join(spec['choices']), value))
+        params[key] = value
+    return params
+
+def main():
+    ssh_defaults = {
+            'bits': '2048',
+            'type': 'rsa',
+            'passphrase': None,
+            'comment': 'ansible-generated on %s' % socket.gethostname()
+    }
+    module = AnsibleModule(
+        argument_spec = dict(
+            state=dict(default='present', choices=['present', 'absent'], type='str'),
+            name=dict(default=None, aliases=['user'], type='str'),
+            users=dict(default=None, type='list'),
+            uid=dict(default=None, type='str'),
+            non_unique=dict(default='no', type='bool'),
+            group=dict(default=None, type='str'),
+            groups=dict(default=None, type='str'),
+            comment=dict(default=None, type='str'),
+            home=dict(default=None, type='str'),
+            shell=dict(default=None, type='str'),
+            password=dict(default=None, type='str', no_log=True),
+            login_class=dict(default=None, type='str'),
+            # following options are specific to selinux
+            seuser=dict(default=None, type='str'),
+            # following options are specific to userdel
+            force=dict(default='no', type='bool'),
+            remove=dict(default='no', type='bool'),
+            # following options are specific to useradd
+            createhome=dict(default='yes', type='bool'),
+            skeleton=dict(default=None, type='str'),
+            system=dict(default='no', type='bool'),
+            # following options are specific to usermod
+            move_home=dict(default='no', type='bool'),
+            append=dict(default='no', type='bool'),
+            # following are specific to ssh key generation
+            generate_ssh_key=dict(type='bool'),
+            ssh_key_bits=dict(default=ssh_defaults['bits'], type='str'),
+            ssh_key_type=dict(default=ssh_defaults['type'], type='str'),
+            ssh_key_file=dict(default=None, type='str'),
+            ssh_key_comment=dict(default=ssh_defaults['comment'], type='str'),
+            ssh_key_passphrase=dict(default=None, type='str', no_log=True),
+            update_password=dict(default='always',choices=['always','on_create'],type='str'),
+            expires=dict(default=None, type='float'),
+        ),
+        required_one_of=[['name', 'users']],
+        mutually_exclusive=[['name', 'users']],
+        supports_check_mode=True
+    )
+
+    if module.params['users'] is not None:
+        # share one NSS cache between all of the users, filled in one pass
+        nss = NSSCache()
+        nss.load_users()
+        results = []
+        for entry in module.params['users']:
+            user = User(module, get_user_params(module, entry), nss)
+            user_result = manage_user(module, user)
+            user_result['name'] = user.name
+            results.append(user_result)
+        changed = bool([ r for r in results if r['changed'] ])
+        module.exit_json(changed=changed, users=results)
+
+    user = User(module)
+
+    module.debug('User instantiated - platform %s' % user.platform)
+    if user.distribution:
+        module.debug('User instantiated - distribution %s' % user.distribution)
+
+    module.exit_json(**manage_user(module, user))
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -0,0 +1,256 @@
+import re
+import socket
+import struct
+import sys
+
+import pytest
+
+from utilities.logic import wait_for
+
+
+class AnsibleFail(Exception):
+    pass
+
+
+class FakeModule(object):
+
+    def __init__(self, **params):
+        self.params = params
+
+    def fail_json(self, **kwargs):
+        raise AnsibleFail(kwargs['msg'])
+
+
+# _search_carry
+
+def test_search_carry_keeps_short_data():
+    data = 'a line\nanother'
+    assert wait_for._search_carry(data) == data
+
+
+def test_search_carry_cuts_at_a_line_start():
+    line = 'x' * 99 + '\n'
+    data = line * (wait_for.SEARCH_CARRY // len(line) + 10)
+    carry = wait_for._search_carry(data)
+    assert len(carry) >= wait_for.SEARCH_CARRY
+    assert len(carry) < len(data)
+    assert data.endswith(carry)
+    assert carry.startswith('x')
+
+
+def test_search_carry_is_bounded_without_line_breaks():
+    data = 'x' * (wait_for.SEARCH_CARRY * 3)
+    assert wait_for._search_carry(data) == 'x' * wait_for.SEARCH_CARRY
+
+
+def test_search_carry_is_bounded_after_an_early_line_break():
+    data = 'first\n' + 'x' * (wait_for.SEARCH_CARRY * 3)
+    assert wait_for._search_carry(data) == 'x' * (wait_for.SEARCH_CARRY * 2)
+
+
+# FileSearch
+
+@pytest.fixture
+def small_reads(monkeypatch):
+    # many small reads, so that matches span them
+    monkeypatch.setattr(wait_for, 'READ_SIZE', 4)
+    monkeypatch.setattr(wait_for, 'SEARCH_CARRY', 32)
+
+
+def test_file_search_match_split_across_reads(tmpdir, small_reads):
+    path = tmpdir.join('log')
+    path.write('starting\nserver ')
+    search = wait_for.FileSearch(str(path), re.compile('server is ready'))
+    assert not search.search()
+    path.write('is rea', mode='a')
+    assert not search.search()
+    path.write('dy\n', mode='a')
+    assert search.search()
+
+
+def test_file_search_anchor_split_across_reads(tmpdir, small_reads):
+    path = tmpdir.join('log')
+    path.write('not ready\nrea')
+    search = wait_for.FileSearch(str(path), re.compile('^ready$', re.MULTILINE))
+    assert not search.search()
+    path.write('dy\n', mode='a')
+    assert search.search()
+
+
+def test_file_search_starts_over_when_truncated(tmpdir, small_reads):
+    path = tmpdir.join('log')
+    path.write('booting, please wait\n')
+    search = wait_for.FileSearch(str(path), re.compile('done'))
+    assert not search.search()
+    path.write('done\n')
+    assert search.search()
+
+
+def test_file_search_missing_file(tmpdir):
+    search = wait_for.FileSearch(str(tmpdir.join('missing')), re.compile('x'))
+    assert not search.search()
+
+
+# _parse_needed
+
+@pytest.mark.parametrize('mode, count, needed', [
+    ('all', 3, 3),
+    ('any', 3, 1),
+    ('quorum:2', 3, 2),
+    ('quorum:3', 3, 3),
+])
+def test_parse_needed(mode, count, needed):
+    assert wait_for._parse_needed(FakeModule(), mode, count) == needed
+
+
+@pytest.mark.parametrize('mode', ['quorum:0', 'quorum:4', 'quorum:', 'quorum:two', 'most'])
+def test_parse_needed_invalid(mode):
+    with pytest.raises(AnsibleFail):
+        wait_for._parse_needed(FakeModule(), mode, 3)
+
+
+# LinuxTCPConnectionInfo procfs fallback
+
+PROC_NET_TCP = '''\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1 1 0000000000000000 100 0 0 10 0
+   1: 0100007F:1F90 0100007F:D2A4 01 00000000:00000000 00:00000000 00000000  1000        0 2 1 0000000000000000 20 4 30 10 -1
+   2: 0100007F:1F90 0500000A:D2A6 01 00000000:00000000 00:00000000 00000000  1000        0 3 1 0000000000000000 20 4 30 10 -1
+   3: 0100007F:1F90 0600000A:D2A8 06 00000000:00000000 00:00000000 00000000  1000        0 4 1 0000000000000000 20 4 30 10 -1
+   4: 0100007F:0016 0600000A:D2AA 01 00000000:00000000 00:00000000 00000000  1000        0 5 1 0000000000000000 20 4 30 10 -1
+'''
+
+
+def connection_info(tmpdir, monkeypatch, host, exclude_hosts=None):
+    path = tmpdir.join('tcp')
+    path.write(PROC_NET_TCP)
+    module = FakeModule(host=host, port=8080, exclude_hosts=exclude_hosts)
+    info = object.__new__(wait_for.LinuxTCPConnectionInfo)
+    info.__init__(module)
+    monkeypatch.setitem(info.source_file, socket.AF_INET, str(path))
+
+    def no_sock_diag():
+        raise socket.error(93, 'Protocol not supported')
+    monkeypatch.setattr(info, '_get_netlink_connections_count', no_sock_diag)
+    return info
+
+
+def test_procfs_fallback_counts_active_connections(tmpdir, monkeypatch):
+    info = connection_info(tmpdir, monkeypatch, '127.0.0.1')
+    # the listening socket and the other port are not counted
+    assert info.get_active_connections_count() == 3
+    # netlink is not tried again
+    assert not info.use_netlink
+
+
+def test_procfs_fallback_excludes_hosts(tmpdir, monkeypatch):
+    info = connection_info(tmpdir, monkeypatch, '0.0.0.0', exclude_hosts=['10.0.0.5'])
+    assert info.get_active_connections_count() == 2
+
+
+def test_netlink_request_filters_on_the_port(tmpdir, monkeypatch):
+    info = connection_info(tmpdir, monkeypatch, '127.0.0.1')
+    request = info._build_netlink_request()
+    (length, msg_type, flags) = struct.unpack_from('=LHH', request)
+    assert length == len(request)
+    assert msg_type == info.SOCK_DIAG_BY_FAMILY
+    assert flags == info.NLM_F_REQUEST | info.NLM_F_DUMP
+    # struct inet_diag_req_v2 follows the header, the bytecode attribute after it
+    (family, protocol) = struct.unpack_from('=BB', request, info.NLMSG_HDR_LEN)
+    assert (family, protocol) == (socket.AF_INET, socket.IPPROTO_TCP)
+    offset = info.NLMSG_HDR_LEN + 56
+    (attr_len, attr_type) = struct.unpack_from('=HH', request, offset)
+    assert attr_type == info.INET_DIAG_REQ_BYTECODE
+    assert offset + attr_len == len(request)
+    ops = struct.unpack_from('=BBHBBHBBHBBH', request, offset + 4)
+    # sport >= 8080, then sport <= 8080, failures jump past the end
+    assert ops[0:3] == (info.INET_DIAG_BC_S_GE, 8, 20)
+    assert ops[5] == 8080
+    assert ops[6:9] == (info.INET_DIAG_BC_S_LE, 8, 12)
+    assert ops[11] == 8080
+
+
+# main() with state=drained
+
+class AnsibleExit(Exception):
+    pass
+
+
+class FakeAnsibleModule(FakeModule):
+
+    def __init__(self, argument_spec, **kwargs):
+        params = dict((k, v.get('default')) for (k, v) in argument_spec.items())
+        params.update(self.args)
+        FakeModule.__init__(self, **params)
+
+    def exit_json(self, **kwargs):
+        raise AnsibleExit(kwargs)
+
+
+def run_main(monkeypatch, **args):
+    monkeypatch.setattr(FakeAnsibleModule, 'args', args, raising=False)
+    monkeypatch.setattr(wait_for, 'AnsibleModule', FakeAnsibleModule)
+    wait_for.main()
+
+
+@pytest.fixture
+def established():
+    # a connection to a port that is no longer listening
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    client = socket.create_connection(('127.0.0.1', port))
+    (server, address) = listener.accept()
+    listener.close()
+    yield (port, client, server)
+    client.close()
+    server.close()
+
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs LinuxTCPConnectionInfo')
+
+
+@linux_only
+def test_drained_waits_for_established_connections(monkeypatch, established):
+    (port, client, server) = established
+    with pytest.raises(AnsibleFail) as e:
+        run_main(monkeypatch, port=port, state='drained', timeout=2)
+    assert 'to drain' in str(e.value)
+
+
+@linux_only
+def test_drained_once_connections_are_closed(monkeypatch, established):
+    (port, client, server) = established
+    # the client closes first, so the server side does not linger in TIME_WAIT
+    client.close()
+    server.close()
+    with pytest.raises(AnsibleExit) as e:
+        run_main(monkeypatch, port=port, state='drained', timeout=5)
+    assert e.value.args[0]['state'] == 'drained'
+
+
+@linux_only
+def test_drained_counts_connections_with_sock_diag(monkeypatch, established):
+    (port, client, server) = established
+    if not hasattr(socket, 'AF_NETLINK'):
+        pytest.skip('no netlink sockets')
+    try:
+        socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, wait_for.LinuxTCPConnectionInfo.NETLINK_SOCK_DIAG).close()
+    except socket.error:
+        pytest.skip('no sock_diag netlink sockets')
+    counts = []
+    count_connections = wait_for.LinuxTCPConnectionInfo._get_netlink_connections_count
+
+    def netlink_count(self):
+        counts.append(count_connections(self))
+        return counts[-1]
+
+    def no_procfs(self):
+        raise AssertionError('procfs should not be read when sock_diag works')
+    monkeypatch.setattr(wait_for.LinuxTCPConnectionInfo, '_get_netlink_connections_count', netlink_count)
+    monkeypatch.setattr(wait_for.LinuxTCPConnectionInfo, '_get_procfs_connections_count', no_procfs)
+    with pytest.raises(AnsibleFail):
+        run_main(monkeypatch, port=port, state='drained', timeout=1)
+    # only the accepted socket is bound to the port
+    assert counts and counts[0] == 1
@@ -61,6 +61,20 @@ options:
     required: false
     default: no
     version_added: "1.6"
+  stats_file:
+    description:
+      - Path of a local file the daemon periodically writes its request counters, byte counters
+        and per-mode latency histograms to, as JSON. The same data is always available from the
+        running daemon through the C(stats) request mode.
+    required: false
+    default: null
+    version_added: "2.1"
+  stats_interval:
+    description:
+      - Number of seconds between two writes of I(stats_file).
+    required: false
+    default: 60
+    version_added: "2.1"
 notes:
     - See the advanced playbooks chapter for more about using accelerated mode.
 requirements:
@@ -115,23 +129,127 @@ CHUNK_SIZE=10240
 
 # FIXME: this all should be moved to module_common, as it's 
 #        pretty much a copy from the callbacks/util code
+# messages are only formatted with their arguments when the
+# verbosity is high enough, so disabled debug output costs nothing
 DEBUG_LEVEL=0
-def log(msg, cap=0):
-    global DEBUG_LEVEL
+def log(msg, cap=0, *args):
     if DEBUG_LEVEL >= cap:
+        if args:
+            msg = msg % args
         syslog.syslog(syslog.LOG_NOTICE|syslog.LOG_DAEMON, msg)
 
-def v(msg):
-    log(msg, cap=1)
+def v(msg, *args):
+    log(msg, 1, *args)
+
+def vv(msg, *args):
+    log(msg, 2, *args)
+
+def vvv(msg, *args):
+    log(msg, 3, *args)
+
+def vvvv(msg, *args):
+    log(msg, 4, *args)
+
+# upper bounds (in milliseconds) of the request latency histogram buckets,
+# anything slower than the last bound is counted in a final overflow bucket
+LATENCY_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class AccelerateStats(object):
+    """
+    In-memory request counters, byte counters and per-mode latency
+    histograms for the daemon, shared by all of the handler threads
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time.time()
+        self.connections = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.modes = {}
+
+    def add_connection(self):
+        self.lock.acquire()
+        try:
+            self.connections += 1
+        finally:
+            self.lock.release()
+
+    def add_bytes(self, received=0, sent=0):
+        self.lock.acquire()
+        try:
+            self.bytes_received += received
+            self.bytes_sent += sent
+        finally:
+            self.lock.release()
+
+    def add_request(self, mode, elapsed, failed=False):
+        elapsed_ms = elapsed * 1000.0
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed_ms <= bound:
+                break
+        else:
+            idx = len(LATENCY_BUCKETS)
+
+        self.lock.acquire()
+        try:
+            if mode not in self.modes:
+                self.modes[mode] = dict(
+                    requests=0,
+                    failed=0,
+                    total_ms=0.0,
+                    max_ms=0.0,
+                    buckets=[0] * (len(LATENCY_BUCKETS) + 1),
+                )
+            counters = self.modes[mode]
+            counters['requests'] += 1
+            if failed:
+                counters['failed'] += 1
+            counters['total_ms'] += elapsed_ms
+            counters['max_ms'] = max(counters['max_ms'], elapsed_ms)
+            counters['buckets'][idx] += 1
+        finally:
+            self.lock.release()
 
-def vv(msg):
-    log(msg, cap=2)
+    def snapshot(self):
+        labels = ['<=%d' % bound for bound in LATENCY_BUCKETS]
+        labels.append('>%d' % LATENCY_BUCKETS[-1])
 
-def vvv(msg):
-    log(msg, cap=3)
+        self.lock.acquire()
+        try:
+            modes = {}
+            for mode, counters in self.modes.items():
+                avg_ms = 0.0
+                if counters['requests']:
+                    avg_ms = counters['total_ms'] / counters['requests']
+                modes[mode] = dict(
+                    requests=counters['requests'],
+                    failed=counters['failed'],
+                    avg_ms=round(avg_ms, 3),
+                    max_ms=round(counters['max_ms'], 3),
+                    latency_ms=dict(zip(labels, counters['buckets'])),
+                )
+            return dict(
+                pid=os.getpid(),
+                uptime=int(time.time() - self.started),
+                connections=self.connections,
+                bytes_received=self.bytes_received,
+                bytes_sent=self.bytes_sent,
+                modes=modes,
+            )
+        finally:
+            self.lock.release()
 
-def vvvv(msg):
-    log(msg, cap=4)
+    def dump(self, path):
+        # write to a temp file next to the target and rename it into
+        # place, so readers never see a partially written file
+        data = json.dumps(self.snapshot())
+        (fd, tmp_path) = tempfile.mkstemp(prefix='.accelerate-stats.', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, path)
 
 
 HAS_KEYCZAR = False
@@ -165,7 +283,7 @@ def daemonize_self(module, password, port, minutes, pid_file):
     try:
         pid = os.fork()
         if pid > 0:
-            vvv("exiting pid %s" % pid)
+            vvv("exiting pid %s", pid)
             # exit first parent
             module.exit_json(msg="daemonized accelerate on port %s for %s minutes with pid %s" % (port, minutes, str(pid)))
     except OSError, e:
@@ -261,7 +379,7 @@ class LocalSocketThread(Thread):
                         finally:
                             self.server.last_event_lock.release()
                     except Exception, e:
-                        vv("key loaded locally was invalid, ignoring (%s)" % e)
+                        vv("key loaded locally was invalid, ignoring (%s)", e)
                         conn.sendall("BADKEY\n")
                 finally:
                     try:
@@ -291,6 +409,22 @@ class ThreadWithReturnValue(Thread):
         Thread.join(self, timeout=timeout)
         return self._return
 
+class StatsDumpThread(Thread):
+    def __init__(self, server, path, interval):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.server = server
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.server.stats.dump(self.path)
+            except Exception, e:
+                log("failed to write the stats file %s: %s", 0, self.path, e)
+
 class ThreadedTCPServer(SocketServer.ThreadingTCPServer):
     key_list = []
     last_event = datetime.datetime.now()
@@ -300,6 +434,7 @@ class ThreadedTCPServer(SocketServer.ThreadingTCPServer):
         self.key_list.append(AesKey.Read(password))
         self.allow_reuse_address = True
         self.timeout = timeout
+        self.stats = AccelerateStats()
 
         if use_ipv6:
             self.address_family = socket.AF_INET6
@@ -309,6 +444,13 @@ class ThreadedTCPServer(SocketServer.ThreadingTCPServer):
             self.local_thread = LocalSocketThread(kwargs=dict(server=self))
             self.local_thread.start()
 
+        stats_file = self.module.params.get('stats_file')
+        if stats_file:
+            stats_interval = int(self.module.params.get('stats_interval'))
+            vv("starting thread to dump the stats to %s every %d seconds", stats_file, stats_interval)
+            self.stats_thread = StatsDumpThread(self, stats_file, stats_interval)
+            self.stats_thread.start()
+
         SocketServer.ThreadingTCPServer.__init__(self, server_address, RequestHandlerClass)
 
     def shutdown(self):
@@ -327,6 +469,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
             self.server.last_event_lock.release()
 
         packed_len = struct.pack('!Q', len(data))
+        self.server.stats.add_bytes(sent=len(packed_len) + len(data))
         return self.request.sendall(packed_len + data)
 
     def recv_data(self):
@@ -347,7 +490,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
         vvvv("in recv_data(), got the header, unpacking")
         data_len = struct.unpack('!Q',data[:header_len])[0]
         data = data[header_len:]
-        vvvv("data received so far (expecting %d): %d" % (data_len,len(data)))
+        vvvv("data received so far (expecting %d): %d", data_len, len(data))
         while len(data) < data_len:
             try:
                 d = self.request.recv(data_len - len(data))
@@ -355,12 +498,13 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
                     vvv("received nothing, bailing out")
                     return None
                 data += d
-                vvvv("data received so far (expecting %d): %d" % (data_len,len(data)))
+                vvvv("data received so far (expecting %d): %d", data_len, len(data))
             except:
                 # probably got a connection reset
                 vvvv("exception received while waiting for recv(), returning None")
                 return None
         vvvv("received all of the data, returning")
+        self.server.stats.add_bytes(received=header_len + data_len)
 
         try:
             self.server.last_event_lock.acquire()
@@ -371,6 +515,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
         return data
 
     def handle(self):
+        self.server.stats.add_connection()
         try:
             while True:
                 vvvv("waiting for data")
@@ -402,6 +547,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
 
                 mode = data['mode']
                 response = {}
+                started = time.time()
                 last_pong = datetime.datetime.now()
                 if mode == 'command':
                     vvvv("received a command request, running it")
@@ -417,7 +563,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
                             self.send_data(data2)
                         time.sleep(0.1)
                     response = twrv._return
-                    vvvv("thread is done, response from join was %s" % response)
+                    vvvv("thread is done, response from join was %s", response)
                 elif mode == 'put':
                     vvvv("received a put request, putting it")
                     response = self.put(data)
@@ -427,15 +573,21 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
                 elif mode == 'validate_user':
                     vvvv("received a request to validate the user id")
                     response = self.validate_user(data)
+                elif mode == 'stats':
+                    vvvv("received a request for the daemon stats")
+                    response = self.server.stats.snapshot()
 
-                vvvv("response result is %s" % str(response))
+                vvvv("response result is %s", response)
                 json_response = json.dumps(response)
-                vvvv("dumped json is %s" % json_response)
+                vvvv("dumped json is %s", json_response)
                 data2 = self.active_key.Encrypt(json_response)
                 vvvv("sending the response back to the controller")
                 self.send_data(data2)
                 vvvv("done sending the response")
 
+                failed = not isinstance(response, dict) or bool(response.get('failed', False))
+                self.server.stats.add_request(mode, time.time() - started, failed=failed)
+
                 if mode == 'validate_user' and response.get('rc') == 1:
                     vvvv("detected a uid mismatch, shutting down")
                     self.server.shutdown()
@@ -452,7 +604,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
         if 'username' not in data:
             return dict(failed=True, msg='No username specified')
 
-        vvvv("validating we're running as %s" % data['username'])
+        vvvv("validating we're running as %s", data['username'])
 
         # get the current uid
         c_uid = os.getuid()
@@ -460,7 +612,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
             # the target uid
             t_uid = pwd.getpwnam(data['username']).pw_uid
         except:
-            vvvv("could not find user %s" % data['username'])
+            vvvv("could not find user %s", data['username'])
             return dict(failed=True, msg='could not find user %s' % data['username'])
 
         # and return rc=0 for success, rc=1 for failure
@@ -473,7 +625,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
         if 'cmd' not in data:
             return dict(failed=True, msg='internal error: cmd is required')
 
-        vvvv("executing: %s" % data['cmd'])
+        vvvv("executing: %s", data['cmd'])
 
         use_unsafe_shell = False
         executable = data.get('executable')
@@ -485,8 +637,8 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
             stdout = ''
         if stderr is None:
             stderr = ''
-        vvvv("got stdout: %s" % stdout)
-        vvvv("got stderr: %s" % stderr)
+        vvvv("got stdout: %s", stdout)
+        vvvv("got stderr: %s", stderr)
 
         return dict(rc=rc, stdout=stdout, stderr=stderr)
 
@@ -497,7 +649,7 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
         try:
             fd = file(data['in_path'], 'rb')
             fstat = os.stat(data['in_path'])
-            vvv("FETCH file is %d bytes" % fstat.st_size)
+            vvv("FETCH file is %d bytes", fstat.st_size)
             while fd.tell() < fstat.st_size:
                 data = fd.read(CHUNK_SIZE)
                 last = False
@@ -573,11 +725,11 @@ class ThreadedTCPRequestHandler(SocketServer.BaseRequestHandler):
             log("failed to put the file: %s" % tb)
             return dict(failed=True, stdout="Could not write the file")
 
-        vvvv("wrote %d bytes" % bytes)
+        vvvv("wrote %d bytes", bytes)
         out_fd.close()
 
         if final_path:
-            vvv("moving %s to %s" % (out_path, final_path))
+            vvv("moving %s to %s", out_path, final_path)
             self.server.module.atomic_move(out_path, final_path)
         return dict()
 
@@ -619,7 +771,7 @@ def daemonize(module, password, port, timeout, minutes, use_ipv6, pid_file):
                 server.allow_reuse_address = True
                 break
             except Exception, e:
-                vv("Failed to create the TCP server (tries left = %d) (error: %s) " % (tries,e))
+                vv("Failed to create the TCP server (tries left = %d) (error: %s) ", tries, e)
             tries -= 1
             time.sleep(0.2)
 
@@ -639,6 +791,12 @@ def daemonize(module, password, port, timeout, minutes, use_ipv6, pid_file):
         # wait for the thread to exit fully
         server_thread.join()
 
+        if module.params.get('stats_file'):
+            try:
+                server.stats.dump(module.params['stats_file'])
+            except Exception, e:
+                log("failed to write the stats file %s: %s" % (module.params['stats_file'], e))
+
         v("server thread terminated, exiting!")
         sys.exit(0)
     except Exception, e:
@@ -656,7 +814,9 @@ def main():
             timeout=dict(required=False, default=300),
             password=dict(required=True),
             minutes=dict(required=False, default=30),
-            debug=dict(required=False, default=0, type='int')
+            debug=dict(required=False, default=0, type='int'),
+            stats_file=dict(required=False, default=None, type='path'),
+            stats_interval=dict(required=False, default=60, type='int'),
         ),
         supports_check_mode=True
     )
@@ -672,6 +832,12 @@ def main():
     if not HAS_KEYCZAR:
         module.fail_json(msg="keyczar is not installed (on the remote side)")
 
+    if module.params['stats_interval'] < 1:
+        module.fail_json(msg="stats_interval must be a positive number of seconds")
+    if module.params['stats_file']:
+        # the daemon changes its working directory to / when detaching
+        module.params['stats_file'] = os.path.abspath(module.params['stats_file'])
+
     DEBUG_LEVEL=debug
     pid_file = get_pid_location(module)
 
@@ -20,11 +20,11 @@
 
 import binascii
 import datetime
-import math
+import errno
 import re
 import select
 import socket
-import sys
+import struct
 import time
 
 HAS_PSUTIL = False
@@ -35,6 +35,18 @@ try:
 except ImportError:
     pass
 
+HAS_INOTIFY = False
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    # raises AttributeError on platforms without inotify
+    _libc.inotify_init
+    _libc.inotify_add_watch
+    HAS_INOTIFY = True
+except (ImportError, OSError, AttributeError):
+    pass
+
 DOCUMENTATION = '''
 ---
 module: wait_for
@@ -100,8 +112,42 @@ options:
     required: false
     description:
       - list of hosts or IPs to ignore when looking for active TCP connections for C(drained) state
+  watch:
+    version_added: "2.1"
+    required: false
+    description:
+      - How to notice changes when waiting on a C(path).
+      - C(inotify) wakes up as soon as the file or its directory changes and only reads data
+        appended to the file since the last check when looking for C(search_regex).
+      - C(poll) checks the path once a second.
+      - C(auto) uses C(inotify) when the target supports it and C(poll) otherwise.
+      - Even with C(inotify) the path is still checked at least once a second, so changes
+        inotify cannot see (for example on network filesystems) are not missed.
+    choices: [ "auto", "inotify", "poll" ]
+    default: "auto"
+  targets:
+    version_added: "2.1"
+    required: false
+    description:
+      - List of targets to wait for concurrently instead of a single C(port) or C(path).
+      - Each target is a dict with either a C(port) (and optionally a C(host), defaulting to the
+        C(host) parameter) or a C(path), and optionally its own C(search_regex).
+      - All of the targets share the same C(timeout), so waiting on many of them takes as long as
+        the slowest one rather than the sum of all of them.
+      - The result contains the elapsed time of each target.
+  mode:
+    version_added: "2.1"
+    required: false
+    description:
+      - How many of the C(targets) have to reach C(state).
+      - C(all) waits for every target, C(any) for the first one and C(quorum:N) for N of them.
+    default: "all"
 notes:
   - The ability to use search_regex with a port connection was added in 1.7.
+  - On Linux, C(drained) counts connections through the sock_diag netlink interface, which
+    lets the kernel filter them by port and state, and falls back to reading /proc/net/tcp.
+  - Ports are checked with non-blocking connections, so the module returns as soon as
+    the port reaches the requested state instead of on the next one second poll.
 requirements: []
 author:
     - "Jeroen Hoekx (@jhoekx)"
@@ -136,6 +182,21 @@ EXAMPLES = '''
 # and don't start checking for 10 seconds
 - local_action: wait_for port=22 host="{{ ansible_ssh_host | default(inventory_hostname) }}" search_regex=OpenSSH delay=10
 
+# wait for a majority of the cluster nodes to listen on port 2379, all at once
+- local_action:
+    module: wait_for
+    mode: "quorum:2"
+    targets:
+      - { host: etcd1, port: 2379 }
+      - { host: etcd2, port: 2379 }
+      - { host: etcd3, port: 2379 }
+
+# wait until both the port is open and the log file says the application is ready
+- wait_for:
+    targets:
+      - { port: 8080 }
+      - { path: /var/log/app/app.log, search_regex: "Server started" }
+
 '''
 
 class TCPConnectionInfo(object):
@@ -204,8 +265,10 @@ class TCPConnectionInfo(object):
 class LinuxTCPConnectionInfo(TCPConnectionInfo):
     """
     This is a TCP Connection Info evaluation strategy class
-    that utilizes information from Linux's procfs. While less universal,
-    does allow Linux targets to not require an additional library.
+    that utilizes information from Linux's sock_diag netlink interface,
+    falling back to procfs on kernels (or containers) without it. While
+    less universal, does allow Linux targets to not require an additional
+    library.
     """
     platform = 'Linux'
     distribution = None
@@ -222,33 +285,124 @@ class LinuxTCPConnectionInfo(TCPConnectionInfo):
     remote_address_field = 2
     connection_state_field = 3
 
+    # see linux/netlink.h, linux/sock_diag.h and linux/inet_diag.h
+    NETLINK_SOCK_DIAG = 4
+    SOCK_DIAG_BY_FAMILY = 20
+    NLM_F_REQUEST = 0x1
+    NLM_F_DUMP = 0x300
+    NLMSG_ERROR = 0x2
+    NLMSG_DONE = 0x3
+    INET_DIAG_REQ_BYTECODE = 1
+    INET_DIAG_BC_S_GE = 2
+    INET_DIAG_BC_S_LE = 3
+    NLMSG_HDR = '=LHHLL'
+    NLMSG_HDR_LEN = struct.calcsize(NLMSG_HDR)
+    # offset of the inet_diag_sockid in struct inet_diag_msg
+    DIAG_MSG_ID_OFFSET = 4
+
     def __init__(self, module):
         self.module = module
         (self.family, self.ip) = _convert_host_to_hex(module.params['host'])
         self.port = "%0.4X" % int(module.params['port'])
         self.exclude_ips = self._get_exclude_ips()
+        self.use_netlink = hasattr(socket, 'AF_NETLINK')
+
+        # the netlink messages carry ports as numbers and addresses in
+        # network byte order instead of the procfs hex strings
+        (family, ip) = _convert_host_to_ip(module.params['host'])
+        self.raw_port = int(module.params['port'])
+        self.raw_ip = socket.inet_pton(family, ip)
+        self.raw_match_all_ip = socket.inet_pton(family, TCPConnectionInfo.match_all_ips[family])
+        self.raw_exclude_ips = []
+        for h in module.params['exclude_hosts'] or []:
+            (family, ip) = _convert_host_to_ip(h)
+            self.raw_exclude_ips.append(socket.inet_pton(family, ip))
 
     def _get_exclude_ips(self):
         if self.module.params['exclude_hosts'] is None:
             return []
         exclude_hosts = self.module.params['exclude_hosts']
-        return [ _convert_host_to_hex(h) for h in exclude_hosts ]
+        return [ _convert_host_to_hex(h)[1] for h in exclude_hosts ]
 
     def get_active_connections_count(self):
+        if self.use_netlink:
+            try:
+                return self._get_netlink_connections_count()
+            except socket.error:
+                # no sock_diag support (old kernel, seccomp, ...), don't try again
+                self.use_netlink = False
+        return self._get_procfs_connections_count()
+
+    def _build_netlink_request(self):
+        states = 0
+        for state in self.connection_states:
+            states |= 1 << int(state, 16)
+
+        # only dump the sockets bound to the local port:
+        # sport >= port && sport <= port, a failed comparison jumps
+        # past the end of the bytecode, which rejects the socket
+        bytecode = struct.pack('=BBHBBHBBHBBH',
+            self.INET_DIAG_BC_S_GE, 8, 20, 0, 0, self.raw_port,
+            self.INET_DIAG_BC_S_LE, 8, 12, 0, 0, self.raw_port)
+        attribute = struct.pack('=HH', 4 + len(bytecode), self.INET_DIAG_REQ_BYTECODE) + bytecode
+
+        # struct inet_diag_req_v2, with an empty inet_diag_sockid
+        request = struct.pack('=BBBBL48x', self.family, socket.IPPROTO_TCP, 0, 0, states) + attribute
+        header = struct.pack(self.NLMSG_HDR, self.NLMSG_HDR_LEN + len(request),
+            self.SOCK_DIAG_BY_FAMILY, self.NLM_F_REQUEST | self.NLM_F_DUMP, 1, 0)
+        return header + request
+
+    def _get_netlink_connections_count(self):
+        active_connections = 0
+        addr_len = len(self.raw_ip)
+        s = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_SOCK_DIAG)
+        try:
+            s.sendto(self._build_netlink_request(), (0, 0))
+            # the kernel streams the matching sockets over several
+            # datagrams, count them as they come in
+            while True:
+                data = s.recv(65536)
+                offset = 0
+                while offset + self.NLMSG_HDR_LEN <= len(data):
+                    (msg_len, msg_type, flags, seq, pid) = struct.unpack_from(self.NLMSG_HDR, data, offset)
+                    if msg_type == self.NLMSG_DONE:
+                        return active_connections
+                    if msg_type == self.NLMSG_ERROR:
+                        err = -struct.unpack_from('=i', data, offset + self.NLMSG_HDR_LEN)[0]
+                        raise socket.error(err, os.strerror(err))
+                    if msg_len < self.NLMSG_HDR_LEN:
+                        raise socket.error(errno.EINVAL, "malformed netlink message")
+
+                    # struct inet_diag_sockid: sport, dport, src[4], dst[4] in network byte order
+                    id_offset = offset + self.NLMSG_HDR_LEN + self.DIAG_MSG_ID_OFFSET
+                    local_ip = data[id_offset + 4:id_offset + 4 + addr_len]
+                    remote_ip = data[id_offset + 20:id_offset + 20 + addr_len]
+                    if self.raw_ip in [self.raw_match_all_ip, local_ip]:
+                        if remote_ip not in self.raw_exclude_ips:
+                            active_connections += 1
+                    # messages are aligned to 4 bytes
+                    offset += (msg_len + 3) & ~3
+        finally:
+            s.close()
+
+    def _get_procfs_connections_count(self):
         active_connections = 0
         f = open(self.source_file[self.family])
-        for tcp_connection in f.readlines():
-            tcp_connection = tcp_connection.strip().split()
-            if tcp_connection[self.local_address_field] == 'local_address':
-                continue
-            if tcp_connection[self.connection_state_field] not in self.connection_states:
-                continue
-            (local_ip, local_port) = tcp_connection[self.local_address_field].split(':')
-            if self.port == local_port and self.ip in [self.match_all_ips[self.family], local_ip]:
-                 (remote_ip, remote_port) = tcp_connection[self.remote_address_field].split(':')
-                 if remote_ip not in self.exclude_ips:
-                     active_connections += 1
-        f.close()
+        try:
+            # iterate instead of readlines(), the file can be huge
+            for tcp_connection in f:
+                tcp_connection = tcp_connection.split()
+                if tcp_connection[self.local_address_field] == 'local_address':
+                    continue
+                if tcp_connection[self.connection_state_field] not in self.connection_states:
+                    continue
+                (local_ip, local_port) = tcp_connection[self.local_address_field].split(':')
+                if self.port == local_port and self.ip in [self.match_all_ips[self.family], local_ip]:
+                     (remote_ip, remote_port) = tcp_connection[self.remote_address_field].split(':')
+                     if remote_ip not in self.exclude_ips:
+                         active_connections += 1
+        finally:
+            f.close()
         return active_connections
 
 
@@ -303,29 +457,464 @@ def _little_endian_convert_32bit(block):
     # which lets us start at the end of the string block and work to the begining
     return "".join([ block[x:x+2] for x in xrange(6, -2, -2) ])
 
-def _create_connection( (host, port), connect_timeout):
+def _timedelta_total_seconds(timedelta):
+    return (
+        timedelta.microseconds + 0.0 +
+        (timedelta.seconds + timedelta.days * 24 * 3600) * 10 ** 6) / 10 ** 6
+
+def _seconds_until(end):
+    return max(0, _timedelta_total_seconds(end - datetime.datetime.now()))
+
+def _get_path_watcher(module, path):
+    watch = module.params['watch']
+    if watch == 'poll' or not HAS_INOTIFY:
+        return PathWatcher(path, False)
+    try:
+        return PathWatcher(path, True)
+    except OSError, e:
+        # e.g. fs.inotify.max_user_instances reached
+        if watch == 'inotify':
+            module.fail_json(msg="Failed to set up inotify: %s" % e.strerror)
+        return PathWatcher(path, False)
+
+# how often a path is re-checked when nothing wakes us up earlier
+POLL_INTERVAL = 1
+
+# closed ports are retried quickly at first, backing off to POLL_INTERVAL
+PROBE_RETRY_MIN = 0.1
+
+# how much of the already searched data is kept around when tailing a file,
+# so a search_regex spanning several reads still matches
+SEARCH_CARRY = 64 * 1024
+READ_SIZE = 64 * 1024
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+class PathWatcher(object):
+    """
+    Watches a path with inotify. The path itself and the nearest existing
+    directory above it are watched, so the file descriptor becomes
+    readable as soon as the file is created, removed, rotated or appended
+    to. Without inotify, fd is None and the path is simply polled.
+    """
+
+    def __init__(self, path, use_inotify):
+        self.path = os.path.abspath(path)
+        self.fd = None
+        if use_inotify:
+            fd = _libc.inotify_init()
+            if fd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            self.fd = fd
+
+    def arm(self):
+        """
+        (Re)add the watches, the file or its directories may have been
+        created or replaced since the last call. This must happen before
+        the caller checks its condition so no change is missed.
+        """
+        if self.fd is None:
+            return
+        self._add_watch(self.path, IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF)
+        parent = os.path.dirname(self.path)
+        while not os.path.isdir(parent) and parent != os.path.dirname(parent):
+            parent = os.path.dirname(parent)
+        self._add_watch(parent, IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB)
+
+    def _add_watch(self, path, mask):
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        # failing to watch a path which does not exist (yet) is expected,
+        # the directory watch notices when it shows up
+        _libc.inotify_add_watch(self.fd, path, mask)
+
+    def drain(self):
+        # the events themselves don't matter, the caller re-checks the
+        # path, so just discard them
+        try:
+            os.read(self.fd, 65536)
+        except OSError:
+            pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class FileSearch(object):
+    """
+    Searches a (growing) file for a regex, only reading the data appended
+    since the previous call. The file is searched from the start again
+    when it is replaced or truncated.
+    """
+
+    def __init__(self, path, compiled_search_re):
+        self.path = path
+        self.compiled_search_re = compiled_search_re
+        self.file_id = None
+        self.offset = 0
+        self.data = ''
+
+    def search(self):
+        try:
+            f = open(self.path, 'rb')
+            try:
+                st = os.fstat(f.fileno())
+                if (st.st_dev, st.st_ino) != self.file_id or st.st_size < self.offset:
+                    self.file_id = (st.st_dev, st.st_ino)
+                    self.offset = 0
+                    self.data = ''
+                f.seek(self.offset)
+                while True:
+                    chunk = f.read(READ_SIZE)
+                    if not chunk:
+                        return False
+                    self.offset += len(chunk)
+                    self.data += chunk
+                    if self.compiled_search_re.search(self.data):
+                        return True
+                    self.data = _search_carry(self.data)
+            finally:
+                f.close()
+        except IOError:
+            return False
+
+def _search_carry(data):
     """
-    Connect to a 2-tuple (host, port) and return
-    the socket object.
+    Trim already searched data down to the whole lines covering at least
+    the last SEARCH_CARRY bytes, so that anchors like ^ keep their meaning
+    when the next read is appended. Without such a line break, as in
+    binary or single line files, only the last SEARCH_CARRY bytes are kept,
+    and a very long last line is cut down to 2 * SEARCH_CARRY bytes.
+    """
+    if len(data) <= SEARCH_CARRY:
+        return data
+    cut = data.rfind('\n', 0, len(data) - SEARCH_CARRY)
+    if cut == -1:
+        return data[-SEARCH_CARRY:]
+    if len(data) - cut - 1 > 2 * SEARCH_CARRY:
+        return data[-2 * SEARCH_CARRY:]
+    return data[cut + 1:]
+
+class PathProbe(object):
+    """
+    Check of a path, optionally searching it for a regex. Like PortProbe,
+    it is driven by _run_probes(), which wakes it up on inotify events
+    for the path or at least every POLL_INTERVAL seconds.
+
+    When want_present is set, the probe is done once the path exists
+    (and search_regex matched its content, if given), otherwise once the
+    path can no longer be opened.
+    """
+
+    def __init__(self, path, watcher, want_present=True, compiled_search_re=None):
+        self.path = path
+        self.watcher = watcher
+        self.want_present = want_present
+        self.file_search = None
+        if compiled_search_re:
+            self.file_search = FileSearch(path, compiled_search_re)
+        self.next_check = 0
+        self.done = False
+        self.finished = None
+
+    def fileno(self):
+        return self.watcher.fd
+
+    def wants_read(self):
+        return self.watcher.fd is not None
+
+    def wants_write(self):
+        return False
+
+    def next_wakeup(self):
+        return self.next_check
+
+    def step(self, now, end):
+        if now >= self.next_check:
+            self._check(now)
+
+    def on_readable(self, now):
+        self.watcher.drain()
+        self._check(now)
+
+    def _check(self, now):
+        self.watcher.arm()
+        if self._condition_met():
+            self.done = True
+            self.finished = now
+            self.close()
+        else:
+            self.next_check = now + POLL_INTERVAL
+
+    def _condition_met(self):
+        if not self.want_present:
+            try:
+                f = open(self.path)
+                f.close()
+            except IOError:
+                return True
+            return False
+
+        try:
+            os.stat(self.path)
+        except OSError, e:
+            # If anything except file not present, let the caller fail
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        # File exists.  Are there additional things to check?
+        if self.file_search is None:
+            return True
+        return self.file_search.search()
+
+    def close(self):
+        self.watcher.close()
+
+class PortProbe(object):
+    """
+    Non-blocking check of a TCP port. A probe never blocks, it is driven
+    by _run_probes() which multiplexes the connects and reads of all of
+    its probes with select().
+
+    When want_open is set, the probe is done once a connection succeeds
+    (and search_regex matched the data read from it, if given), otherwise
+    once a connection fails.
+    """
+
+    def __init__(self, host, port, connect_timeout, want_open=True, compiled_search_re=None):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.want_open = want_open
+        self.compiled_search_re = compiled_search_re
+        self.sock = None
+        self.connecting = False
+        self.deadline = None
+        self.next_attempt = 0
+        self.retry_delay = PROBE_RETRY_MIN
+        self.data = ''
+        self.done = False
+        self.finished = None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def wants_read(self):
+        return self.sock is not None and not self.connecting
+
+    def wants_write(self):
+        return self.sock is not None and self.connecting
+
+    def next_wakeup(self):
+        if self.sock is None:
+            return self.next_attempt
+        return self.deadline
+
+    def step(self, now, end):
+        if self.sock is None:
+            if now >= self.next_attempt:
+                self._connect(now, end)
+        elif self.deadline is not None and now >= self.deadline:
+            # connect_timeout expired
+            self._failed(now)
+
+    def _connect(self, now, end):
+        try:
+            (family, socktype, proto, canonname, sockaddr) = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+            self.sock = socket.socket(family, socket.SOCK_STREAM)
+        except socket.error:
+            self._failed(now)
+            return
+        self.sock.setblocking(0)
+        err = self.sock.connect_ex(sockaddr)
+        if err == 0:
+            self._connected(now)
+        elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self.connecting = True
+            self.deadline = min(now + self.connect_timeout, end)
+        else:
+            self._failed(now)
+
+    def on_writable(self, now):
+        if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self._failed(now)
+        else:
+            self._connected(now)
+
+    def on_readable(self, now):
+        try:
+            response = self.sock.recv(1024)
+        except socket.error:
+            response = ''
+        if not response:
+            # Server shutdown
+            self._retry(now)
+            return
+        self.data += response
+        if self.compiled_search_re.search(self.data):
+            self._finish(now)
+
+    def _connected(self, now):
+        self.connecting = False
+        self.deadline = None
+        if not self.want_open:
+            # still listening, try again later
+            self._retry(now)
+        elif not self.compiled_search_re:
+            self._finish(now)
+        # otherwise wait for data to search
+
+    def _failed(self, now):
+        if self.want_open:
+            self._retry(now)
+        else:
+            self._finish(now)
+
+    def _retry(self, now):
+        self.close()
+        self.data = ''
+        self.next_attempt = now + self.retry_delay
+        self.retry_delay = min(self.retry_delay * 2, POLL_INTERVAL)
+
+    def _finish(self, now):
+        self.close()
+        self.done = True
+        self.finished = now
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
+            self.sock = None
+        self.connecting = False
+        self.deadline = None
+
+def _run_probes(probes, end, needed=None):
+    """
+    Drive probes until enough of them are done or the timestamp end is
+    reached, sleeping in a single select() between events. Probes which
+    are still pending when this returns are closed.
 
     Args:
-        2-tuple (host, port) and connection timeout
+        probes: list of PortProbe and PathProbe objects
+        end: timestamp (as returned by time.time()) to give up at
+        needed: number of probes that must be done, defaults to all
+
     Returns:
-        Socket object
+        True when at least needed probes are done
     """
-    if sys.version_info < (2, 6):
-        (family, _) = _convert_host_to_ip(host)
-        connect_socket = socket.socket(family, socket.SOCK_STREAM)
-        connect_socket.settimeout(connect_timeout)
-        connect_socket.connect( (host, port) )
-    else:
-        connect_socket = socket.create_connection( (host, port), connect_timeout)
-    return connect_socket
+    if needed is None:
+        needed = len(probes)
+    try:
+        while True:
+            now = time.time()
+            for probe in probes:
+                if not probe.done:
+                    probe.step(now, end)
+            pending = [ p for p in probes if not p.done ]
+            if len(probes) - len(pending) >= needed:
+                return True
+            if now >= end:
+                return False
 
-def _timedelta_total_seconds(timedelta):
-    return (
-        timedelta.microseconds + 0.0 +
-        (timedelta.seconds + timedelta.days * 24 * 3600) * 10 ** 6) / 10 ** 6
+            wakeup = end
+            for probe in pending:
+                probe_wakeup = probe.next_wakeup()
+                if probe_wakeup is not None:
+                    wakeup = min(wakeup, probe_wakeup)
+            readable = [ p for p in pending if p.wants_read() ]
+            writable = [ p for p in pending if p.wants_write() ]
+            try:
+                (readable, writable, e) = select.select(readable, writable, [], max(0, wakeup - time.time()))
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+
+            now = time.time()
+            for probe in writable:
+                probe.on_writable(now)
+            for probe in readable:
+                probe.on_readable(now)
+    finally:
+        for probe in probes:
+            if not probe.done:
+                probe.close()
+
+def _parse_needed(module, mode, count):
+    """
+    Convert mode (all, any or quorum:N) to the number of targets
+    which have to reach the requested state
+    """
+    if mode == 'all':
+        return count
+    if mode == 'any':
+        return 1
+    if mode.startswith('quorum:'):
+        try:
+            needed = int(mode[len('quorum:'):])
+        except ValueError:
+            needed = 0
+        if 0 < needed <= count:
+            return needed
+        module.fail_json(msg="mode=%s must use a quorum between 1 and the number of targets (%d)" % (mode, count))
+    module.fail_json(msg="mode must be one of all, any or quorum:N, got %s" % mode)
+
+def _get_probes(module, targets, want, compiled_search_re):
+    """
+    Create a probe for each target, a dict with either a port (and
+    optionally a host) or a path, and optionally its own search_regex
+    """
+    probes = []
+    for target in targets:
+        if not isinstance(target, dict):
+            module.fail_json(msg="each of the targets must be a dict with either a port or a path, got %s" % target)
+        unknown = set(target.keys()) - set(['host', 'port', 'path', 'search_regex'])
+        if unknown:
+            module.fail_json(msg="unsupported keys in target %s: %s" % (target, ', '.join(sorted(unknown))))
+        if bool(target.get('port')) == bool(target.get('path')):
+            module.fail_json(msg="each of the targets must have either a port or a path, got %s" % target)
+
+        target_re = compiled_search_re
+        if target.get('search_regex') is not None:
+            target_re = re.compile(target['search_regex'], re.MULTILINE)
+
+        if target.get('path'):
+            if module.params['state'] == 'stopped':
+                module.fail_json(msg="state=stopped should only be used for checking a port in the wait_for module")
+            path = os.path.expanduser(target['path'])
+            probes.append(PathProbe(path, _get_path_watcher(module, path), want, target_re))
+        else:
+            try:
+                port = int(target['port'])
+            except ValueError:
+                module.fail_json(msg="invalid port in target %s" % target)
+            host = target.get('host') or module.params['host']
+            probes.append(PortProbe(host, port, module.params['connect_timeout'], want, target_re))
+    return probes
+
+def _probe_result(probe, start):
+    if isinstance(probe, PathProbe):
+        result = dict(path=probe.path)
+    else:
+        result = dict(host=probe.host, port=probe.port)
+    result['done'] = probe.done
+    if probe.done:
+        result['elapsed'] = round(probe.finished - start, 3)
+    return result
 
 def main():
 
@@ -339,7 +928,10 @@ def main():
             path=dict(default=None, type='path'),
             search_regex=dict(default=None),
             state=dict(default='started', choices=['started', 'stopped', 'present', 'absent', 'drained']),
-            exclude_hosts=dict(default=None, type='list')
+            exclude_hosts=dict(default=None, type='list'),
+            watch=dict(default='auto', choices=['auto', 'inotify', 'poll']),
+            targets=dict(default=None, type='list'),
+            mode=dict(default='all'),
         ),
     )
 
@@ -353,6 +945,7 @@ def main():
     state = params['state']
     path = params['path']
     search_regex = params['search_regex']
+    targets = params['targets']
     if search_regex is not None:
         compiled_search_re = re.compile(search_regex, re.MULTILINE)
     else:
@@ -360,131 +953,70 @@ def main():
 
     if port and path:
         module.fail_json(msg="port and path parameter can not both be passed to wait_for")
+    if targets and (port or path):
+        module.fail_json(msg="targets can not be combined with the port or path parameters")
+    if targets is not None and not targets:
+        module.fail_json(msg="targets must not be empty")
+    if targets and state == 'drained':
+        module.fail_json(msg="state=drained can not be used with targets")
+    if not targets and params['mode'] != 'all':
+        module.fail_json(msg="mode should only be used with targets")
     if path and state == 'stopped':
         module.fail_json(msg="state=stopped should only be used for checking a port in the wait_for module")
     if path and state == 'drained':
         module.fail_json(msg="state=drained should only be used for checking a port in the wait_for module")
     if params['exclude_hosts'] is not None and state != 'drained':
         module.fail_json(msg="exclude_hosts should only be with state=drained")
+    if params['watch'] == 'inotify' and not HAS_INOTIFY:
+        module.fail_json(msg="watch=inotify is not supported on this system")
 
+    want = state in ['started', 'present']
+    probes = []
+    if targets:
+        needed = _parse_needed(module, params['mode'], len(targets))
+        probes = _get_probes(module, targets, want, compiled_search_re)
+    elif path:
+        probes = [ PathProbe(path, _get_path_watcher(module, path), want, compiled_search_re) ]
+    elif port and state != 'drained':
+        probes = [ PortProbe(host, port, connect_timeout, want, compiled_search_re) ]
 
     start = datetime.datetime.now()
+    start_ts = time.time()
 
     if delay:
         time.sleep(delay)
 
-    if not port and not path and state != 'drained':
+    if not probes and state != 'drained':
         time.sleep(timeout)
-    elif state in [ 'stopped', 'absent' ]:
-        ### first wait for the stop condition
+    elif probes:
+        ### wait for the start or stop condition of every target at once
         end = start + datetime.timedelta(seconds=timeout)
-
-        while datetime.datetime.now() < end:
-            if path:
-                try:
-                    f = open(path)
-                    f.close()
-                    time.sleep(1)
-                    pass
-                except IOError:
-                    break
-            elif port:
-                try:
-                    s = _create_connection( (host, port), connect_timeout)
-                    s.shutdown(socket.SHUT_RDWR)
-                    s.close()
-                    time.sleep(1)
-                except:
-                    break
+        try:
+            if targets:
+                ok = _run_probes(probes, time.time() + _seconds_until(end), needed)
             else:
-                time.sleep(1)
-        else:
+                ok = _run_probes(probes, time.time() + _seconds_until(end))
+        except OSError, e:
             elapsed = datetime.datetime.now() - start
-            if port:
-                module.fail_json(msg="Timeout when waiting for %s:%s to stop." % (host, port), elapsed=elapsed.seconds)
-            elif path:
-                module.fail_json(msg="Timeout when waiting for %s to be absent." % (path), elapsed=elapsed.seconds)
-
-    elif state in ['started', 'present']:
-        ### wait for start condition
-        end = start + datetime.timedelta(seconds=timeout)
-        while datetime.datetime.now() < end:
-            if path:
-                try:
-                    os.stat(path)
-                except OSError, e:
-                    # If anything except file not present, throw an error
-                    if e.errno != 2:
-                        elapsed = datetime.datetime.now() - start
-                        module.fail_json(msg="Failed to stat %s, %s" % (path, e.strerror), elapsed=elapsed.seconds)
-                    # file doesn't exist yet, so continue
-                else:
-                    # File exists.  Are there additional things to check?
-                    if not compiled_search_re:
-                        # nope, succeed!
-                        break
-                    try:
-                        f = open(path)
-                        try:
-                            if re.search(compiled_search_re, f.read()):
-                                # String found, success!
-                                break
-                        finally:
-                            f.close()
-                    except IOError:
-                        pass
-            elif port:
-                alt_connect_timeout = math.ceil(_timedelta_total_seconds(end - datetime.datetime.now()))
-                try:
-                    s = _create_connection((host, port), min(connect_timeout, alt_connect_timeout))
-                except:
-                    # Failed to connect by connect_timeout. wait and try again
-                    pass
-                else:
-                    # Connected -- are there additional conditions?
-                    if compiled_search_re:
-                        data = ''
-                        matched = False
-                        while datetime.datetime.now() < end:
-                            max_timeout = math.ceil(_timedelta_total_seconds(end - datetime.datetime.now()))
-                            (readable, w, e) = select.select([s], [], [], max_timeout)
-                            if not readable:
-                                # No new data.  Probably means our timeout
-                                # expired
-                                continue
-                            response = s.recv(1024)
-                            if not response:
-                                # Server shutdown
-                                break
-                            data += response
-                            if re.search(compiled_search_re, data):
-                                matched = True
-                                break
-
-                        # Shutdown the client socket
-                        s.shutdown(socket.SHUT_RDWR)
-                        s.close()
-                        if matched:
-                            # Found our string, success!
-                            break
-                    else:
-                        # Connection established, success!
-                        s.shutdown(socket.SHUT_RDWR)
-                        s.close()
-                        break
-
-            # Conditions not yet met, wait and try again
-            time.sleep(1)
+            module.fail_json(msg="Failed to stat %s, %s" % (e.filename, e.strerror), elapsed=elapsed.seconds)
 
-        else:   # while-else
+        if not ok:
             # Timeout expired
             elapsed = datetime.datetime.now() - start
-            if port:
+            if targets:
+                module.fail_json(msg="Timeout when waiting for %d of %d targets to be %s" % (needed, len(targets), state),
+                                 targets=[ _probe_result(p, start_ts) for p in probes ], elapsed=elapsed.seconds)
+            elif not want:
+                if port:
+                    module.fail_json(msg="Timeout when waiting for %s:%s to stop." % (host, port), elapsed=elapsed.seconds)
+                else:
+                    module.fail_json(msg="Timeout when waiting for %s to be absent." % (path), elapsed=elapsed.seconds)
+            elif port:
                 if search_regex:
                     module.fail_json(msg="Timeout when waiting for search string %s in %s:%s" % (search_regex, host, port), elapsed=elapsed.seconds)
                 else:
                     module.fail_json(msg="Timeout when waiting for %s:%s" % (host, port), elapsed=elapsed.seconds)
-            elif path:
+            else:
                 if search_regex:
                     module.fail_json(msg="Timeout when waiting for search string %s in %s" % (search_regex, path), elapsed=elapsed.seconds)
                 else:
@@ -506,6 +1038,9 @@ def main():
             module.fail_json(msg="Timeout when waiting for %s:%s to drain" % (host, port), elapsed=elapsed.seconds)
 
     elapsed = datetime.datetime.now() - start
+    if targets:
+        module.exit_json(state=state, mode=params['mode'], search_regex=search_regex,
+                         targets=[ _probe_result(p, start_ts) for p in probes ], elapsed=elapsed.seconds)
     module.exit_json(state=state, port=port, search_regex=search_regex, path=path, elapsed=elapsed.seconds)
 
 # import module snippets